@@ -0,0 +1,203 @@
+from contextlib import contextmanager
+from threading import Condition
+import time
+
+""" db_pool.py
+
+    Process-wide pool of reusable DB connections. Connections
+    are health checked when they are checked out and replaced
+    transparently if the check fails, so callers don't pay a
+    connection handshake and login on every request and bursty
+    load can't open more sessions than the pool size.
+
+    """
+
+
+class PoolTimeout(Exception):
+    """ Custom exception
+
+    No pooled connection became available in time
+
+    """
+    pass
+
+
+class PoolClosed(Exception):
+    """ Custom exception
+
+    Connection was requested from a closed pool
+
+    """
+    pass
+
+
+class ConnectionPool(object):
+    """ Bounded pool of DB API 2.0 connections with health checks on checkout """
+
+    def __init__(self, connect, size=4, health_check_query="SELECT 1", timeout=30):
+        """ Init method
+
+        :param connect: function with no arguments opening a new DB API 2.0 connection
+        :param size: int maximum amount of open connections. Defaults to 4.
+        :param health_check_query: string query run on a connection
+               before it's handed out (None - no checks). Defaults to "SELECT 1".
+        :param timeout: float amount of seconds to wait for a free
+               connection before PoolTimeout is raised. Defaults to 30.
+
+        """
+
+        self.connect = connect
+        self.size = size
+        self.health_check_query = health_check_query
+        self.timeout = timeout
+        self.__idle = []  # connections ready to be checked out (the most recently used are the last)
+        self.__opened = 0  # idle and checked out connections
+        self.__closed = False
+        self.__cond = Condition()
+
+    @property
+    def idle_count(self):
+        """ Amount of open connections that are not checked out """
+
+        with self.__cond:
+            return len(self.__idle)
+
+    @property
+    def opened_count(self):
+        """ Amount of open connections (both idle and checked out) """
+
+        with self.__cond:
+            return self.__opened
+
+    def acquire(self):
+        """ Check out a healthy connection opening a new one if needed
+
+        :return: DB API 2.0 connection
+
+        :raises PoolTimeout, PoolClosed, any exception of a connect function
+
+        """
+
+        deadline = time.monotonic() + self.timeout
+        with self.__cond:
+            while not self.__idle and self.__opened >= self.size:
+                if self.__closed:
+                    raise PoolClosed
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self.__cond.wait(remaining):
+                    if not self.__idle and self.__opened >= self.size:
+                        raise PoolTimeout
+            if self.__closed:
+                raise PoolClosed
+            conn = self.__idle.pop() if self.__idle else None
+            if conn is None:
+                self.__opened += 1  # reserve a slot for a new connection
+
+        # checks and connects happen outside of a lock
+        if conn is not None and not self.is_healthy(conn):
+            self.__close_quietly(conn)
+            conn = None
+        if conn is None:
+            try:
+                conn = self.connect()
+            except BaseException:
+                self.__discard()
+                raise
+        return conn
+
+    def release(self, conn, broken=False):
+        """ Return a checked out connection into a pool
+
+        :param conn: connection from acquire()
+        :param broken: bool close the connection instead of reusing it.
+               Defaults to False.
+
+        """
+
+        if broken or self.__closed:
+            self.__close_quietly(conn)
+            self.__discard()
+            return
+        with self.__cond:
+            self.__idle.append(conn)
+            self.__cond.notify()
+
+    @contextmanager
+    def connection(self):
+        """ Context manager: borrow a connection and return it afterwards
+
+        If a block fails, a transaction is rolled back and the
+        connection is dropped if even a rollback fails.
+
+        """
+
+        conn = self.acquire()
+        try:
+            yield conn
+        except BaseException:
+            try:
+                conn.rollback()
+            except Exception:
+                self.release(conn, broken=True)
+            else:
+                self.release(conn)
+            raise
+        else:
+            self.release(conn)
+
+    def is_healthy(self, conn):
+        """ Check whether a connection is still usable
+
+        :param conn: DB API 2.0 connection
+
+        :return: True - health check query succeeded (or checks are off). False - otherwise.
+
+        """
+
+        if self.health_check_query is None:
+            return True
+        try:
+            cursor = conn.cursor()
+            try:
+                cursor.execute(self.health_check_query)
+                cursor.fetchall()
+            finally:
+                cursor.close()
+        except Exception:
+            return False
+        return True
+
+    def close(self):
+        """ Close idle connections and stop handing out new ones
+
+        Connections that are checked out are closed when released.
+
+        """
+
+        with self.__cond:
+            self.__closed = True
+            idle, self.__idle = self.__idle, []
+            self.__opened -= len(idle)
+            self.__cond.notify_all()
+        for conn in idle:
+            self.__close_quietly(conn)
+
+    def __discard(self):
+        """ Free a slot of a connection that was closed or never opened """
+
+        with self.__cond:
+            self.__opened -= 1
+            self.__cond.notify()
+
+    @staticmethod
+    def __close_quietly(conn):
+        """ Close a connection ignoring errors (e.g. it's already dead)
+
+        :param conn: DB API 2.0 connection
+
+        """
+
+        try:
+            conn.close()
+        except Exception:
+            pass
@@ -1,10 +1,19 @@
 from app.dstruct.facility import *
 from app.dstruct.department import *
+from app.dstruct.aisle_network import AisleNetwork
 from app.parse.mp_parser import *
+from app.core.transport_cube import TransportCube
+from app.core.mp_query import MPQueryBuilder
+from app.core.db_pool import ConnectionPool
+from app.core.facility_snapshot import FacilitySnapshot, IncompatibleSnapshot
+from app.core.fingerprint import SourceFingerprinter
+from contextlib import closing
 from datetime import datetime
-import _pickle as pkl
+import inspect
 import json
 import os
+import tempfile
+import threading
 
 
 class DBInaccessibleError(Exception):
@@ -29,8 +38,19 @@ class FacilityHandler(object):
 
     """
 
+    DATE_FORMAT = "%Y-%m-%d %X"
+    DEP_COLUMNS = ("src_dep", "dst_dep")  # filter columns a department filter is pushed down on
+
+    transport_cube = None  # process-wide TransportCube shared by all the handlers
+    high_water_marks = {}  # main item -> high-water mark of the extract loaded into transport_cube
+    extract_fingerprints = {}  # main item -> "db" fingerprint the extract in transport_cube was loaded at
+    build_lock = threading.RLock()  # serializes facility builds of a process
+    cube_lock = threading.RLock()  # guards transport_cube, high_water_marks and extract_fingerprints
+    db_pool = None  # process-wide ConnectionPool shared by all the handlers (if "db_pool_size" is configured)
+    pool_lock = threading.Lock()  # guards db_pool creation
+
     def __init__(self, path_to_conf_file, facility_instance=None, force_rebuild=False, date_boundaries=None,
-                 mi_filter=None, dep_filter=None):
+                 mi_filter=None, dep_filter=None, incremental=False, fingerprint=None):
         """ Initialize facility
 
         It checks whether cached version of facility object exists
@@ -39,40 +59,109 @@ class FacilityHandler(object):
         /app/data/, creates a facility object and dumps it locally under
         /app/data directory.
 
+        A cached facility is reused only if it was built with the same
+        filters out of the same sources: layout file, configuration and
+        masterplan DB fingerprints (see SourceFingerprinter) are saved
+        with it. If DB fingerprint can't be determined ("mp_fingerprint_query"
+        isn't configured), a DB is assumed to be unchanged unless
+        incremental update is requested. Only unfiltered facilities are
+        dumped, filtered ones are built out of a transport cube instead
+        (see insert_all_transp_records()).
+
+        Builds of a process run one at a time (see build_lock) as handlers
+        share the transport cube, the DB pool and dump files.
+
         :param path_to_conf_file - string path to a configuration JSON file
-               that holds a path where to dump an object pickle
+               that holds a path where to dump a facility snapshot
         :param facility_instance - Facility class instance to initialize with
         :param date_boundaries - (<start>, <end>) list of string dates to filter on.
                Datetime format: "%Y-%m-%d %X" e.g. 2015-05-25 18:00:00
         :param mi_filter: string main item to filter on
         :param dep_filter: string department label to filter on
+        :param incremental: bool fold only transportation records newer than
+               the cached facility high-water mark into the cached facility
+               instead of a full rebuild (unfiltered facility only).
+               Defaults to False.
+        :param fingerprint: sources fingerprint from get_fingerprint() if
+               it's already known (it's calculated otherwise). Defaults to None.
 
         """
 
         self.facility = facility_instance
         self.add_info = None  # distances and other extra info from factory_layout.json (list)
+        self.self_edges_weight = 0
+        self.date_from = None
+        self.date_to = None
+        self.high_water_mark = None  # [<str_newest_record_date>, <list_of_str_record_keys_at_that_date>]
+        self.updated = False  # whether facility was built or changed rather than restored as is
 
         # load configuration
         with open(path_to_conf_file) as f:
             self.conf = json.load(f)
-
-        if not self.facility:
-            if not date_boundaries and not force_rebuild and os.path.isfile(self.conf["facility_dump_path"]):
-                with open(self.conf["facility_dump_path"], 'rb') as f:
-                    self.facility = pkl.load(f)
+        self.fingerprint = fingerprint if fingerprint is not None else self.get_fingerprint(self.conf)
+
+        with FacilityHandler.build_lock:
+            if force_rebuild:
+                self.reset_transport_cube()  # re-fetch everything from a DB
+
+            filters = [date_boundaries, mi_filter, dep_filter]
+            unfiltered = not (date_boundaries or mi_filter or dep_filter)
+            state = self.load_state() if not self.facility else None
+            if state is not None and not self.is_state_reusable(state, filters):
+                state = None  # cached facility is a filtered one or it's sources have changed
+
+            if not self.facility:
+                if not force_rebuild and state is not None:
+                    self.facility = self.load_facility(self.conf["facility_dump_path"])
+
+                if self.facility:
+                    self.restore_state(state)
+                    self.load_add_info(self.conf["facility_source_path"])
+                    cached_db, current_db = state["fingerprint"]["db"], self.fingerprint["db"]
+                    if incremental and unfiltered and (current_db is None or cached_db != current_db):
+                        if current_db is None or SourceFingerprinter.is_db_appended(cached_db, current_db):
+                            self.updated = self.insert_new_transp_records()
+                            if self.updated:
+                                self.dump_facility(self.conf["facility_dump_path"])
+                            self.dump_state(filters)
+                        else:
+                            self.facility = None  # records were changed or removed
+                    elif current_db is not None and cached_db != current_db:
+                        self.facility = None
+
+                if not self.facility:
+                    self.facility = Facility(self.conf["facility_boundaries"][0], self.conf["facility_boundaries"][1])
+                    self.populate_facility(self.conf["facility_source_path"])
+                    # try:
+                    res = self.insert_all_transp_records(date_boundaries, mi_filter, dep_filter)
+                    # except:
+                    #      raise DBInaccessibleError
+                    self.self_edges_weight = res[0]
+                    self.date_from = res[1]
+                    self.date_to = res[2]
+                    self.high_water_mark = FacilityHandler.high_water_marks.get(None) if unfiltered else None
+                    self.updated = True
+                    if unfiltered:  # a filtered facility is answered from the transport cube instead
+                        self.dump_facility(self.conf["facility_dump_path"])
+                        self.dump_state(filters)
             else:
-                self.facility = Facility(self.conf["facility_boundaries"][0], self.conf["facility_boundaries"][1])
-                self.populate_facility(self.conf["facility_source_path"])
-                # try:
-                res = self.insert_all_transp_records(date_boundaries, mi_filter, dep_filter)
-                # except:
-                #      raise DBInaccessibleError
-                self.self_edges_weight = res[0]
-                self.date_from = res[1]
-                self.date_to = res[2]
                 self.dump_facility(self.conf["facility_dump_path"])
-        else:
-            self.dump_facility(self.conf["facility_dump_path"])
+
+    def is_state_reusable(self, state, filters):
+        """ Check whether a cached facility matches requested filters and current sources
+
+        :param state: dictionary from load_state()
+        :param filters: list [<date_boundaries>, <mi_filter>, <dep_filter>]
+
+        :return: True - cached facility was built with the same filters out of the
+                 same layout file and configuration (DB changes are checked
+                 separately). False - otherwise.
+
+        """
+
+        cached = state.get("fingerprint") or {}
+        return state.get("filters") == [value if value else None for value in filters] and \
+            cached.get("layout") == self.fingerprint["layout"] and cached.get("config") == self.fingerprint["config"]
 
     def populate_facility(self, path_to_source):
         """ Parses source file and populates facility class instance
@@ -85,6 +174,7 @@ class FacilityHandler(object):
         with open(path_to_source) as f:
             src = json.load(f)
             self.add_info = src["distances"]  # it's a list
+        self.facility.set_distances(self.add_info)
 
         # create graph nodes (initialize departments)
         for dep_src in src["departments"]:
@@ -93,10 +183,42 @@ class FacilityHandler(object):
                 p_vect.append(Point2D(point[0], point[1]))
             dep = Department(dep_src["label"], *p_vect)
             self.facility.add_department(dep)
+        self.load_aisle_network(src)
+
+    def load_add_info(self, path_to_source):
+        """ Load distances and other extra info from a source file without populating facility
+
+        :param path_to_source - str path to a source JSON file
+
+        """
+
+        with open(path_to_source) as f:
+            src = json.load(f)
+            self.add_info = src["distances"]
+        self.facility.set_distances(self.add_info)
+        self.load_aisle_network(src)
+
+    def load_aisle_network(self, src):
+        """ Route facility distances along aisles if a source file describes them
+
+        :param src - dictionary of a parsed source JSON file with optional
+               "aisles" list of {"points": [[x, y], ...]} polylines
+
+        """
+
+        if src.get("aisles"):
+            self.facility.set_aisle_network(AisleNetwork([aisle["points"] for aisle in src["aisles"]]))
 
     def insert_all_transp_records(self, date_boundaries=None, mi_filter=None, dep_filter=None):
         """ Insert all transportation records from parser into facility instance
 
+        Records are answered from a pre-aggregated transport cube (see
+        get_transport_cube()), so only the first request for a main item
+        hits a DB. If the main item extract isn't loaded yet and filter
+        columns are configured ("mp_filter_columns"), date and department
+        filters are pushed down into a DB query instead (filters without
+        a configured column are applied to the fetched records only).
+
         :param date_boundaries - (<start>, <end>) list of string dates to filter on.
                Datetime format: "%Y-%m-%d %X" e.g. 2015-05-25 18:00:00
         :param mi_filter: string main item to filter on
@@ -106,62 +228,464 @@ class FacilityHandler(object):
 
         """
 
-        print(self.conf['mi_mp_query'] % mi_filter)
+        date_format = self.DATE_FORMAT
+        date_from = datetime.strptime(date_boundaries[0], date_format) if date_boundaries else None
+        date_to = datetime.strptime(date_boundaries[1], date_format) if date_boundaries else None
+
+        builder = self.get_query_builder(mi_filter)
+        pushdown = builder and (date_boundaries and builder.has_columns("date") or
+                                dep_filter and builder.has_columns(*self.DEP_COLUMNS))
+        if pushdown and not self.is_extract_loaded(mi_filter):
+            # aggregate a filtered extract only (it's not kept in a process-wide cube)
+            cube = TransportCube(self.get_dep_labels())
+            self.load_transport_cube(cube, mi_filter, date_from=date_from, date_to=date_to, dep_filter=dep_filter)
+            result = cube.query(date_from, date_to, mi_filter or None, dep_filter or None)
+        else:
+            with FacilityHandler.cube_lock:
+                cube = self.get_transport_cube(mi_filter)
+                result = cube.query(date_from, date_to, mi_filter or None, dep_filter or None)
+        flows, self_edges_weight, lower, upper = result
 
-        if not mi_filter:
-            mpp = MPParser(self.conf['server'], self.conf['db'], self.conf['uid'], self.conf['pass'],
-                           self.conf['mp_query'], self.conf['peg_query'], debug=True)
+        # matching data date boundaries
+        if not date_boundaries:
+            date_from = lower if lower else datetime.strptime("9999-01-01 00:00:00", date_format)
+            date_to = upper if upper else datetime.strptime("1002-01-01 00:00:00", date_format)
+
+        # inserting aggregated transportation into facility
+        created_nodes = self.facility.add_aggregated_transp_records(
+            {(src + '.centroid', dest + '.centroid'): flow for (src, dest), flow in flows.items()})
+        self.add_edges_info(created_nodes)
+
+        return [self_edges_weight, date_from.strftime(date_format), date_to.strftime(date_format)]
+
+    def get_transport_cube(self, mi_filter=None):
+        """ Get a process-wide transport cube with a main item extract loaded
+
+        The extract is fetched from a DB only if it wasn't loaded before,
+        facility departments have changed or it was loaded at another DB
+        fingerprint (see is_extract_loaded()). If records were only appended
+        to a DB since, the unfiltered extract is extended with newer ones.
+
+        Extracts are loaded aside and published once complete (along with
+        their high-water marks) under cube_lock, which a caller should hold
+        while querying the cube as well.
+
+        :param mi_filter: string main item to filter on
+
+        :return: TransportCube instance
+
+        """
+
+        with FacilityHandler.cube_lock:
+            dep_labels = self.get_dep_labels()
+            cube = FacilityHandler.transport_cube
+            if cube is None or cube.dep_labels != dep_labels:
+                cube = FacilityHandler.transport_cube = TransportCube(dep_labels)
+
+            if not self.is_extract_loaded(mi_filter):
+                extract = TransportCube(dep_labels)
+                append = not mi_filter and cube.has_main_item(None) and SourceFingerprinter.is_db_appended(
+                    FacilityHandler.extract_fingerprints.get(None), self.fingerprint["db"])
+                if append:
+                    high_water_mark = self.append_new_transp_records(extract,
+                                                                     FacilityHandler.high_water_marks.get(None))
+                else:
+                    high_water_mark = self.load_transport_cube(extract, mi_filter)
+                cube.merge(extract, append)
+                FacilityHandler.high_water_marks[mi_filter or None] = high_water_mark
+                FacilityHandler.extract_fingerprints[mi_filter or None] = self.fingerprint["db"]
+            return cube
+
+    def append_new_transp_records(self, cube, high_water_mark):
+        """ Load records newer than a high-water mark into the unfiltered extract of a transport cube
+
+        :param cube: TransportCube instance
+        :param high_water_mark: high-water mark of the extract (see get_high_water_mark())
+
+        :return: new high-water mark of the extract
+
+        """
+
+        for batch in self.iter_new_transp_batches(high_water_mark):
+            cube.add_records((rec for _, rec in batch), append=True)
+            high_water_mark = self.get_high_water_mark(batch, high_water_mark)
+        cube.compact()
+        return high_water_mark
+
+    def is_extract_loaded(self, mi_filter=None):
+        """ Check whether a process-wide transport cube holds a current main item extract
+
+        An extract is current if it was loaded at the DB fingerprint of this
+        handler (or the fingerprint is unknown, see SourceFingerprinter).
+
+        :param mi_filter: string main item to filter on
+
+        :return: True - extract is loaded and current. False - otherwise.
+
+        """
+
+        cube = FacilityHandler.transport_cube
+        if cube is None or cube.dep_labels != self.get_dep_labels() or not cube.has_main_item(mi_filter or None):
+            return False
+        current_db = self.fingerprint["db"]
+        return current_db is None or FacilityHandler.extract_fingerprints.get(mi_filter or None) == current_db
+
+    @classmethod
+    def drop_extracts(cls, main_items):
+        """ Drop main item extracts of the process-wide transport cube (they are fetched again on demand)
+
+        :param main_items: iterable of string main items (None for the unfiltered extract)
+
+        """
+
+        main_items = list(main_items)
+        with FacilityHandler.cube_lock:
+            if FacilityHandler.transport_cube is not None:
+                FacilityHandler.transport_cube.drop_main_items(main_items)
+            for main_item in main_items:
+                FacilityHandler.high_water_marks.pop(main_item, None)
+                FacilityHandler.extract_fingerprints.pop(main_item, None)
+
+    @classmethod
+    def reset_transport_cube(cls):
+        """ Drop all the extracts of the process-wide transport cube (they are fetched again on demand) """
+
+        with FacilityHandler.cube_lock:
+            FacilityHandler.transport_cube = None
+            FacilityHandler.high_water_marks = {}
+            FacilityHandler.extract_fingerprints = {}
+
+    def load_transport_cube(self, cube, mi_filter=None, **filters):
+        """ Stream a main item extract into a transport cube batch by batch
+
+        Records previously loaded for the main item are replaced.
+
+        :param cube: TransportCube instance to load into
+        :param mi_filter: string main item to filter on
+        :param filters: date_from, date_to and dep_filter keyword arguments
+               of iter_transp_batches()
+
+        :return: high-water mark of the extract (see get_high_water_mark())
+
+        """
+
+        high_water_mark = None
+        cube.add_records([], mi_filter or None)  # register main item and drop its previous records
+        for batch in self.iter_transp_batches(mi_filter, **filters):
+            cube.add_records((rec for _, rec in batch), mi_filter or None, append=True)
+            high_water_mark = self.get_high_water_mark(batch, high_water_mark)
+        cube.compact()
+        return high_water_mark
+
+    def get_dep_labels(self):
+        """ Get facility department labels
+
+        :return: list of string department labels
+
+        """
+
+        return [dep.label for dep in self.facility.get_departments()]
+
+    def get_query_builder(self, mi_filter=None, since=None):
+        """ Get a masterplan query builder if filter columns are configured
+
+        A filter without a configured column is taken from a legacy
+        query template instead ("mi_mp_query" or "mp_since_query").
+
+        :param mi_filter: string main item to filter on
+        :param since: datetime to fetch only records not older than it
+
+        :return: MPQueryBuilder instance or None if "mp_filter_columns"
+                 isn't in configuration
+
+        """
+
+        if 'mp_filter_columns' not in self.conf:
+            return None
+        columns = self.conf['mp_filter_columns']
+        if mi_filter and 'main_item' not in columns:
+            base_query = MPQueryBuilder.fill_template(self.conf['mi_mp_query'], mi_filter)
+        elif not mi_filter and since is not None and 'date' not in columns and 'mp_since_query' in self.conf:
+            base_query = MPQueryBuilder.fill_template(self.conf['mp_since_query'], since)
         else:
+            base_query = self.conf['mp_query']
+        return MPQueryBuilder(base_query, columns)
+
+    def iter_transp_batches(self, mi_filter=None, since=None, date_from=None, date_to=None, dep_filter=None):
+        """ Fetch parsed transportation records from a DB in batches
+
+        Batches hold at most "mp_batch_size" (from configuration, 50000
+        by default) records. A parser providing iter_parse(<chunk_size>)
+        (yielding dictionaries of records) is streamed chunk by chunk.
+        Otherwise a parse() result is drained while it's consumed, so
+        processed records can be released early. A pooled connection is
+        handed to the parser if pooling is configured and the parser
+        accepts one (see parser_accepts_connection()).
+
+        With "mp_filter_columns" configured the filters with configured
+        columns become DB query predicates (see get_query_builder()).
+        Otherwise legacy query templates are used ("mi_mp_query",
+        "mp_since_query") and date_from, date_to and dep_filter are
+        left to a caller.
+
+        :param mi_filter: string main item to filter on
+        :param since: datetime to fetch only records not older than it with
+               "mp_since_query" from configuration (if configured, the full
+               extract is fetched otherwise). Ignored with mi_filter.
+        :param date_from: datetime lower date boundary (inclusive) or None
+        :param date_to: datetime upper date boundary (inclusive) or None
+        :param dep_filter: string department label to filter on or None
+
+        :return: generator of lists of (<record_key>, <record>) tuples
+                 (see MPParser.parse() for a record format)
+
+        """
+
+        builder = self.get_query_builder(mi_filter, since)
+        if builder:
+            if not builder.has_columns("date"):
+                date_from = date_to = since = None
+            if since is not None:
+                date_from = since if date_from is None else max(date_from, since)
+            query = builder.build_literal(date_from, date_to,
+                                          mi_filter or None if builder.has_columns("main_item") else None,
+                                          dep_filter or None if builder.has_columns(*self.DEP_COLUMNS) else None)
+        elif mi_filter:
+            query = MPQueryBuilder.fill_template(self.conf['mi_mp_query'], mi_filter)
+        elif since is not None and 'mp_since_query' in self.conf:
+            query = MPQueryBuilder.fill_template(self.conf['mp_since_query'], since)
+        else:
+            query = self.conf['mp_query']
+        batch_size = self.conf.get('mp_batch_size', 50000)
+        pool = self.get_db_pool(self.conf) if self.parser_accepts_connection() else None
+        if pool is None:
             mpp = MPParser(self.conf['server'], self.conf['db'], self.conf['uid'], self.conf['pass'],
-                           self.conf['mi_mp_query'] % mi_filter, self.conf['peg_query'], debug=True)
-        res = mpp.parse()  # get parsed transportation
-        date_format = "%Y-%m-%d %X"
-        self_edges_weight = 0
-        date_from = datetime.strptime(date_boundaries[0], date_format) \
-            if date_boundaries else datetime.strptime("9999-01-01 00:00:00", date_format)
-        date_to = datetime.strptime(date_boundaries[1], date_format) \
-            if date_boundaries else datetime.strptime("1002-01-01 00:00:00", date_format)
-
-        # inserting transportation into facility
-        for key in res:
-            rec = res[key]
-
-            # matching data date boundaries
-            if not date_boundaries:
-                d_f_cand = rec[2]
-                d_t_cand = rec[2]
-                if d_f_cand < date_from:
-                    date_from = d_f_cand
-                if d_t_cand > date_to:
-                    date_to = d_t_cand
-
-            # filter out data errors
-            if not self.facility.get_department_by_label(rec[0]) or not self.facility.get_department_by_label(rec[1]):
-                continue
-            # filter by department (if dep_filter is not None)
-            if dep_filter:
-                if not (rec[0] == dep_filter or rec[1] == dep_filter):
-                    continue
-            if date_boundaries and not datetime.strptime(date_boundaries[0], date_format) <= rec[2] \
-                    <= datetime.strptime(date_boundaries[1], date_format):
-                continue
-            try:
-                created_node = self.facility.add_transp_record(rec[0]+'.centroid', rec[1]+'.centroid', int(rec[3]))
-                extra_data = self.find_distance_and_time_info(rec[0], rec[1])
-                distance, time = extra_data if extra_data else [None, None]
-                if len(created_node.info_dict) > 0:
-                    continue
-                if distance:
-                    created_node.add_info("distance", distance)
-                if time:
-                    created_node.add_info("time", time)
-            except SelfEdgesNotSupported:
-                self_edges_weight += int(rec[3])
+                           query, self.conf['peg_query'], debug=True)
+            yield from self.__iter_parsed_batches(mpp, batch_size)
+        else:
+            with pool.connection() as conn:
+                mpp = MPParser(self.conf['server'], self.conf['db'], self.conf['uid'], self.conf['pass'],
+                               query, self.conf['peg_query'], debug=True, connection=conn)
+                yield from self.__iter_parsed_batches(mpp, batch_size)
 
-        return [self_edges_weight, date_from.strftime(date_format), date_to.strftime(date_format)]
+    @staticmethod
+    def __iter_parsed_batches(mpp, batch_size):
+        """ Split parser output into batches
+
+        :param mpp: MPParser instance
+        :param batch_size: int maximum amount of records in a batch
+
+        :return: generator of lists of (<record_key>, <record>) tuples
+
+        """
+
+        chunks = mpp.iter_parse(batch_size) if hasattr(mpp, 'iter_parse') else [mpp.parse()]
+        for chunk in chunks:
+            while chunk:
+                yield [chunk.popitem() for _ in range(min(batch_size, len(chunk)))]
+
+    @classmethod
+    def get_db_pool(cls, conf):
+        """ Get a process-wide DB connection pool
+
+        The pool is created on the first call if "db_pool_size" is in
+        configuration ("db_pool_timeout" and "db_health_check_query" are
+        optional) and recreated if the pool size was changed.
+
+        NOTE: the pool always serves fingerprint queries (see get_fingerprint()),
+        but masterplan extracts use it only if MPParser accepts an open
+        connection (see parser_accepts_connection()). Otherwise the parser
+        keeps opening a connection of its own for every extract.
+
+        :param conf: configuration dictionary
+
+        :return: ConnectionPool instance or None if pooling isn't configured
+
+        """
+
+        if 'db_pool_size' not in conf:
+            return None
+        with FacilityHandler.pool_lock:
+            pool = FacilityHandler.db_pool
+            if pool is None or pool.size != conf['db_pool_size']:
+                if pool is not None:
+                    pool.close()
+                pool = FacilityHandler.db_pool = ConnectionPool(
+                    lambda: cls.connect_db(conf), conf['db_pool_size'],
+                    health_check_query=conf.get('db_health_check_query', "SELECT 1"),
+                    timeout=conf.get('db_pool_timeout', 30))
+            return pool
+
+    @staticmethod
+    def connect_db(conf):
+        """ Open a new connection to a masterplan DB
+
+        Connects with pymssql (the driver the parser uses, see
+        vconf/packages/install_pymssql.sh) given "server", "db", "uid"
+        and "pass" from configuration.
+
+        :param conf: configuration dictionary
+
+        :return: DB API 2.0 connection
+
+        :raises DBInaccessibleError
+
+        """
+
+        try:
+            import pymssql
+        except ImportError:
+            raise DBInaccessibleError("pymssql is required for direct DB connections")
+        try:
+            return pymssql.connect(server=conf['server'], user=conf['uid'], password=conf['pass'], database=conf['db'])
+        except pymssql.Error as e:
+            raise DBInaccessibleError(str(e))
+
+    @staticmethod
+    def parser_accepts_connection():
+        """ Check whether MPParser can reuse an open DB connection
+
+        :return: True if MPParser takes a "connection" keyword argument, False otherwise
+
+        """
+
+        try:
+            parameters = inspect.signature(MPParser).parameters
+        except (TypeError, ValueError):
+            return False
+        return 'connection' in parameters or \
+            any(param.kind == inspect.Parameter.VAR_KEYWORD for param in parameters.values())
+
+    @classmethod
+    def get_fingerprint(cls, conf):
+        """ Get fingerprint of facility sources (see SourceFingerprinter)
+
+        A DB is queried through the process-wide pool if it's configured.
+
+        :param conf: configuration dictionary
+
+        :return: dictionary with "layout", "config" and "db" entries
+
+        """
+
+        pool = cls.get_db_pool(conf)
+        db_connection = pool.connection if pool is not None else lambda: closing(cls.connect_db(conf))
+        return SourceFingerprinter(conf, db_connection).get_fingerprint()
+
+    def get_high_water_mark(self, batch, previous=None):
+        """ Find the newest records of an extract batch
+
+        :param batch: list of (<record_key>, <record>) tuples (see iter_transp_batches())
+        :param previous: high-water mark to start with or None
+
+        :return: list [<str_newest_record_date>, <list_of_str_record_keys_at_that_date>]
+                 or previous one if there are no newer records
+
+        """
+
+        newest = datetime.strptime(previous[0], self.DATE_FORMAT) if previous else None
+        keys = set(previous[1]) if previous else set()
+        for key, rec in batch:
+            rec_date = rec[2].replace(microsecond=0)
+            if newest is None or rec_date > newest:
+                newest = rec_date
+                keys = {str(key)}
+            elif rec_date == newest:
+                keys.add(str(key))
+        return [newest.strftime(self.DATE_FORMAT), sorted(keys)] if newest else previous
+
+    def iter_new_transp_batches(self, high_water_mark):
+        """ Fetch transportation records newer than a high-water mark in batches
+
+        :param high_water_mark: high-water mark (see get_high_water_mark()) or None for all the records
+
+        :return: generator of non-empty lists of (<record_key>, <record>) tuples
+
+        """
+
+        since = datetime.strptime(high_water_mark[0], self.DATE_FORMAT) if high_water_mark else None
+        seen_keys = set(high_water_mark[1]) if high_water_mark else set()
+        for batch in self.iter_transp_batches(since=since):
+            new_batch = [(key, rec) for key, rec in batch
+                         if since is None or rec[2].replace(microsecond=0) > since or
+                         (rec[2].replace(microsecond=0) == since and str(key) not in seen_keys)]
+            if new_batch:
+                yield new_batch
+
+    def insert_new_transp_records(self):
+        """ Fold transportation records newer than the high-water mark into the facility
+
+        Records are fetched and inserted batch by batch. The process-wide
+        unfiltered extract is extended with them as well (once all of them
+        are fetched) if it stands at the same high-water mark and dropped
+        otherwise. Main item extracts miss new records, so they are dropped
+        to be fetched again.
+
+        :return: True - new records were found and inserted. False - otherwise.
+
+        """
+
+        extract = TransportCube(self.get_dep_labels())
+        updated = False
+        high_water_mark = self.high_water_mark
+
+        for new_batch in self.iter_new_transp_batches(self.high_water_mark):
+            updated = True
+
+            # extend data date boundaries
+            dates = [rec[2] for _, rec in new_batch]
+            if self.date_from and self.date_to:
+                dates += [datetime.strptime(self.date_from, self.DATE_FORMAT),
+                          datetime.strptime(self.date_to, self.DATE_FORMAT)]
+            self.date_from = min(dates).strftime(self.DATE_FORMAT)
+            self.date_to = max(dates).strftime(self.DATE_FORMAT)
+
+            # insert records with aggregation
+            records = [(rec[0]+'.centroid', rec[1]+'.centroid', int(rec[3])) for _, rec in new_batch
+                       if self.facility.get_department_by_label(rec[0]) and
+                       self.facility.get_department_by_label(rec[1])]
+            created_nodes, self_edges_weight = self.facility.add_transp_records(records)
+            self.add_edges_info(created_nodes)
+            self.self_edges_weight += self_edges_weight
+
+            extract.add_records((rec for _, rec in new_batch), append=True)
+            high_water_mark = self.get_high_water_mark(new_batch, high_water_mark)
+
+        # keep process-wide aggregates up to date
+        with FacilityHandler.cube_lock:
+            cube = FacilityHandler.transport_cube
+            if updated and cube is not None:
+                extend_cube = cube.dep_labels == extract.dep_labels and cube.has_main_item(None) and \
+                    FacilityHandler.high_water_marks.get(None) == self.high_water_mark
+                if extend_cube:
+                    cube.merge(extract, append=True)
+                    FacilityHandler.high_water_marks[None] = high_water_mark
+                    FacilityHandler.extract_fingerprints[None] = self.fingerprint["db"]
+                self.drop_extracts([main_item for main_item in cube.main_items
+                                    if main_item is not None or not extend_cube])
+        self.high_water_mark = high_water_mark
+        return updated
+
+    def add_edges_info(self, created_nodes):
+        """ Attach distance and time of travel between departments to edges which don't have it yet
+
+        :param created_nodes: dictionary where (<src_label>, <dest_label>) department
+               point pairs are keys and EdgeNodes are values
+
+        """
+
+        for (src_label, dest_label), created_node in created_nodes.items():
+            if len(created_node.info_dict) > 0:
+                continue
+            extra_data = self.find_distance_and_time_info(src_label.split('.')[0], dest_label.split('.')[0])
+            distance, time = extra_data if extra_data else [None, None]
+            if distance:
+                created_node.add_info("distance", distance)
+            if time:
+                created_node.add_info("time", time)
 
     def find_distance_and_time_info(self, node_1, node_2):
-        """ Derive information about distance and time of travel between departments from an add_info dict
+        """ Derive information about distance and time of travel between departments
 
         :param node_1: string department 1 label
         :param node_2: string department 2 label
@@ -170,17 +694,25 @@ class FacilityHandler(object):
 
         """
 
-        # parse out information about distance and time
-        if node_1 in self.add_info:
-            if node_2 in self.add_info[node_1]:
-                return self.add_info[node_1][node_2]
-            else:
-                return self.find_distance_and_time_info(node_2, node_1)
-        return None
+        return self.facility.get_distance_and_time(node_1, node_2)
 
+    def load_facility(self, path):
+        """ Load facility from a snapshot file (see FacilitySnapshot)
+
+        :param path: string path to a snapshot
+
+        :return: Facility instance or None if there is no
+                 snapshot or it's of an incompatible version
+
+        """
+
+        try:
+            return FacilitySnapshot.load(path).to_facility()
+        except (FileNotFoundError, IncompatibleSnapshot):
+            return None
 
     def dump_facility(self, path):
-        """ Save facility class as object data persistence
+        """ Save facility as a versioned columnar snapshot (see FacilitySnapshot)
 
         :param path: string where to store backup
 
@@ -190,8 +722,69 @@ class FacilityHandler(object):
         """
 
         try:
-            with open(path, "wb") as f:
-                pkl.dump(self.facility, f, -1)
+            FacilitySnapshot.from_facility(self.facility).dump(path)
             return True
-        except:  # TODO: narrow exceptions
-            return False
\ No newline at end of file
+        except OSError:
+            return False
+
+    def get_state_path(self):
+        """ Get a path of a JSON file holding cached facility state
+
+        :return: string path ("facility_state_path" from configuration or
+                 facility dump path with ".state.json" suffix)
+
+        """
+
+        return self.conf.get("facility_state_path", self.conf["facility_dump_path"] + ".state.json")
+
+    def load_state(self):
+        """ Load cached facility state (self-edges weight, date boundaries, high-water mark)
+
+        :return: dictionary of state or None if there is no state saved
+
+        """
+
+        try:
+            with open(self.get_state_path()) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def restore_state(self, state):
+        """ Restore handler fields from a cached facility state
+
+        :param state: dictionary from load_state()
+
+        """
+
+        self.self_edges_weight = state["self_edges_weight"]
+        self.date_from = state["date_from"]
+        self.date_to = state["date_to"]
+        self.high_water_mark = state["high_water_mark"]
+
+    def dump_state(self, filters=None):
+        """ Save cached facility state next to a facility dump
+
+        The state file is replaced atomically, so concurrent readers get
+        either the previous or the new state.
+
+        :param filters: list [<date_boundaries>, <mi_filter>, <dep_filter>] the
+               facility was built with. Defaults to None (no filters).
+
+        """
+
+        filters = [value if value else None for value in filters] if filters else [None, None, None]
+        state = {"filters": filters, "fingerprint": self.fingerprint,
+                 "self_edges_weight": self.self_edges_weight, "date_from": self.date_from,
+                 "date_to": self.date_to, "high_water_mark": self.high_water_mark}
+        state_path = self.get_state_path()
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(state_path)), prefix=".tmp_")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, state_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
@@ -0,0 +1,314 @@
+from app.dstruct.facility import *
+from app.dstruct.department import *
+import numpy as np
+import struct
+import json
+import os
+import tempfile
+
+""" facility_snapshot.py
+
+    Versioned columnar file format of a Facility instance. Departments,
+    graph vertices, edges (weights, increment counts) and edge info are
+    stored as flat arrays after a small header, so a snapshot is memory
+    mapped on load instead of being unpickled object by object, and
+    caches written by an incompatible version are detected instead of
+    failing somewhere inside class internals. Graph edges of a restored
+    facility are served from the mapped arrays until they are accessed
+    as objects.
+
+    File layout: 8 bytes magic, uint32 schema version, uint64 header
+    length, JSON header (array names, dtypes, shapes, offsets and facility
+    metadata) and raw C-ordered arrays aligned to 64 bytes.
+
+    """
+
+
+class IncompatibleSnapshot(Exception):
+    """ Custom exception
+
+    File is not a facility snapshot or it was written
+    with another schema version
+
+    """
+    pass
+
+
+class FacilitySnapshot(object):
+    """ Columnar snapshot of a Facility (departments, vertices, edges and edge info) """
+
+    MAGIC = b"GRPHSNAP"
+    SCHEMA_VERSION = 1
+    ALIGNMENT = 64
+    PREAMBLE = struct.Struct("<8sIQ")  # magic, schema version, header length
+
+    def __init__(self, arrays, meta):
+        """ Init method
+
+        Use from_facility() or load() to get an instance.
+
+        :param arrays: dictionary of string names and NumPy arrays
+        :param meta: JSON serializable dictionary of facility metadata
+
+        """
+
+        self.arrays = arrays
+        self.meta = meta
+
+    @classmethod
+    def from_facility(cls, facility):
+        """ Take a snapshot of a facility
+
+        :param facility: Facility instance
+
+        :return: FacilitySnapshot instance
+
+        """
+
+        departments = facility.get_departments()
+        graph = facility.d_graph
+        dep_index = {dep.label: i for i, dep in enumerate(departments)}
+
+        # departments and their boundary points
+        dep_points = [p.get_coords_list() for dep in departments for p in dep.point2d_vector]
+        dep_indptr = np.cumsum([0] + [len(dep.point2d_vector) for dep in departments])
+
+        # graph vertices (labeled <department_label>.<department_vertex_label>)
+        labels = list(graph.label_mapper)
+        label_index = {label: i for i, label in enumerate(labels)}
+        coords = [graph.label_mapper[label].get_coordinates() for label in labels]
+
+        # edges in adjacency order and their info
+        src, dst, weights, counts, infos = [], [], [], [], []
+        for label in labels:
+            for edge_node in graph.mapper[graph.label_mapper[label]]:
+                src.append(label_index[label])
+                dst.append(label_index[edge_node.vertex_node.get_label()])
+                weights.append(edge_node.weight)
+                counts.append(edge_node.increment_count)
+                infos.append(edge_node.info_dict)
+
+        arrays = {
+            "dep_labels": cls.__to_str_array([dep.label for dep in departments]),
+            "dep_indptr": np.array(dep_indptr, dtype=np.int64),
+            "dep_points": np.array(dep_points, dtype=float).reshape((len(dep_points), 2)),
+            "vertex_labels": cls.__to_str_array(labels),
+            "vertex_deps": np.array([dep_index[label.split('.')[0]] for label in labels], dtype=np.int64),
+            "vertex_coords": np.array(coords, dtype=float).reshape((len(labels), 2)),
+            "edge_src": np.array(src, dtype=np.int64),
+            "edge_dst": np.array(dst, dtype=np.int64),
+            "edge_counts": np.array(counts, dtype=np.int64),
+        }
+        arrays["edge_weights"], arrays["edge_weights_mask"] = cls.__to_numeric_column(weights)
+
+        # numeric info keys become columns, the rest is kept as JSON
+        info_keys = []
+        for info in infos:
+            info_keys.extend(key for key in info if key not in info_keys)
+        other_infos = [{} for _ in infos]
+        numeric_keys = []
+        for key in info_keys:
+            values = [info.get(key) for info in infos]
+            present = [key in info for info in infos]
+            if all(isinstance(value, (int, float)) and not isinstance(value, bool)
+                   for value, is_set in zip(values, present) if is_set):  # keys set to None are kept as JSON
+                numeric_keys.append(key)
+                arrays["info_%d" % (len(numeric_keys) - 1)], arrays["info_%d_mask" % (len(numeric_keys) - 1)] = \
+                    cls.__to_numeric_column(values, present)
+            else:
+                for other, info in zip(other_infos, infos):
+                    if key in info:
+                        other[key] = info[key]
+        arrays["edge_other_info"] = cls.__to_str_array([json.dumps(other) if other else "" for other in other_infos])
+
+        meta = {"max_x": facility.max_x, "max_y": facility.max_y, "info_keys": numeric_keys}
+        return cls(arrays, meta)
+
+    def dump(self, path):
+        """ Atomically write a snapshot to a file
+
+        :param path: string destination path
+
+        """
+
+        header = {"meta": self.meta, "arrays": {}}
+        offset = 0
+        for name, array in self.arrays.items():
+            header["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape), "offset": offset}
+            offset = self.__align(offset + array.nbytes)
+        header_bytes = json.dumps(header).encode("utf-8")
+        data_start = self.__align(self.PREAMBLE.size + len(header_bytes))
+
+        dir_name = os.path.dirname(os.path.abspath(path))
+        fd, tmp_path = tempfile.mkstemp(dir=dir_name, prefix=".tmp_")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(self.PREAMBLE.pack(self.MAGIC, self.SCHEMA_VERSION, len(header_bytes)))
+                f.write(header_bytes)
+                for name, array in self.arrays.items():
+                    f.seek(data_start + header["arrays"][name]["offset"])
+                    f.write(np.ascontiguousarray(array).tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @classmethod
+    def load(cls, path):
+        """ Memory map a snapshot file (arrays are read lazily on access)
+
+        :param path: string snapshot path
+
+        :return: FacilitySnapshot instance
+
+        :raises IncompatibleSnapshot, FileNotFoundError
+        """
+
+        with open(path, 'rb') as f:
+            preamble = f.read(cls.PREAMBLE.size)
+            if len(preamble) < cls.PREAMBLE.size:
+                raise IncompatibleSnapshot("%s is not a facility snapshot" % path)
+            magic, version, header_length = cls.PREAMBLE.unpack(preamble)
+            if magic != cls.MAGIC:
+                raise IncompatibleSnapshot("%s is not a facility snapshot" % path)
+            if version != cls.SCHEMA_VERSION:
+                raise IncompatibleSnapshot("snapshot schema version %d is not supported (expected %d)" %
+                                           (version, cls.SCHEMA_VERSION))
+            header = json.loads(f.read(header_length).decode("utf-8"))
+        data_start = cls.__align(cls.PREAMBLE.size + header_length)
+
+        arrays = {}
+        for name, spec in header["arrays"].items():
+            dtype = np.dtype(spec["dtype"])
+            shape = tuple(spec["shape"])
+            if int(np.prod(shape)) == 0 or dtype.itemsize == 0:
+                arrays[name] = np.zeros(shape, dtype=dtype)  # empty arrays can't be mapped
+            else:
+                arrays[name] = np.memmap(path, dtype=dtype, mode='r', offset=data_start + spec["offset"], shape=shape)
+        return cls(arrays, header["meta"])
+
+    def to_facility(self):
+        """ Build a Facility instance out of a snapshot
+
+        Departments are built right away, while graph edges are deferred
+        (see Graph.defer_edges()): analytics and graph snapshots are
+        served straight from the mapped arrays and edge objects are
+        created only when graph edges are accessed (e.g. new records
+        are added).
+
+        :return: Facility instance
+
+        """
+
+        arrays = self.arrays
+        facility = Facility(self.meta["max_x"], self.meta["max_y"])
+
+        # departments with their extra (non-centroid) vertices
+        dep_points = arrays["dep_points"].tolist()
+        dep_indptr = arrays["dep_indptr"].tolist()
+        extra_vertices = {}
+        vertex_coords = arrays["vertex_coords"].tolist()
+        for label, dep_idx, (x, y) in zip(arrays["vertex_labels"].tolist(), arrays["vertex_deps"].tolist(),
+                                          vertex_coords):
+            vertex_label = label.split('.', 1)[1]
+            if vertex_label != "centroid":
+                extra_vertices.setdefault(dep_idx, {})[vertex_label] = Point2D(x, y)
+        for i, label in enumerate(arrays["dep_labels"].tolist()):
+            dep = Department(label, *[Point2D(x, y) for x, y in dep_points[dep_indptr[i]:dep_indptr[i + 1]]])
+            if i in extra_vertices:
+                dep.add_vertices(extra_vertices[i])
+            facility.add_department(dep)
+
+        graph = facility.d_graph
+        graph.defer_edges(lambda: self.__add_edges(graph), self.get_edge_columns)
+        return facility
+
+    def get_edge_columns(self):
+        """ Get graph edges in the original adjacency order (see Graph.defer_edges())
+
+        :return: dictionary with "labels", "src", "dst", "weights",
+                 "increment_counts" and "info_dicts" entries
+
+        """
+
+        arrays = self.arrays
+        info_dicts = [{} for _ in range(len(arrays["edge_src"]))]
+        for i, key in enumerate(self.meta["info_keys"]):
+            column, mask = arrays["info_%d" % i], arrays["info_%d_mask" % i]
+            for j, value in zip(np.flatnonzero(mask).tolist(), column[mask].tolist()):
+                info_dicts[j][key] = value
+        for info_dict, other in zip(info_dicts, arrays["edge_other_info"].tolist()):
+            if other:
+                info_dict.update(json.loads(other))
+        return {"labels": arrays["vertex_labels"].tolist(), "src": arrays["edge_src"], "dst": arrays["edge_dst"],
+                "weights": self.__from_numeric_column(arrays["edge_weights"], arrays["edge_weights_mask"]),
+                "increment_counts": arrays["edge_counts"], "info_dicts": info_dicts}
+
+    def __add_edges(self, graph):
+        """ Add edges (aggregated weights and counts) and their info to a graph
+
+        :param graph: TransportationGraph of a facility restored by to_facility()
+
+        """
+
+        columns = self.get_edge_columns()
+        labels = columns["labels"]
+        pairs = [(labels[a], labels[b]) for a, b in zip(columns["src"].tolist(), columns["dst"].tolist())]
+        created = graph.add_aggregated_edges({pair: (weight, count) for pair, weight, count in
+                                              zip(pairs, columns["weights"], columns["increment_counts"].tolist())})
+        for pair, info_dict in zip(pairs, columns["info_dicts"]):
+            for key, value in info_dict.items():
+                created[pair].add_info(key, value)
+
+    @staticmethod
+    def __to_str_array(values):
+        """ Convert strings into a fixed width unicode NumPy array
+
+        :param values: list of strings
+
+        :return: NumPy array
+        """
+
+        return np.array(values, dtype="<U%d" % max([len(value) for value in values] + [1]))
+
+    @staticmethod
+    def __to_numeric_column(values, present=None):
+        """ Convert numbers into a column keeping ints as ints
+
+        :param values: list of int/float numbers or None
+        :param present: list of bools whether a value is set (None - values which are not None)
+
+        :return: tuple (<NumPy_values>, <NumPy_bool_mask_of_set_values>)
+        """
+
+        present = [value is not None for value in values] if present is None else present
+        is_int = all(isinstance(value, int) for value, is_set in zip(values, present) if is_set)
+        dtype = np.int64 if is_int else float
+        column = np.array([value if is_set else 0 for value, is_set in zip(values, present)], dtype=dtype)
+        return column, np.array(present, dtype=bool)
+
+    @staticmethod
+    def __from_numeric_column(column, mask):
+        """ Convert a numeric column back into python numbers
+
+        :param column: NumPy values array
+        :param mask: NumPy bool mask of set values
+
+        :return: list of numbers or None for values that are not set
+        """
+
+        return [value if is_set else None for value, is_set in zip(column.tolist(), mask.tolist())]
+
+    @classmethod
+    def __align(cls, offset):
+        """ Round an offset up to ALIGNMENT
+
+        :param offset: int offset
+
+        :return: int aligned offset
+        """
+
+        return -(-offset // cls.ALIGNMENT) * cls.ALIGNMENT
@@ -0,0 +1,136 @@
+from threading import Lock
+import hashlib
+import json
+import os
+
+""" fingerprint.py
+
+    Fingerprints of everything a facility and its visualization JSON
+    are built from: factory layout file, configuration and masterplan
+    DB (newest record timestamp and row count). Fingerprints are saved
+    next to cached artifacts, so caches are rebuilt only when one of
+    the inputs has actually changed.
+
+    """
+
+
+class SourceFingerprinter(object):
+    """ Computes fingerprints of facility sources """
+
+    __file_digests = {}  # path -> ((<mtime_ns>, <size>), <sha1>) to hash unchanged files only once
+    __lock = Lock()
+
+    def __init__(self, conf, db_connection=None):
+        """ Init method
+
+        :param conf: configuration dictionary ("facility_source_path" and
+               optional "mp_fingerprint_query" returning a single row with
+               the newest masterplan record timestamp and a row count,
+               e.g. "SELECT MAX(created), COUNT(*) FROM mp"; see
+               is_db_appended() for what such a fingerprint can't tell)
+        :param db_connection: function with no arguments returning a context
+               manager that yields a DB API 2.0 connection or None if there
+               is no DB access. Defaults to None.
+
+        """
+
+        self.conf = conf
+        self.db_connection = db_connection
+
+    def get_fingerprint(self):
+        """ Get fingerprint of all the sources
+
+        :return: dictionary with "layout" and "config" digests and "db"
+                 [<str_newest_record_timestamp>, <int_row_count>] list
+                 (None if it can't be determined)
+
+        """
+
+        return {"layout": self.get_file_digest(self.conf["facility_source_path"]),
+                "config": self.get_conf_digest(), "db": self.get_db_fingerprint()}
+
+    @classmethod
+    def get_file_digest(cls, path):
+        """ Get SHA-1 digest of a file (re-hashed only if it's mtime or size changed)
+
+        :param path: string path to a file
+
+        :return: string hex digest or None if there is no such file
+
+        """
+
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        signature = (stat.st_mtime_ns, stat.st_size)
+        with cls.__lock:
+            cached = cls.__file_digests.get(path)
+        if cached is not None and cached[0] == signature:
+            return cached[1]
+
+        sha1 = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                sha1.update(chunk)
+        with cls.__lock:
+            cls.__file_digests[path] = (signature, sha1.hexdigest())
+        return sha1.hexdigest()
+
+    def get_conf_digest(self):
+        """ Get SHA-1 digest of configuration
+
+        :return: string hex digest
+
+        """
+
+        return hashlib.sha1(json.dumps(self.conf, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def get_db_fingerprint(self):
+        """ Get the newest masterplan record timestamp and a row count
+
+        :return: list [<str_timestamp>, <int_row_count>] or None if
+                 "mp_fingerprint_query" isn't configured or a DB is
+                 inaccessible
+
+        """
+
+        if 'mp_fingerprint_query' not in self.conf or self.db_connection is None:
+            return None
+        try:
+            with self.db_connection() as conn:
+                cursor = conn.cursor()
+                try:
+                    cursor.execute(self.conf['mp_fingerprint_query'])
+                    row = cursor.fetchone()
+                finally:
+                    cursor.close()
+        except Exception:
+            return None  # unknown DB state, callers treat a DB as possibly changed
+        if row is None:
+            return None
+        return [str(row[0]) if row[0] is not None else None, int(row[1] or 0)]
+
+    @staticmethod
+    def is_db_appended(old, new):
+        """ Check whether DB changes between two fingerprints can be only appended records
+
+        A (newest timestamp, row count) fingerprint is a heuristic: it
+        can't tell an append from deleted rows replaced by more new ones
+        or from inserted rows not newer than the previous newest one
+        (backdated records). Incremental updates miss such changes, so
+        a full rebuild (force_rebuild) is needed after them.
+
+        :param old: "db" part of a previous fingerprint
+        :param new: "db" part of a current fingerprint
+
+        :return: True - rows were only added (or nothing changed). False - otherwise.
+
+        """
+
+        if old is None or new is None:
+            return False
+        if new == old:
+            return True
+        # appending rows always adds to a row count, so the same count means some rows were removed
+        return new[1] > old[1] and (old[0] is None or (new[0] is not None and new[0] >= old[0]))
@@ -1,17 +1,24 @@
 from app.core.facility_handler import *
+from app.core.json_file_cache import JSONFileCache
 import json
+import time
 
 
 class JSONAssembler(object):
     """ Assembles visualization data JSON on request """
 
-    def __init__(self, conf_path, force_rebuild=False, date_boundaries=None, mi_filter=None, dep_filter=None):
+    def __init__(self, conf_path, force_rebuild=False, date_boundaries=None, mi_filter=None, dep_filter=None,
+                 incremental=False, revalidate=False):
         """ Init method
 
         Fetch cached facility version and initialize
         all the fields necessary to build and cache
         visualization JSON.
 
+        Cached JSON built out of the same sources (see
+        FacilityHandler.get_fingerprint()) is picked up without
+        initializing a facility at all.
+
         :param conf_path: string path to configuration file
         :param force_rebuild - boolean flag to force rebuild
                both facility instance and JSON file. In other
@@ -20,19 +27,43 @@ class JSONAssembler(object):
                Datetime format: "%Y-%m-%d %X" e.g. 2015-05-25 18:00:00
         :param mi_filter: string main item to filter on
         :param dep_filter: string department label to filter on
+        :param incremental: bool fold only new transportation records into
+               the cached facility instead of a full rebuild (see FacilityHandler)
+        :param revalidate: bool reuse cached versions only if a DB fingerprint
+               proves them up to date and rebuild otherwise (as force_rebuild
+               does when "mp_fingerprint_query" isn't configured)
 
         """
 
         # assign rebuild flag
         self.force_rebuild = force_rebuild
         self.init_failed = False
+        self.fh = None
+        self.facility = None
+        self.cached_json = None
+
+        with open(conf_path) as f:
+            conf = json.load(f)
+        self.viz_json_dump_path = conf['viz_json_dump_path']
+        self.cache_key = [date_boundaries, mi_filter, dep_filter]
+        self.file_cache = JSONFileCache(os.path.dirname(self.viz_json_dump_path),
+                                        conf.get('viz_json_cache_max_bytes', 64 * 1024 * 1024))
+
+        # pick up JSON proven to be up to date
+        self.fingerprint = FacilityHandler.get_fingerprint(conf) if not self.force_rebuild else None
+        if self.fingerprint is not None and self.fingerprint["db"] is not None:
+            self.cached_json = self.file_cache.get(self.cache_key, self.fingerprint)
+            if self.cached_json is not None:
+                return
+        elif revalidate:
+            self.force_rebuild = True
 
         # init/restore Facility class
         # try:
         self.fh = FacilityHandler(conf_path, force_rebuild=self.force_rebuild,
-                          date_boundaries=date_boundaries, mi_filter=mi_filter, dep_filter=dep_filter)
+                          date_boundaries=date_boundaries, mi_filter=mi_filter, dep_filter=dep_filter,
+                          incremental=incremental, fingerprint=self.fingerprint)
         self.facility = self.fh.facility
-        self.viz_json_dump_path = self.fh.conf['viz_json_dump_path']
         # except:
         #      self.init_failed = True
 
@@ -43,8 +74,11 @@ class JSONAssembler(object):
 
         """
 
-        if not self.force_rebuild and os.path.isfile(self.viz_json_dump_path):
-            return self.get_cached_json()
+        if self.cached_json is not None:
+            return self.cached_json
+        cached_json = self.get_cached_json() if not self.force_rebuild and not self.fh.updated else None
+        if cached_json is not None:
+            return cached_json
         else:
 
             # clear previous JSON dict
@@ -65,26 +99,27 @@ class JSONAssembler(object):
                     viz_dict['facility'][dep.label]["points"][p_name] = p_coords.get_coords_list()
 
             # stage 2: compose edges part
-            for edge in self.facility.d_graph.get_edges():
+            snapshot = self.facility.d_graph.freeze()
+            for edge in snapshot.get_edges():
                 viz_dict['edges'].append(edge)
 
             # stage 3: insert additional information
             viz_dict['self_edges_total_weight'] = self.fh.self_edges_weight
             viz_dict['date_boundaries'] = [self.fh.date_from, self.fh.date_to]
 
-            # get nodes involved in a net
-            involved_nodes_count = 0
-            for edge_list in self.facility.d_graph.mapper.values():
-                if edge_list:
-                    involved_nodes_count += 1
+            # get nodes involved in a net and append result into JSON
+            viz_dict['involved_edges_count'] = snapshot.get_involved_vertices_count()
 
-            # append result into JSON
-            viz_dict['involved_edges_count'] = involved_nodes_count
+            # stage 4: traffic load of aisle segments (if aisles are described)
+            aisle_loads = self.facility.get_aisle_loads()
+            if aisle_loads is not None:
+                viz_dict['aisle_loads'] = aisle_loads
 
             # backup json
-            self.dump_to_file(viz_dict)
+            viz_json = json.dumps(viz_dict)
+            self.dump_to_file(viz_json)
 
-            return json.dumps(viz_dict)
+            return viz_json
 
     @staticmethod
     def get_json_base():
@@ -96,23 +131,46 @@ class JSONAssembler(object):
 
         return {'facility': {}, "edges": []}
 
+    @staticmethod
+    def get_stored_viz_json(conf_path, date_boundaries=None, mi_filter=None, dep_filter=None):
+        """ Pick up the latest stored JSON of a filter set without initializing a facility
+
+        :param conf_path: string path to configuration file
+        :param date_boundaries - (<start>, <end>) list of string dates to filter on
+        :param mi_filter: string main item to filter on
+        :param dep_filter: string department label to filter on
+
+        :return: tuple (<bytes_JSON>, <float_age_in_seconds>) or None if nothing is stored
+
+        """
+
+        with open(conf_path) as f:
+            conf = json.load(f)
+        file_cache = JSONFileCache(os.path.dirname(conf['viz_json_dump_path']),
+                                   conf.get('viz_json_cache_max_bytes', 64 * 1024 * 1024))
+        key = [date_boundaries, mi_filter, dep_filter]
+        try:
+            age = max(time.time() - os.path.getmtime(file_cache.get_path(key)), 0)
+        except FileNotFoundError:
+            return None
+        viz_json = file_cache.get(key)
+        return (viz_json, age) if viz_json is not None else None
+
     def get_cached_json(self):
-        """ Pick up JSON from a system and return it """
+        """ Pick up JSON of the requested filter set from a system and return it
 
-        with open(self.viz_json_dump_path, 'rb') as f:
-            return f.read()
+        :return: bytes JSON or None if there is no cached version
 
-    def dump_to_file(self, viz_dict):
-        """ Dump visualization JSON data """
+        """
 
-        # retrieve base dump directory from config
-        base_dir = '/'.join(self.viz_json_dump_path.split("/")[:-1]) + "/"
+        fingerprint = self.fh.fingerprint if self.fh.fingerprint["db"] is not None else None
+        return self.file_cache.get(self.cache_key, fingerprint)
 
-        # check whether base dir exists
-        # and if not create it
-        if not os.path.exists(base_dir):
-            os.makedirs(base_dir)
+    def dump_to_file(self, viz_json):
+        """ Dump visualization JSON data (atomically, one file per filter set)
+
+        :param viz_json: string JSON to dump
+
+        """
 
-        # dump data
-        with open(self.viz_json_dump_path, 'w') as f:
-            json.dump(viz_dict, f)
+        self.file_cache.put(self.cache_key, viz_json, self.fh.fingerprint)
@@ -0,0 +1,209 @@
+from contextlib import contextmanager
+import hashlib
+import fcntl
+import json
+import os
+import tempfile
+import time
+
+""" json_file_cache.py
+
+    On-disk cache of visualization JSON with one file per filter
+    set. Files are written to a temporary file first and renamed
+    into place, so readers never see a partially written entry.
+    A manifest keeps entry sizes and timestamps to cap the cache
+    size by evicting the oldest entries.
+
+    """
+
+
+class JSONFileCache(object):
+    """ Per-filter on-disk JSON cache safe to share between worker processes """
+
+    MANIFEST_NAME = "manifest.json"
+    LOCK_NAME = ".lock"
+
+    def __init__(self, base_dir, max_bytes=64 * 1024 * 1024):
+        """ Init method
+
+        :param base_dir: string directory to keep cache files in
+               (created if it doesn't exist)
+        :param max_bytes: int maximum total size of cached files.
+               Defaults to 64 MiB.
+
+        """
+
+        self.base_dir = base_dir
+        self.max_bytes = max_bytes
+
+        # check whether base dir exists
+        # and if not create it
+        if not os.path.exists(base_dir):
+            os.makedirs(base_dir, exist_ok=True)
+
+    @staticmethod
+    def get_file_name(key):
+        """ Get a cache file name of a filter set
+
+        :param key: JSON serializable filter set (e.g. a list of filters)
+
+        :return: string file name
+
+        """
+
+        return "viz_%s.json" % hashlib.sha1(json.dumps(key).encode("utf-8")).hexdigest()
+
+    def get_path(self, key):
+        """ Get a cache file path of a filter set
+
+        :param key: JSON serializable filter set
+
+        :return: string path to a cache file
+
+        """
+
+        return os.path.join(self.base_dir, self.get_file_name(key))
+
+    def get(self, key, fingerprint=None):
+        """ Get cached JSON of a filter set
+
+        :param key: JSON serializable filter set
+        :param fingerprint: JSON serializable fingerprint of sources the
+               JSON must have been built from (None - any). Defaults to None.
+
+        :return: bytes JSON or None if it's not cached (or it's outdated)
+
+        """
+
+        # shared lock: an entry can't be replaced or evicted between the manifest and the file reads
+        with self.__locked(shared=True):
+            if fingerprint is not None:
+                entry = self.read_manifest().get(self.get_file_name(key))
+                if entry is None or entry.get("fingerprint") != fingerprint:
+                    return None
+            try:
+                with open(self.get_path(key), 'rb') as f:
+                    return f.read()
+            except FileNotFoundError:
+                return None
+
+    def put(self, key, data, fingerprint=None):
+        """ Atomically store JSON of a filter set and evict the oldest entries if cache is too big
+
+        :param key: JSON serializable filter set
+        :param data: string JSON to store
+        :param fingerprint: JSON serializable fingerprint of sources the
+               JSON was built from. Defaults to None.
+
+        """
+
+        data = data.encode("utf-8") if isinstance(data, str) else data
+        file_name = self.get_file_name(key)
+        with self.__locked():
+            # entry is replaced under the lock, so the manifest always describes the file on disk
+            self.__write_atomically(os.path.join(self.base_dir, file_name), data)
+            manifest = self.read_manifest()
+            manifest[file_name] = {"key": key, "size": len(data), "created": time.time(), "fingerprint": fingerprint}
+            self.__evict(manifest, keep=file_name)
+            self.__write_atomically(os.path.join(self.base_dir, self.MANIFEST_NAME),
+                                    json.dumps(manifest).encode("utf-8"))
+
+    def invalidate(self, key=None):
+        """ Remove a single cached entry or all of them
+
+        :param key: JSON serializable filter set. If None, all
+               the entries are removed. Defaults to None.
+
+        """
+
+        with self.__locked():
+            manifest = self.read_manifest()
+            file_names = list(manifest) if key is None else [self.get_file_name(key)]
+            for file_name in file_names:
+                manifest.pop(file_name, None)
+                self.__remove(file_name)
+            self.__write_atomically(os.path.join(self.base_dir, self.MANIFEST_NAME),
+                                    json.dumps(manifest).encode("utf-8"))
+
+    def read_manifest(self):
+        """ Read cache manifest
+
+        :return: dictionary where file names are keys and dictionaries
+                 with "key", "size", "created" and "fingerprint" entries are values
+
+        """
+
+        try:
+            with open(os.path.join(self.base_dir, self.MANIFEST_NAME)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def __evict(self, manifest, keep):
+        """ Remove the oldest entries until the cache fits max_bytes
+
+        :param manifest: manifest dictionary (modified in place)
+        :param keep: string file name not to evict
+
+        """
+
+        total = sum(entry["size"] for entry in manifest.values())
+        for file_name, entry in sorted(manifest.items(), key=lambda item: item[1]["created"]):
+            if total <= self.max_bytes:
+                break
+            if file_name == keep:
+                continue
+            total -= entry["size"]
+            del manifest[file_name]
+            self.__remove(file_name)
+
+    def __remove(self, file_name):
+        """ Remove a cache file if it exists
+
+        :param file_name: string cache file name
+
+        """
+
+        try:
+            os.remove(os.path.join(self.base_dir, file_name))
+        except FileNotFoundError:
+            pass
+
+    def __write_atomically(self, path, data):
+        """ Write data to a temporary file and rename it into place
+
+        :param path: string destination path
+        :param data: bytes to write
+
+        """
+
+        fd, tmp_path = tempfile.mkstemp(dir=self.base_dir, prefix=".tmp_")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    @contextmanager
+    def __locked(self, shared=False):
+        """ Context manager: hold a manifest lock (lock file)
+
+        Every holder opens the lock file on its own, so the lock serves
+        threads as well as processes and any JSONFileCache instance.
+
+        :param shared: bool whether to take a shared (reader) lock instead
+               of an exclusive one. Defaults to False.
+
+        """
+
+        with open(os.path.join(self.base_dir, self.LOCK_NAME), 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
@@ -0,0 +1,321 @@
+from math import exp
+import numpy as np
+import random
+
+""" layout_optimizer.py
+
+    Department layout optimisation as a quadratic assignment problem
+    (QAP): departments are assigned to slots (current department
+    locations) so that sum of flow(a, b) * distance(slot(a), slot(b))
+    over all department pairs is minimal.
+
+    Search moves are pairwise swaps of department slots. Flow x distance
+    products are kept up to date with O(n^2) rank-one updates after each
+    performed swap, so a cost change of any swap is evaluated in O(1)
+    and a delta matrix of the whole neighbourhood in O(n^2) vectorized
+    operations. Simulated annealing and robust tabu search are built
+    on top of it.
+
+    """
+
+
+class BadLayoutProblem(Exception):
+    """ Custom exception
+
+    Flow and distance matrices are not square or there are
+    less slots than departments
+
+    """
+    pass
+
+
+class LayoutOptimizer(object):
+    """ Pairwise swap local search over department to slot assignments """
+
+    def __init__(self, flow, distance, seed=None):
+        """ Init method
+
+        :param flow: n x n array of flows between departments (rows are sources)
+        :param distance: m x m array of distances between slots (m >= n). If
+               there are more slots than departments, zero flow dummy
+               departments occupy the remaining ones.
+        :param seed: int random seed (None - random). Defaults to None.
+
+        """
+
+        flow = np.asarray(flow, dtype=float)
+        distance = np.asarray(distance, dtype=float)
+        if flow.ndim != 2 or flow.shape[0] != flow.shape[1] or distance.ndim != 2 or \
+                distance.shape[0] != distance.shape[1] or distance.shape[0] < flow.shape[0]:
+            raise BadLayoutProblem("flow must be n x n and distance m x m with m >= n")
+
+        self.departments_count = flow.shape[0]
+        self.size = distance.shape[0]
+        self.flow = np.zeros((self.size, self.size))
+        self.flow[:self.departments_count, :self.departments_count] = flow
+        self.distance = distance
+        self.random = random.Random(seed)
+        self.swaps_evaluated = 0
+        self.set_assignment(np.arange(self.size))
+
+    def set_assignment(self, assignment):
+        """ Start from an assignment
+
+        :param assignment: sequence where i-th item is a slot of i-th department
+               (a permutation of range(m); dummy departments included)
+
+        """
+
+        self.assignment = np.array(assignment, dtype=np.int64)
+        p = self.assignment
+        self.__dp = self.distance[np.ix_(p, p)]  # distances between slots of departments
+        self.__m1 = self.flow.T @ self.__dp
+        self.__m2 = self.flow @ self.__dp.T
+        self.cost = float((self.flow * self.__dp).sum())
+        self.__delta = None  # delta matrix (calculated on demand)
+
+    def get_cost(self, assignment):
+        """ Evaluate an assignment from scratch
+
+        :param assignment: sequence where i-th item is a slot of i-th department
+
+        :return: float flow x distance cost
+
+        """
+
+        p = np.asarray(assignment, dtype=np.int64)
+        return float((self.flow * self.distance[np.ix_(p, p)]).sum())
+
+    def get_swap_delta(self, r, s):
+        """ Get cost change of swapping slots of two departments in O(n)
+
+        :param r: int department index
+        :param s: int department index
+
+        :return: float cost change
+
+        """
+
+        if r == s:
+            return 0.0
+        f, dp = self.flow, self.__dp
+        mask = np.ones(self.size, dtype=bool)
+        mask[[r, s]] = False
+        delta = ((f[r, mask] - f[s, mask]) * (dp[s, mask] - dp[r, mask])).sum() + \
+            ((f[mask, r] - f[mask, s]) * (dp[mask, s] - dp[mask, r])).sum()
+        delta += (f[r, r] - f[s, s]) * (dp[s, s] - dp[r, r]) + (f[r, s] - f[s, r]) * (dp[s, r] - dp[r, s])
+        return float(delta)
+
+    def get_delta_matrix(self):
+        """ Get cost changes of all the swaps
+
+        :return: m x m read-only NumPy array where [r, s] is a cost change of
+                 swapping slots of departments r and s (diagonal is zero)
+
+        """
+
+        if self.__delta is None:
+            self.__delta = self.__compute_delta_matrix()
+            self.__delta.setflags(write=False)
+        return self.__delta
+
+    def get_cached_swap_delta(self, r, s):
+        """ Get cost change of swapping slots of two departments in O(1) out of cached products
+
+        :param r: int department index
+        :param s: int department index
+
+        :return: float cost change
+
+        """
+
+        if r == s:
+            return 0.0
+        f, dp, m1, m2 = self.flow, self.__dp, self.__m1, self.__m2
+        f_rr, f_ss, f_rs, f_sr = f[r, r], f[s, s], f[r, s], f[s, r]
+        d_rr, d_ss, d_rs, d_sr = dp[r, r], dp[s, s], dp[r, s], dp[s, r]
+        return float(m1[r, s] + m1[s, r] - m1[r, r] - m1[s, s] + m2[r, s] + m2[s, r] - m2[r, r] - m2[s, s] -
+                     (f_rr - f_sr) * (d_sr - d_rr) - (f_rs - f_ss) * (d_ss - d_rs) -
+                     (f_rr - f_rs) * (d_rs - d_rr) - (f_sr - f_ss) * (d_ss - d_sr) +
+                     (f_rr - f_ss) * (d_ss - d_rr) + (f_rs - f_sr) * (d_sr - d_rs))
+
+    def swap(self, r, s, delta=None):
+        """ Swap slots of two departments updating cost and cached products in O(n^2)
+
+        :param r: int department index
+        :param s: int department index
+        :param delta: float cost change of the swap if it's already known.
+               Defaults to None.
+
+        """
+
+        if r == s:
+            return
+        self.cost += delta if delta is not None else self.get_cached_swap_delta(r, s)
+        f, dp = self.flow, self.__dp
+        self.__m1 += np.outer(f[r, :] - f[s, :], dp[s, :] - dp[r, :])
+        self.__m2 += np.outer(f[:, r] - f[:, s], dp[:, s] - dp[:, r])
+        for mtx in (self.__m1, self.__m2):
+            mtx[:, [r, s]] = mtx[:, [s, r]]
+        dp[[r, s], :] = dp[[s, r], :]
+        dp[:, [r, s]] = dp[:, [s, r]]
+        self.assignment[[r, s]] = self.assignment[[s, r]]
+        self.__delta = None
+
+    def simulated_annealing(self, iterations, initial_temperature=None, final_temperature=None):
+        """ Improve current assignment with simulated annealing
+
+        Random swaps are accepted if they decrease a cost or with
+        exp(-delta / temperature) probability otherwise. Temperature
+        decreases geometrically from initial to final one.
+
+        :param iterations: int amount of swaps to evaluate
+        :param initial_temperature: float start temperature (None - mean
+               absolute swap delta of the start assignment). Defaults to None.
+        :param final_temperature: float end temperature (None - 0.1% of
+               initial one). Defaults to None.
+
+        :return: tuple (<NumPy_best_assignment>, <float_best_cost>)
+
+        """
+
+        n = self.size
+        best_assignment, best_cost = self.assignment.copy(), self.cost
+        if n < 2 or iterations <= 0:
+            return best_assignment, best_cost
+        if initial_temperature is None:
+            initial_temperature = float(np.abs(self.get_delta_matrix()).sum()) / (n * (n - 1)) or 1.0
+        if final_temperature is None:
+            final_temperature = initial_temperature * 1e-3
+        cooling = (final_temperature / initial_temperature) ** (1.0 / iterations)
+
+        rand, randrange, get_delta = self.random.random, self.random.randrange, self.get_cached_swap_delta
+        temperature = initial_temperature
+        for _ in range(iterations):
+            r = randrange(n)
+            s = randrange(n - 1)
+            s += s >= r
+            delta = get_delta(r, s)
+            if delta < 0 or rand() < exp(-delta / temperature):
+                self.swap(r, s, delta)
+                if self.cost < best_cost - 1e-9:
+                    best_assignment, best_cost = self.assignment.copy(), self.cost
+            temperature *= cooling
+        self.swaps_evaluated += iterations
+        return best_assignment, best_cost
+
+    def tabu_search(self, iterations, tenure=None, stop=None, check_interval=1):
+        """ Improve current assignment with robust tabu search
+
+        Every iteration performs the best swap of the whole neighbourhood
+        unless it moves both departments back to slots they occupied
+        recently (tabu), which is allowed only if it leads to a new best
+        cost (aspiration). Tabu tenure is randomized around n each iteration.
+
+        :param iterations: int amount of performed swaps
+        :param tenure: (<int_min>, <int_max>) tabu tenure range (None - 0.9n..1.1n).
+               Defaults to None.
+        :param stop: callable returning True if the search should end early
+               (None - all the iterations are performed). Defaults to None.
+        :param check_interval: int amount of iterations between stop() calls. Defaults to 1.
+
+        :return: tuple (<NumPy_best_assignment>, <float_best_cost>)
+
+        """
+
+        n = self.size
+        best_assignment, best_cost = self.assignment.copy(), self.cost
+        if n < 2 or iterations <= 0:
+            return best_assignment, best_cost
+        tenure = tenure if tenure else (max(int(0.9 * n), 1), max(int(1.1 * n) + 1, 2))
+        tabu = np.zeros((n, n), dtype=np.int64)  # [department, slot] -> iteration the move is tabu until
+        upper = np.triu(np.ones((n, n), dtype=bool), 1)
+        departments = np.arange(n)
+
+        performed = 0
+        for it in range(1, iterations + 1):
+            if stop is not None and (it - 1) % check_interval == 0 and stop():
+                break
+            performed = it
+            delta = self.get_delta_matrix()
+            tabu_until = tabu[departments[:, None], self.assignment[None, :]]  # [r, s] -> tabu of r moving to slot of s
+            forbidden = (tabu_until >= it) & (tabu_until.T >= it)
+            allowed = upper & (~forbidden | (self.cost + delta < best_cost - 1e-9))
+            if not allowed.any():
+                allowed = upper
+            pos = int(np.argmin(np.where(allowed, delta, np.inf)))
+            r, s = divmod(pos, n)
+
+            # forbid both departments to return to their current slots for a while
+            tabu[r, self.assignment[r]] = it + self.random.randint(*tenure)
+            tabu[s, self.assignment[s]] = it + self.random.randint(*tenure)
+            self.swap(r, s, delta[r, s])
+            if self.cost < best_cost - 1e-9:
+                best_assignment, best_cost = self.assignment.copy(), self.cost
+        self.swaps_evaluated += performed * n * (n - 1) // 2
+        return best_assignment, best_cost
+
+    def __compute_delta_matrix(self):
+        """ Calculate cost changes of all the swaps out of cached products
+
+        :return: m x m NumPy array (diagonal is zero)
+
+        """
+
+        f, dp, m1, m2 = self.flow, self.__dp, self.__m1, self.__m2
+        fd, dd, d1, d2 = np.diag(f), np.diag(dp), np.diag(m1), np.diag(m2)
+
+        # swapped departments exchange their flows to all the other ones
+        delta = m1 + m1.T - d1[:, None] - d1[None, :] + m2 + m2.T - d2[:, None] - d2[None, :]
+
+        # terms between two swapped departments were counted above as if they were other ones
+        delta -= (fd[:, None] - f.T) * (dp.T - dd[:, None]) + (f - fd[None, :]) * (dd[None, :] - dp)
+        delta -= (fd[:, None] - f) * (dp - dd[:, None]) + (f.T - fd[None, :]) * (dd[None, :] - dp.T)
+        delta += (fd[:, None] - fd[None, :]) * (dd[None, :] - dd[:, None]) + (f - f.T) * (dp.T - dp)
+        np.fill_diagonal(delta, 0)
+        return delta
+
+
+def get_layout_problem(facility):
+    """ Compose a layout problem out of a facility
+
+    Slots are current department locations. Distance between two slots
+    is a distance from factory_layout.json where known and a distance
+    between department centroids otherwise (see
+    Facility.get_layout_distance_matrix()). Departments are assumed to
+    fit any slot (equal area QAP).
+
+    :param facility: Facility instance
+
+    :return: tuple (<list_of_department_labels>, <flow_matrix>, <distance_matrix>)
+
+    """
+
+    labels = [dep.label for dep in facility.get_departments()]
+    return labels, facility.get_flow_matrix(), facility.get_layout_distance_matrix()
+
+
+def optimize_layout(facility, annealing_iterations=200000, tabu_iterations=1000, seed=None):
+    """ Search for a department layout with a minimal flow x distance cost
+
+    Simulated annealing explores the search space first and robust tabu
+    search intensifies around the best assignment it has found.
+
+    :param facility: Facility instance
+    :param annealing_iterations: int amount of annealing swaps. Defaults to 200000.
+    :param tabu_iterations: int amount of tabu search swaps. Defaults to 1000.
+    :param seed: int random seed (None - random). Defaults to None.
+
+    :return: tuple (<layout>, <float_cost>, <float_current_layout_cost>) where
+             layout is a dictionary of department labels and labels of
+             departments which slots they should take
+
+    """
+
+    labels, flow, distance = get_layout_problem(facility)
+    optimizer = LayoutOptimizer(flow, distance, seed)
+    current_cost = optimizer.cost
+    best_assignment, best_cost = optimizer.simulated_annealing(annealing_iterations)
+    optimizer.set_assignment(best_assignment)
+    best_assignment, best_cost = optimizer.tabu_search(tabu_iterations)
+    return {label: labels[slot] for label, slot in zip(labels, best_assignment.tolist())}, best_cost, current_cost
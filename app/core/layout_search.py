@@ -0,0 +1,208 @@
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+from app.core.layout_optimizer import *
+import multiprocessing
+import numpy as np
+import os
+import time
+
+""" layout_search.py
+
+    Parallel multi-start layout search. Independent restarts (random
+    start assignments, own seeds and temperature schedules) run in a
+    process pool. Flow and distance matrices are copied into shared
+    memory once and mapped by every worker, so tasks carry only a seed
+    and a schedule. Workers publish their best costs into a shared
+    best-so-far value and stop at the next check when a target cost is
+    reached or a time limit runs out.
+
+    Restart seeds are derived from a single seed, so a search with the
+    same arguments gives the same result regardless of the amount of
+    workers (unless it's stopped early).
+
+    """
+
+# (<initial_temperature_scale>, <final_to_initial_temperature_ratio>) pairs; initial
+# temperature is a scale multiplied by a mean absolute swap delta of a start assignment
+TEMPERATURE_SCHEDULES = ((1.0, 1e-3), (0.5, 1e-3), (2.0, 1e-4), (0.25, 1e-2))
+
+_worker_state = {}  # shared problem of a worker process (set by _init_worker())
+
+
+def search_layout(flow, distance, restarts=None, annealing_iterations=200000, tabu_iterations=1000, seed=None,
+                  max_workers=None, time_limit=None, target_cost=None, schedules=TEMPERATURE_SCHEDULES,
+                  check_interval=10000, prune_gap=None):
+    """ Run independent layout search restarts in parallel and pick the best one
+
+    :param flow: n x n array of flows between departments (see LayoutOptimizer)
+    :param distance: m x m array of distances between slots (m >= n)
+    :param restarts: int amount of restarts (None - amount of workers). Defaults to None.
+    :param annealing_iterations: int amount of annealing swaps per restart. Defaults to 200000.
+    :param tabu_iterations: int amount of tabu search swaps per restart. Defaults to 1000.
+    :param seed: int seed restart seeds are derived from (None - random). Defaults to None.
+    :param max_workers: int amount of worker processes (None - amount of CPUs). Defaults to None.
+    :param time_limit: float amount of seconds after which restarts are stopped
+           and the best assignment found so far is returned (None - no limit). Defaults to None.
+    :param target_cost: float cost at which all the restarts are stopped (None - no target).
+           Defaults to None.
+    :param schedules: sequence of (<initial_temperature_scale>, <final_to_initial_ratio>)
+           annealing schedules assigned to restarts round robin. Defaults to TEMPERATURE_SCHEDULES.
+    :param check_interval: int amount of evaluated swaps between stop checks (a tabu search
+           iteration evaluates n^2 / 2 swaps). Defaults to 10000.
+    :param prune_gap: float relative gap (e.g. 0.05) to the best-so-far cost of all the restarts
+           above which a restart is abandoned after a half of its annealing (None - restarts
+           are never abandoned). Pruned results depend on timing. Defaults to None.
+
+    :return: tuple (<NumPy_best_assignment>, <float_best_cost>, <list_of_restart_results>) where
+             restart results are dictionaries with "seed", "schedule", "cost" (None if a
+             restart didn't run) and "swaps_evaluated" keys in restart order
+
+    :raises BadLayoutProblem
+    """
+
+    flow = np.asarray(flow, dtype=float)
+    distance = np.asarray(distance, dtype=float)
+    LayoutOptimizer(flow, distance)  # validate before workers are started
+    max_workers = max_workers or os.cpu_count() or 1
+    restarts = restarts or max_workers
+    seeds = [int(child.generate_state(1)[0]) for child in np.random.SeedSequence(seed).spawn(restarts)]
+
+    # matrices are shipped to workers once through shared memory
+    ctx = multiprocessing.get_context()
+    shared = []
+    for array in (flow, distance):
+        raw = ctx.RawArray('d', array.size)
+        np.frombuffer(raw, dtype=float).reshape(array.shape)[:] = array
+        shared.append((raw, array.shape))
+    best_so_far = ctx.Value('d', np.inf)
+    stop = ctx.Event()
+
+    deadline = time.monotonic() + time_limit if time_limit is not None else None
+    results = [{"seed": s, "schedule": tuple(schedules[i % len(schedules)]), "cost": None, "swaps_evaluated": 0}
+               for i, s in enumerate(seeds)]
+    assignments = [None] * restarts
+    with ProcessPoolExecutor(max_workers=min(max_workers, restarts), mp_context=ctx, initializer=_init_worker,
+                             initargs=(shared, best_so_far, stop, target_cost, prune_gap)) as executor:
+        futures = {executor.submit(_run_restart, s, results[i]["schedule"], annealing_iterations,
+                                   tabu_iterations, check_interval): i for i, s in enumerate(seeds)}
+        pending = set(futures)
+        while pending:
+            timeout = max(deadline - time.monotonic(), 0) if deadline is not None and not stop.is_set() else None
+            done, pending = wait(pending, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                stop.set()  # time is up: running restarts return at their next check and are waited for
+                for future in pending:
+                    future.cancel()
+            for future in done:
+                if future.cancelled():
+                    continue
+                i = futures[future]
+                assignments[i], results[i]["cost"], results[i]["swaps_evaluated"] = future.result()
+                if assignments[i] is None:
+                    results[i]["cost"] = None
+
+    finished = [i for i in range(restarts) if assignments[i] is not None]
+    if not finished:
+        return None, None, results
+    best = min(finished, key=lambda i: (results[i]["cost"], i))  # ties go to the earliest restart
+    return assignments[best], results[best]["cost"], results
+
+
+def optimize_layout_parallel(facility, **kwargs):
+    """ Search for a department layout with a minimal flow x distance cost in parallel
+
+    :param facility: Facility instance
+    :param kwargs: search_layout() keyword arguments
+
+    :return: tuple (<layout>, <float_cost>, <float_current_layout_cost>) like optimize_layout()
+             (layout is None if no restart finished in time)
+
+    """
+
+    labels, flow, distance = get_layout_problem(facility)
+    current_cost = LayoutOptimizer(flow, distance).cost
+    best_assignment, best_cost, _ = search_layout(flow, distance, **kwargs)
+    if best_assignment is None:
+        return None, None, current_cost
+    return {label: labels[slot] for label, slot in zip(labels, best_assignment.tolist())}, best_cost, current_cost
+
+
+def _init_worker(shared, best_so_far, stop, target_cost, prune_gap):
+    """ Map shared matrices in a worker process
+
+    :param shared: list of (<RawArray>, <shape>) of flow and distance matrices
+    :param best_so_far: shared double value of the best cost of all the restarts
+    :param stop: shared event set when restarts should stop
+    :param target_cost: float cost at which restarts stop or None
+    :param prune_gap: float relative gap to the best-so-far cost restarts are abandoned at or None
+
+    """
+
+    flow, distance = [np.frombuffer(raw, dtype=float).reshape(shape) for raw, shape in shared]
+    _worker_state.update(flow=flow, distance=distance, best_so_far=best_so_far, stop=stop, target_cost=target_cost,
+                         prune_gap=prune_gap)
+
+
+def _run_restart(seed, schedule, annealing_iterations, tabu_iterations, check_interval):
+    """ Run a single restart in a worker process
+
+    :param seed: int restart seed
+    :param schedule: (<initial_temperature_scale>, <final_to_initial_ratio>) tuple
+    :param annealing_iterations: int amount of annealing swaps
+    :param tabu_iterations: int amount of tabu search swaps
+    :param check_interval: int amount of evaluated swaps between stop checks
+
+    :return: tuple (<NumPy_best_assignment>, <float_best_cost>, <int_swaps_evaluated>)
+             (None, None, 0) if the search was stopped before the restart began
+
+    """
+
+    state = _worker_state
+    if state["stop"].is_set():
+        return None, None, 0
+    optimizer = LayoutOptimizer(state["flow"], state["distance"], seed)
+    start = list(range(optimizer.size))
+    optimizer.random.shuffle(start)
+    optimizer.set_assignment(start)
+    best_assignment, best_cost = optimizer.assignment.copy(), optimizer.cost
+    n = optimizer.size
+
+    # geometric annealing schedule split into chunks with stop checks in between
+    if n > 1 and annealing_iterations > 0:
+        scale, ratio = schedule
+        initial_temperature = scale * float(np.abs(optimizer.get_delta_matrix()).sum()) / (n * (n - 1)) or 1.0
+        cooling = ratio ** (1.0 / annealing_iterations)
+        done = 0
+        while done < annealing_iterations and not state["stop"].is_set():
+            chunk = min(check_interval, annealing_iterations - done)
+            assignment, cost = optimizer.simulated_annealing(chunk, initial_temperature * cooling ** done,
+                                                             initial_temperature * cooling ** (done + chunk))
+            done += chunk
+            if cost < best_cost:
+                best_assignment, best_cost = assignment, cost
+                _publish(best_cost)
+            if state["prune_gap"] is not None and 2 * done >= annealing_iterations and \
+                    best_cost > state["best_so_far"].value * (1 + state["prune_gap"]):
+                return best_assignment, best_cost, optimizer.swaps_evaluated  # hopeless restart
+
+    if not state["stop"].is_set():
+        optimizer.set_assignment(best_assignment)
+        tabu_check_interval = max(check_interval // max(n * (n - 1) // 2, 1), 1)  # in tabu iterations
+        best_assignment, best_cost = optimizer.tabu_search(tabu_iterations, stop=state["stop"].is_set,
+                                                           check_interval=tabu_check_interval)
+        _publish(best_cost)
+    return best_assignment, best_cost, optimizer.swaps_evaluated
+
+
+def _publish(cost):
+    """ Update the shared best-so-far cost and stop all the restarts if a target is reached
+
+    :param cost: float best cost of a restart
+
+    """
+
+    state = _worker_state
+    with state["best_so_far"].get_lock():
+        if cost < state["best_so_far"].value:
+            state["best_so_far"].value = cost
+    if state["target_cost"] is not None and cost <= state["target_cost"]:
+        state["stop"].set()
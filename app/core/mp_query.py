@@ -0,0 +1,150 @@
+from datetime import datetime
+
+""" mp_query.py
+
+    Composes masterplan extract queries with date range, main
+    item and department predicates, so filtering happens in a DB
+    and only the matching rows are transferred. Predicate values
+    are rendered as escaped SQL literals, since a parser accepts
+    a complete query text only.
+
+    """
+
+
+class FilterColumnNotConfigured(Exception):
+    """ Custom exception
+
+    Filter was requested but a DB column to apply it on isn't configured
+
+    """
+    pass
+
+
+class MPQueryBuilder(object):
+    """ Builds filtered masterplan extract queries on top of a base query
+
+    A base query is wrapped as a derived table, so predicates refer
+    to its output columns and it may have its own WHERE clause.
+
+    """
+
+    DATE_FORMAT = "%Y-%m-%d %X"
+
+    def __init__(self, base_query, columns):
+        """ Init method
+
+        :param base_query: string masterplan extract SELECT query
+        :param columns: dictionary of base query output column names with
+               optional "date", "src_dep", "dst_dep" and "main_item" keys
+
+        """
+
+        self.base_query = base_query.strip().rstrip(';')
+        self.columns = columns
+
+    def has_columns(self, *names):
+        """ Check if filter columns are configured
+
+        :param names: string column keys (e.g. "date")
+
+        :return: True if all the columns are configured, False otherwise
+
+        """
+
+        return all(name in self.columns for name in names)
+
+    def build_literal(self, date_from=None, date_to=None, main_item=None, dep_filter=None):
+        """ Build a query with predicate values rendered as escaped SQL literals
+
+        :param date_from: datetime lower date boundary (inclusive) or None
+        :param date_to: datetime upper date boundary (inclusive) or None
+        :param main_item: string main item to filter on or None
+        :param dep_filter: string department label (source or destination) to filter on or None
+
+        :return: string query
+
+        """
+
+        return self.__compose(self.__get_predicates(date_from, date_to, main_item, dep_filter))
+
+    @classmethod
+    def to_literal(cls, value):
+        """ Render a predicate value as an SQL literal
+
+        Quotes are the only characters special to a string literal
+        (backslashes and "%" are taken literally).
+
+        :param value: datetime, int or string value
+
+        :return: string SQL literal
+
+        """
+
+        if isinstance(value, datetime):
+            value = value.strftime(cls.DATE_FORMAT)
+        elif isinstance(value, bool):
+            return str(int(value))
+        elif isinstance(value, int):
+            return str(value)
+        return "'%s'" % str(value).replace("'", "''")
+
+    @classmethod
+    def fill_template(cls, template, value):
+        """ Substitute a value into a legacy query template as an SQL literal
+
+        A template has a single "%s" placeholder, which may be quoted
+        ('%s') or not, and "%%" for a percent sign.
+
+        :param template: string query template (e.g. "mi_mp_query" from configuration)
+        :param value: datetime, int or string value (see to_literal())
+
+        :return: string query
+
+        """
+
+        return template.replace("'%s'", "%s") % cls.to_literal(value)
+
+    def __get_predicates(self, date_from, date_to, main_item, dep_filter):
+        """ Get requested predicates
+
+        :return: list of string predicates
+
+        """
+
+        predicates = []
+        if date_from is not None:
+            predicates.append("%s >= %s" % (self.__get_column("date"), self.to_literal(date_from)))
+        if date_to is not None:
+            predicates.append("%s <= %s" % (self.__get_column("date"), self.to_literal(date_to)))
+        if main_item is not None:
+            predicates.append("%s = %s" % (self.__get_column("main_item"), self.to_literal(main_item)))
+        if dep_filter is not None:
+            predicates.append("(%s = %s OR %s = %s)" % (self.__get_column("src_dep"), self.to_literal(dep_filter),
+                                                        self.__get_column("dst_dep"), self.to_literal(dep_filter)))
+        return predicates
+
+    def __get_column(self, name):
+        """ Get a configured column name
+
+        :param name: string column key (e.g. "date")
+
+        :return: string column name
+
+        """
+
+        if name not in self.columns:
+            raise FilterColumnNotConfigured(name)
+        return self.columns[name]
+
+    def __compose(self, predicates):
+        """ Wrap a base query and append predicates
+
+        :param predicates: list of string predicates
+
+        :return: string query
+
+        """
+
+        if not predicates:
+            return self.base_query
+        return "SELECT * FROM (%s) AS mp WHERE %s" % (self.base_query, " AND ".join(predicates))
@@ -0,0 +1,243 @@
+from datetime import datetime, timedelta
+import numpy as np
+
+""" transport_cube.py
+
+    Pre-aggregated store of transportation records. Quantities
+    and record counts are bucketed per day x source department x
+    destination department x main item and kept in NumPy arrays,
+    so any date range / department / main item combination is
+    answered by masking and summing arrays instead of re-reading
+    records from a DB.
+
+    """
+
+
+class TransportCube(object):
+    """ Sparse (day, source, destination, main item) aggregate of transportation records
+
+    Date filters are applied with a day granularity (which is what
+    the dashboard sends: from 00:00:00 of the first day to 23:59:59
+    of the last one).
+
+    """
+
+    SECONDS_PER_DAY = 86400
+
+    def __init__(self, dep_labels):
+        """ Init method
+
+        :param dep_labels: iterable of string labels of facility departments.
+               Records mentioning other departments are kept only to
+               calculate date boundaries of the data.
+
+        """
+
+        self.dep_labels = list(dep_labels)
+        self.dep_index = {label: i for i, label in enumerate(self.dep_labels)}
+        self.unknown_dep = len(self.dep_labels)  # index of all the unknown departments
+        self.main_items = []  # main items (extract filters) loaded so far, None - all items
+        self.__empty()
+
+    def __empty(self):
+        """ Reset aggregate arrays """
+
+        self.days = np.zeros(0, dtype=np.int64)  # proleptic Gregorian ordinal of a day
+        self.src = np.zeros(0, dtype=np.int64)
+        self.dst = np.zeros(0, dtype=np.int64)
+        self.mi = np.zeros(0, dtype=np.int64)  # index in main_items
+        self.quantities = np.zeros(0, dtype=np.int64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        self.min_secs = np.zeros(0, dtype=np.int64)  # earliest record in a bucket (seconds since 0001-01-01)
+        self.max_secs = np.zeros(0, dtype=np.int64)  # latest record in a bucket
+
+    def has_main_item(self, main_item):
+        """ Check whether records of a main item extract were loaded
+
+        :param main_item: string main item or None for all the items
+
+        :return: True - extract is loaded. False - otherwise.
+
+        """
+
+        return main_item in self.main_items
+
+    def drop_main_items(self, main_items):
+        """ Forget extracts of main items (e.g. they are outdated)
+
+        :param main_items: iterable of string main items (None for all the items)
+
+        """
+
+        dropped = [i for i, main_item in enumerate(self.main_items) if main_item in set(main_items)]
+        if not dropped:
+            return
+        keep = ~np.isin(self.mi, dropped)
+        remap = np.cumsum([i not in dropped for i in range(len(self.main_items))]) - 1  # old -> new index
+        self.days, self.src, self.dst = self.days[keep], self.src[keep], self.dst[keep]
+        self.mi = remap[self.mi[keep]].astype(np.int64)
+        self.quantities, self.counts = self.quantities[keep], self.counts[keep]
+        self.min_secs, self.max_secs = self.min_secs[keep], self.max_secs[keep]
+        self.main_items = [main_item for i, main_item in enumerate(self.main_items) if i not in dropped]
+
+    def add_records(self, records, main_item=None, append=False):
+        """ Aggregate an extract of transportation records into the cube
+
+        Records previously loaded for the same main item are replaced
+        unless append is set.
+
+        :param records: iterable of (<src_dep_label>, <dest_dep_label>, <datetime>, <quant>)
+        :param main_item: string main item the extract was filtered on or
+               None if it holds all the items. Defaults to None.
+        :param append: bool add records (e.g. newer ones) to the already
+               loaded extract instead of replacing it. Defaults to False.
+
+        """
+
+        if main_item not in self.main_items:
+            self.main_items.append(main_item)
+        mi_idx = self.main_items.index(main_item)
+
+        days, src, dst, secs, quantities = [], [], [], [], []
+        for rec in records:
+            day = rec[2].toordinal()
+            days.append(day)
+            src.append(self.dep_index.get(rec[0], self.unknown_dep))
+            dst.append(self.dep_index.get(rec[1], self.unknown_dep))
+            secs.append(day * self.SECONDS_PER_DAY + rec[2].hour * 3600 + rec[2].minute * 60 + rec[2].second)
+            quantities.append(int(rec[3]))
+
+        keys = np.array([days, src, dst], dtype=np.int64).reshape((3, len(days))).T
+        uniq, inverse = np.unique(keys, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        n = len(uniq)
+        agg_quantities = np.zeros(n, dtype=np.int64)
+        np.add.at(agg_quantities, inverse, np.array(quantities, dtype=np.int64))
+        secs = np.array(secs, dtype=np.int64)
+        min_secs = np.full(n, np.iinfo(np.int64).max, dtype=np.int64)
+        max_secs = np.full(n, np.iinfo(np.int64).min, dtype=np.int64)
+        np.minimum.at(min_secs, inverse, secs)
+        np.maximum.at(max_secs, inverse, secs)
+
+        keep = np.ones(len(self.mi), dtype=bool) if append else self.mi != mi_idx
+        self.days = np.concatenate([self.days[keep], uniq[:, 0]])
+        self.src = np.concatenate([self.src[keep], uniq[:, 1]])
+        self.dst = np.concatenate([self.dst[keep], uniq[:, 2]])
+        self.mi = np.concatenate([self.mi[keep], np.full(n, mi_idx, dtype=np.int64)])
+        self.quantities = np.concatenate([self.quantities[keep], agg_quantities])
+        self.counts = np.concatenate([self.counts[keep], np.bincount(inverse, minlength=n).astype(np.int64)])
+        self.min_secs = np.concatenate([self.min_secs[keep], min_secs])
+        self.max_secs = np.concatenate([self.max_secs[keep], max_secs])
+
+    def merge(self, other, append=False):
+        """ Take over main item extracts loaded into another cube
+
+        Lets an extract be loaded aside and published at once, so
+        queries never see a partially loaded one. Records previously
+        loaded for the same main items are replaced unless append is set.
+
+        :param other: TransportCube instance with the same departments
+        :param append: bool add records of other cube to the already loaded
+               extracts instead of replacing them. Defaults to False.
+
+        """
+
+        for main_item in other.main_items:
+            if main_item not in self.main_items:
+                self.main_items.append(main_item)
+        remap = np.array([self.main_items.index(main_item) for main_item in other.main_items], dtype=np.int64)
+        keep = np.ones(len(self.mi), dtype=bool) if append else ~np.isin(self.mi, remap)
+        self.days = np.concatenate([self.days[keep], other.days])
+        self.src = np.concatenate([self.src[keep], other.src])
+        self.dst = np.concatenate([self.dst[keep], other.dst])
+        self.mi = np.concatenate([self.mi[keep], remap[other.mi]])
+        self.quantities = np.concatenate([self.quantities[keep], other.quantities])
+        self.counts = np.concatenate([self.counts[keep], other.counts])
+        self.min_secs = np.concatenate([self.min_secs[keep], other.min_secs])
+        self.max_secs = np.concatenate([self.max_secs[keep], other.max_secs])
+        if append:
+            self.compact()
+
+    def compact(self):
+        """ Merge buckets with the same (day, source, destination, main item) key
+
+        Appending extracts batch by batch leaves duplicate buckets
+        (which query() sums up anyway), so compact the cube once an
+        extract is loaded to keep it small.
+
+        """
+
+        keys = np.array([self.days, self.src, self.dst, self.mi], dtype=np.int64).reshape((4, len(self.days))).T
+        uniq, inverse = np.unique(keys, axis=0, return_inverse=True)
+        inverse = inverse.reshape(-1)
+        n = len(uniq)
+        quantities = np.zeros(n, dtype=np.int64)
+        counts = np.zeros(n, dtype=np.int64)
+        min_secs = np.full(n, np.iinfo(np.int64).max, dtype=np.int64)
+        max_secs = np.full(n, np.iinfo(np.int64).min, dtype=np.int64)
+        np.add.at(quantities, inverse, self.quantities)
+        np.add.at(counts, inverse, self.counts)
+        np.minimum.at(min_secs, inverse, self.min_secs)
+        np.maximum.at(max_secs, inverse, self.max_secs)
+
+        self.days, self.src, self.dst, self.mi = uniq[:, 0], uniq[:, 1], uniq[:, 2], uniq[:, 3]
+        self.quantities, self.counts, self.min_secs, self.max_secs = quantities, counts, min_secs, max_secs
+
+    def query(self, date_from=None, date_to=None, main_item=None, dep_filter=None):
+        """ Aggregate flows between departments for a filter set
+
+        :param date_from: datetime lower date boundary (inclusive day) or None
+        :param date_to: datetime upper date boundary (inclusive day) or None
+        :param main_item: string main item the extract was filtered on or None
+        :param dep_filter: string department label to filter on or None
+
+        :return: list [<flows>, <int_self_edges_weight>, <datetime_lower_date>, <datetime_upper_date>]
+                 where flows is a dictionary with (<src_dep_label>, <dest_dep_label>) keys
+                 and (<int_quantity>, <int_records_count>) values. Date boundaries are the
+                 earliest and the latest records of the main item extract (None if empty).
+
+        """
+
+        mask = self.mi == self.main_items.index(main_item) if main_item in self.main_items else \
+            np.zeros(len(self.mi), dtype=bool)
+
+        # data boundaries (over the whole extract)
+        lower = upper = None
+        if mask.any():
+            lower = self.__secs_to_datetime(int(self.min_secs[mask].min()))
+            upper = self.__secs_to_datetime(int(self.max_secs[mask].max()))
+
+        if date_from is not None:
+            mask &= self.days >= date_from.toordinal()
+        if date_to is not None:
+            mask &= self.days <= date_to.toordinal()
+        mask &= (self.src != self.unknown_dep) & (self.dst != self.unknown_dep)
+        if dep_filter is not None:
+            dep_idx = self.dep_index.get(dep_filter, -1)
+            mask &= (self.src == dep_idx) | (self.dst == dep_idx)
+
+        self_edges = mask & (self.src == self.dst)
+        self_edges_weight = int(self.quantities[self_edges].sum())
+
+        edges = mask & ~self_edges
+        n = len(self.dep_labels)
+        flat = self.src[edges] * n + self.dst[edges]
+        quantities = np.bincount(flat, weights=self.quantities[edges], minlength=n * n)
+        counts = np.bincount(flat, weights=self.counts[edges], minlength=n * n)
+        flows = {}
+        for pos in np.flatnonzero(counts).tolist():
+            flows[(self.dep_labels[pos // n], self.dep_labels[pos % n])] = (int(round(quantities[pos])),
+                                                                           int(round(counts[pos])))
+
+        return [flows, self_edges_weight, lower, upper]
+
+    def __secs_to_datetime(self, secs):
+        """ Convert seconds since 0001-01-01 back into a datetime
+
+        :param secs: int seconds
+
+        :return: datetime
+
+        """
+
+        return datetime.fromordinal(secs // self.SECONDS_PER_DAY) + timedelta(seconds=secs % self.SECONDS_PER_DAY)
@@ -0,0 +1,215 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+import logging
+import time
+
+""" viz_cache.py
+
+    In-process cache of assembled visualization JSON strings
+    keyed by a filter set, so repeated dashboard requests don't
+    trigger a facility rebuild and a full DB extract. Expired
+    entries may still be served while a single background
+    rebuild per filter set refreshes them.
+
+    """
+
+logger = logging.getLogger(__name__)
+
+
+class VizCache(object):
+    """ Size-bounded LRU cache with time-to-live for visualization JSON """
+
+    def __init__(self, max_size=32, ttl=300, timer=time.monotonic, stale_ttl=3600):
+        """ Init method
+
+        :param max_size - int maximum amount of cached entries. The least
+               recently used entry is evicted when it's exceeded.
+               Defaults to 32.
+        :param ttl - float amount of seconds an entry stays valid.
+               Defaults to 300.
+        :param timer - function returning current time in seconds.
+               Defaults to time.monotonic.
+        :param stale_ttl - float amount of seconds an expired entry can
+               still be served stale by get_entry(). Defaults to 3600.
+
+        """
+
+        self.max_size = max_size
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.timer = timer
+        self.__entries = OrderedDict()  # key -> (<timestamp>, <value>, <bool_unverified>)
+        self.__lock = Lock()
+
+    @staticmethod
+    def make_key(date_from=None, date_to=None, main_item=None, department=None):
+        """ Compose a cache key out of a filter set
+
+        :param date_from: string lower date boundary
+        :param date_to: string upper date boundary
+        :param main_item: string main item to filter on
+        :param department: string department label to filter on
+
+        :return: tuple key
+
+        """
+
+        return date_from, date_to, main_item, department
+
+    def get(self, key):
+        """ Get a cached value if it's present, verified and not expired
+
+        :param key: tuple key from make_key()
+
+        :return: cached value or None if there is no valid entry
+
+        """
+
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                return None
+            age = self.timer() - entry[0]
+            if age > self.ttl or entry[2]:
+                if age > self.ttl + self.stale_ttl:
+                    del self.__entries[key]  # expired ones are kept to be served stale
+                return None
+            self.__entries.move_to_end(key)
+            return entry[1]
+
+    def get_entry(self, key):
+        """ Get a cached value along with its age, even if it's expired
+
+        :param key: tuple key from make_key()
+
+        :return: tuple (<value>, <float_age_in_seconds>, <bool_stale>) or None
+                 if there is no entry younger than ttl + stale_ttl. An entry is
+                 stale if it's expired or it was put as unverified.
+
+        """
+
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                return None
+            age = self.timer() - entry[0]
+            if age > self.ttl + self.stale_ttl:
+                del self.__entries[key]
+                return None
+            self.__entries.move_to_end(key)
+            return entry[1], age, age > self.ttl or entry[2]
+
+    def put(self, key, value, age=0, unverified=False):
+        """ Cache a value evicting the least recently used entries if needed
+
+        :param key: tuple key from make_key()
+        :param value: value to cache
+        :param age: float amount of seconds passed since the value was
+               built (e.g. it's restored from a disk). Defaults to 0.
+        :param unverified: bool whether the value isn't known to match current
+               sources (e.g. it's restored from a disk). Unverified values are
+               served stale only (see get_entry()) until they are put again.
+               Defaults to False.
+
+        """
+
+        with self.__lock:
+            self.__entries[key] = (self.timer() - age, value, unverified)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.max_size:
+                self.__entries.popitem(last=False)
+
+    def invalidate(self, key=None):
+        """ Drop a single cached entry or the whole cache
+
+        :param key: tuple key from make_key(). If None, all the
+               entries are dropped. Defaults to None.
+
+        """
+
+        with self.__lock:
+            if key is None:
+                self.__entries.clear()
+            else:
+                self.__entries.pop(key, None)
+
+    def __len__(self):
+        with self.__lock:
+            return len(self.__entries)
+
+
+class SingleFlight(object):
+    """ Background thread pool running at most one job per key at a time
+
+    Submitting a job for a key that is already in flight returns
+    the in-flight job future, so concurrent requests for the same
+    filter set share one rebuild.
+
+    """
+
+    def __init__(self, max_workers=2):
+        """ Init method
+
+        :param max_workers - int amount of worker threads. Defaults to 2.
+
+        """
+
+        self.__executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="viz_rebuild")
+        self.__in_flight = {}  # key -> Future
+        self.__lock = Lock()
+
+    def submit(self, key, fn, *args, **kwargs):
+        """ Run a job in background unless a job for the key is already running
+
+        :param key: hashable job key (e.g. from VizCache.make_key())
+        :param fn: function to run
+        :param args: fn positional arguments
+        :param kwargs: fn keyword arguments
+
+        :return: concurrent.futures.Future of the (possibly already running) job
+
+        """
+
+        with self.__lock:
+            future = self.__in_flight.get(key)
+            if future is not None:
+                return future
+            future = self.__in_flight[key] = self.__executor.submit(fn, *args, **kwargs)
+        # a callback runs right away if a job is already done, so it's added without a lock
+        future.add_done_callback(lambda f: self.__done(key, f))
+        return future
+
+    def is_in_flight(self, key):
+        """ Check whether a job for a key is running
+
+        :param key: hashable job key
+
+        :return: True - job is running. False - otherwise.
+
+        """
+
+        with self.__lock:
+            return key in self.__in_flight
+
+    def __done(self, key, future):
+        """ Forget a finished job and log its failure
+
+        Nobody may wait for a background job, so its exception is logged
+        here (once per job) rather than left in a dropped future.
+
+        :param key: hashable job key
+        :param future: finished job future
+
+        """
+
+        if not future.cancelled() and future.exception() is not None:
+            logger.error("Background job %r failed", key, exc_info=future.exception())
+        with self.__lock:
+            if self.__in_flight.get(key) is future:
+                del self.__in_flight[key]
+
+
+# process-wide cache and rebuild workers used by the dashboard views
+viz_cache = VizCache()
+viz_rebuilds = SingleFlight()
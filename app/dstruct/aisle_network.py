@@ -0,0 +1,324 @@
+import numpy as np
+import heapq
+
+""" aisle_network.py
+
+    Network of aisles (corridors) parts travel along on a factory
+    floor. Aisles are polylines connected where they share a point.
+    Arbitrary points (department vertices) are snapped onto the nearest
+    aisle segment, so a routed distance between two points is an access
+    leg to an aisle, a travel along aisles and an access leg from it.
+
+    Shortest path trees of aisle junctions are calculated once and
+    cached, distances between a set of points are calculated into a
+    dense matrix at once. Flows are assigned to aisle segments tree by
+    tree with scatter-adds instead of walking every route.
+
+    """
+
+
+class BadAisleNetwork(Exception):
+    """ Custom exception
+
+    Aisle polyline has less than two points or
+    there are no aisle segments at all
+
+    """
+    pass
+
+
+class AisleNetwork(object):
+    """ Undirected network of aisle segments """
+
+    def __init__(self, polylines):
+        """ Init method
+
+        :param polylines: list of aisles, every one is a list of at least
+               two [x, y] points. Aisles are connected at shared points.
+
+        :raises BadAisleNetwork
+        """
+
+        index = {}  # (x, y) -> junction index
+        coords = []
+        segments = []
+        for polyline in polylines:
+            if len(polyline) < 2:
+                raise BadAisleNetwork("aisle must have at least two points")
+            prev = None
+            for x, y in polyline:
+                point = (float(x), float(y))
+                if point not in index:
+                    index[point] = len(coords)
+                    coords.append(point)
+                if prev is not None and prev != index[point]:
+                    segments.append((prev, index[point]))
+                prev = index[point]
+        if not segments:
+            raise BadAisleNetwork("there are no aisle segments")
+
+        self.coords = np.array(coords, dtype=float)
+        self.segments = np.array(segments, dtype=np.int64)  # (m, 2) junction indices
+        self.lengths = np.sqrt(((self.coords[self.segments[:, 1]] - self.coords[self.segments[:, 0]]) ** 2).sum(1))
+        self.adjacency = [[] for _ in coords]  # junction -> [(<junction>, <length>, <segment>)]
+        for i, ((a, b), length) in enumerate(zip(segments, self.lengths.tolist())):
+            self.adjacency[a].append((b, length, i))
+            self.adjacency[b].append((a, length, i))
+        self.__trees = {}  # junction -> (<distances>, <predecessor_segments>)
+        self.__tree_levels = {}  # junction -> [(<junctions>, <parent_junctions>)] from the deepest level
+
+    def snap(self, points):
+        """ Snap points onto the nearest aisle segments
+
+        :param points: (k, 2) array of point coordinates
+
+        :return: tuple of NumPy arrays (<segment_indices>, <positions>, <access_distances>)
+                 where a position is a fraction of a segment from it's first
+                 junction and an access distance is a distance from a point to
+                 the aisle
+
+        """
+
+        points = np.asarray(points, dtype=float).reshape((-1, 2))
+        start = self.coords[self.segments[:, 0]]
+        direction = self.coords[self.segments[:, 1]] - start
+        rows = np.arange(len(points))
+        segment_idx = np.empty(len(points), dtype=np.int64)
+        positions = np.empty(len(points))
+        access = np.empty(len(points))
+        chunk = max(1, (1 << 20) // len(self.segments))  # bound (k, m) temporary arrays
+        for lo in range(0, len(points), chunk):
+            p = points[lo:lo + chunk, None, :]
+            t = np.clip(((p - start) * direction).sum(2) / self.lengths ** 2, 0, 1)
+            d = np.sqrt(((p - start - t[:, :, None] * direction) ** 2).sum(2))
+            best = d.argmin(1)
+            segment_idx[lo:lo + chunk] = best
+            positions[lo:lo + chunk] = t[rows[:len(best)], best]
+            access[lo:lo + chunk] = d[rows[:len(best)], best]
+        return segment_idx, positions, access
+
+    def get_shortest_path_tree(self, source):
+        """ Get (cached) shortest path tree of a junction
+
+        :param source: int junction index
+
+        :return: tuple of NumPy arrays (<distances>, <predecessor_segments>) where
+                 a predecessor segment of a junction is the last segment of it's
+                 shortest path from the source (-1 for the source and unreachable ones)
+
+        """
+
+        if source not in self.__trees:
+            n = len(self.coords)
+            dist = [float("Inf")] * n
+            pred = [-1] * n
+            settled = [False] * n
+            dist[source] = 0.
+            heap = [(0., source)]
+            while heap:
+                d, u = heapq.heappop(heap)
+                if settled[u]:
+                    continue
+                settled[u] = True
+                for v, length, segment in self.adjacency[u]:
+                    if d + length < dist[v]:
+                        dist[v] = d + length
+                        pred[v] = segment
+                        heapq.heappush(heap, (d + length, v))
+            self.__trees[source] = (np.array(dist), np.array(pred, dtype=np.int64))
+        return self.__trees[source]
+
+    def get_distance_matrix(self, points):
+        """ Get routed distances between all pairs of points
+
+        :param points: (k, 2) array of point coordinates
+
+        :return: k x k NumPy float array (inf if aisles of two points aren't
+                 connected, zero diagonal)
+
+        """
+
+        segment_idx, positions, access = self.snap(points)
+        return self.get_snapped_distance_matrix(segment_idx, positions, access)
+
+    def get_snapped_distance_matrix(self, segment_idx, positions, access):
+        """ Get routed distances between all pairs of snapped points (see snap())
+
+        :param segment_idx: NumPy array of segment indices
+        :param positions: NumPy array of positions along segments
+        :param access: NumPy array of access distances
+
+        :return: k x k NumPy float array
+
+        """
+
+        if not len(segment_idx):
+            return np.zeros((0, 0))
+        ends = self.segments[segment_idx]  # (k, 2) junctions of point segments
+        sources = np.unique(ends)
+        tree_dist = np.vstack([self.get_shortest_path_tree(source)[0] for source in sources.tolist()])
+        lengths = self.lengths[segment_idx]
+        offsets = (positions * lengths, (1 - positions) * lengths)  # travel to the first/second junction
+
+        # leave own segment through one of it's junctions and enter the other one through one of it's junctions
+        dist = np.full((len(segment_idx), len(segment_idx)), np.inf)
+        for side_a in (0, 1):
+            rows = tree_dist[np.searchsorted(sources, ends[:, side_a])]
+            for side_b in (0, 1):
+                dist = np.minimum(dist, offsets[side_a][:, None] + rows[:, ends[:, side_b]] + offsets[side_b][None, :])
+
+        # points on the same segment may travel along it directly
+        same = segment_idx[:, None] == segment_idx[None, :]
+        direct = np.abs(positions[:, None] - positions[None, :]) * lengths[:, None]
+        dist = np.where(same, np.minimum(dist, direct), dist) + access[:, None] + access[None, :]
+        np.fill_diagonal(dist, 0)
+        return dist
+
+    def get_route(self, segment_a, position_a, segment_b, position_b):
+        """ Get aisle segments of a shortest route between two snapped points
+
+        :param segment_a: int segment index of a source point
+        :param position_a: float position along it
+        :param segment_b: int segment index of a destination point
+        :param position_b: float position along it
+
+        :return: tuple (<list_of_(segment, fraction_travelled)_tuples>, <float_length>)
+                 without access legs or None if there is no route
+
+        """
+
+        if segment_a == segment_b:
+            fraction = abs(position_a - position_b)
+            return [(segment_a, fraction)] if fraction else [], fraction * self.lengths[segment_a]
+
+        length_a, length_b = self.lengths[segment_a], self.lengths[segment_b]
+        best = None
+        for side_a, offset_a in ((0, position_a), (1, 1 - position_a)):
+            junction_a = self.segments[segment_a, side_a]
+            tree_dist, pred = self.get_shortest_path_tree(junction_a)
+            for side_b, offset_b in ((0, position_b), (1, 1 - position_b)):
+                junction_b = self.segments[segment_b, side_b]
+                length = offset_a * length_a + tree_dist[junction_b] + offset_b * length_b
+                if best is None or length < best[0]:
+                    best = (length, junction_a, offset_a, junction_b, offset_b, pred)
+        length, junction_a, offset_a, junction_b, offset_b, pred = best
+        if np.isinf(length):
+            return None
+
+        # walk a shortest path tree back from the destination junction
+        route = [(segment_b, offset_b)] if offset_b else []
+        junction = junction_b
+        while junction != junction_a:
+            segment = pred[junction]
+            route.append((int(segment), 1.))
+            a, b = self.segments[segment]
+            junction = a if b == junction else b
+        if offset_a:
+            route.append((segment_a, offset_a))
+        return route[::-1], float(length)
+
+    def assign_flows(self, segment_a, position_a, segment_b, position_b, quantities):
+        """ Route flows between snapped points over shortest paths and sum up quantities per segment
+
+        Quantities of flows leaving through the same junction are put on
+        their destination junctions and pushed up it's shortest path tree
+        level by level with scatter-adds, so a segment gets a total of all
+        the routes passing it without walking routes one by one. Segments
+        travelled only partially (at route ends) count the same as the
+        whole ones.
+
+        :param segment_a: array of segment indices of source points
+        :param position_a: array of positions of source points along them
+        :param segment_b: array of segment indices of destination points
+        :param position_b: array of positions of destination points along them
+        :param quantities: array of quantities transported
+
+        :return: tuple (<NumPy_float_quantities_per_segment>, <float_unrouted_quantity>)
+
+        """
+
+        segment_a, segment_b = np.asarray(segment_a, dtype=np.int64), np.asarray(segment_b, dtype=np.int64)
+        position_a, position_b = np.asarray(position_a, dtype=float), np.asarray(position_b, dtype=float)
+        quantities = np.asarray(quantities, dtype=float)
+        m, n = len(self.segments), len(self.coords)
+
+        # flows along a single segment
+        same = segment_a == segment_b
+        moved = same & (position_a != position_b)
+        loads = np.zeros(m)
+        loads += np.bincount(segment_a[moved], weights=quantities[moved], minlength=m)
+        segment_a, position_a = segment_a[~same], position_a[~same]
+        segment_b, position_b, quantities = segment_b[~same], position_b[~same], quantities[~same]
+        if not len(quantities):
+            return loads, 0.
+
+        # choose junctions to leave and enter segments through (in get_route() order)
+        ends_a, ends_b = self.segments[segment_a], self.segments[segment_b]
+        sources = np.unique(ends_a)
+        tree_dist = np.vstack([self.get_shortest_path_tree(source)[0] for source in sources.tolist()])
+        fractions_a, fractions_b = (position_a, 1 - position_a), (position_b, 1 - position_b)
+        lengths_a, lengths_b = self.lengths[segment_a], self.lengths[segment_b]
+        candidates = np.empty((len(quantities), 4))
+        for side_a in (0, 1):
+            rows = np.searchsorted(sources, ends_a[:, side_a])
+            for side_b in (0, 1):
+                candidates[:, 2 * side_a + side_b] = fractions_a[side_a] * lengths_a + \
+                    tree_dist[rows, ends_b[:, side_b]] + fractions_b[side_b] * lengths_b
+        choice = candidates.argmin(1)
+        flows = np.arange(len(quantities))
+        routed = np.isfinite(candidates[flows, choice])
+        unrouted = float(quantities[~routed].sum())
+        flows, choice = flows[routed], choice[routed]
+        side_a, side_b = choice // 2, choice % 2
+        quantities = quantities[flows]
+
+        # partially travelled end segments
+        partial_a = np.where(side_a == 0, position_a[flows], 1 - position_a[flows]) > 0
+        partial_b = np.where(side_b == 0, position_b[flows], 1 - position_b[flows]) > 0
+        loads += np.bincount(segment_a[flows][partial_a], weights=quantities[partial_a], minlength=m)
+        loads += np.bincount(segment_b[flows][partial_b], weights=quantities[partial_b], minlength=m)
+
+        # junction to junction parts: accumulate destination quantities up every tree
+        roots = ends_a[flows, side_a]
+        targets = ends_b[flows, side_b]
+        order = np.argsort(roots, kind="stable")
+        roots, targets, quantities = roots[order], targets[order], quantities[order]
+        bounds = np.flatnonzero(np.diff(roots)) + 1
+        for lo, hi in zip(np.r_[0, bounds].tolist(), np.r_[bounds, len(roots)].tolist()):
+            root = int(roots[lo])
+            subtree = np.bincount(targets[lo:hi], weights=quantities[lo:hi], minlength=n)
+            for junctions, parents in self.__get_tree_levels(root):
+                np.add.at(subtree, parents, subtree[junctions])
+            pred = self.get_shortest_path_tree(root)[1]
+            in_tree = pred >= 0
+            loads += np.bincount(pred[in_tree], weights=subtree[in_tree], minlength=m)
+        return loads, unrouted
+
+    def __get_tree_levels(self, source):
+        """ Get (cached) levels of a shortest path tree of a junction
+
+        :param source: int junction index
+
+        :return: list of (<junctions>, <parent_junctions>) NumPy array tuples from
+                 the deepest level to the one next to the source
+
+        """
+
+        if source not in self.__tree_levels:
+            pred = self.get_shortest_path_tree(source)[1]
+            junctions = np.flatnonzero(pred >= 0)
+            parent = np.full(len(pred), -1, dtype=np.int64)
+            parent[junctions] = self.segments[pred[junctions]].sum(1) - junctions  # other end of a segment
+
+            # depth of every junction (ancestors are followed for all the junctions at once)
+            depth = np.zeros(len(pred), dtype=np.int64)
+            ancestor = parent.copy()
+            has_ancestor = ancestor >= 0
+            while has_ancestor.any():
+                depth[has_ancestor] += 1
+                ancestor[has_ancestor] = parent[ancestor[has_ancestor]]
+                has_ancestor = ancestor >= 0
+            self.__tree_levels[source] = [(junctions[depth[junctions] == level],
+                                           parent[junctions[depth[junctions] == level]])
+                                          for level in range(int(depth.max()), 0, -1)]
+        return self.__tree_levels[source]
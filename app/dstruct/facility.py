@@ -1,4 +1,6 @@
 from app.dstruct.graph import *
+from app.dstruct.aisle_network import AisleNetwork
+import numpy as np
 
 
 class NonpositiveMaxCoordinates(Exception):
@@ -55,6 +57,24 @@ class DepartmentNotAdded(Exception):
     """
 
 
+class UnknownCostMetric(Exception):
+    """ Custom exception
+
+    Transport cost was requested for a metric other
+    than "distance" or "time"
+
+    """
+
+
+class BadLayouts(Exception):
+    """ Custom exception
+
+    Candidate layouts are not a K x n array of
+    permutations of department indices
+
+    """
+
+
 class DepartmentNotExist(Exception):
     """ Custom exception
 
@@ -117,6 +137,49 @@ class TransportationGraph(Graph):
 
         return self.add_edge(src_label, dest_label, quant)
 
+    def get_flows(self):
+        """ Get aggregated transported quantities between department points
+
+        :return dictionary where (<src_label>, <dest_label>) pairs are keys
+                and int quantities transported are values (can be used as
+                pair weights for calculate_brandes_betweenness())
+        """
+
+        return {(edge[0], edge[1]): edge[2] for edge in self.get_edges()}
+
+    def add_transp_records(self, records):
+        """ Add a batch of transportation records
+
+        Records are aggregated by (source, destination) pair
+        before insertion so every edge is touched only once.
+
+        :param records - iterable of (<src_label>, <dest_label>, <quant>)
+               tuples with the same meaning as add_transp_record()
+               parameters
+
+        :return - tuple of a dictionary where (<src_label>, <dest_label>)
+                  pairs are keys and EdgeNodes added or updated are values
+                  and an int total quantity of self-edge records skipped
+
+        :raises NodeNotExists
+        """
+
+        return self.add_edges_bulk(records)
+
+    def add_aggregated_transp_records(self, flows):
+        """ Add transportation records already aggregated by (source, destination) pair
+
+        :param flows - dictionary where (<src_label>, <dest_label>) pairs are
+               keys and (<total_quant>, <records_count>) pairs are values
+
+        :return - dictionary where (<src_label>, <dest_label>) pairs are keys
+                  and EdgeNodes added or updated are values
+
+        :raises NodeNotExists, SelfEdgesNotSupported
+        """
+
+        return self.add_aggregated_edges(flows)
+
 
 class Facility(object):
     """ Class to represent the whole factory layout
@@ -142,6 +205,10 @@ class Facility(object):
                 self.max_x = float(max_x)
                 self.max_y = float(max_y)
                 self.d_graph = TransportationGraph()
+                self.pair_info = {}  # (<dep_label_1>, <dep_label_2>) -> [<distance>, <time>] (both orientations)
+                self.__pair_matrices = None  # cached (<distance_matrix>, <time_matrix>)
+                self.aisle_network = None
+                self.vertex_snaps = None  # (<segment_indices>, <positions>, <access_distances>) of graph vertices
             else:
                 raise NonpositiveMaxCoordinates("facility max_x and max_y must be positive!")
         else:
@@ -160,6 +227,7 @@ class Facility(object):
         """
         if self.__fits_boundary(department):
             self.d_graph.add_department(department)
+            self.__pair_matrices = None
             return True
         else:
             return False
@@ -186,6 +254,315 @@ class Facility(object):
 
         return self.d_graph.departments
 
+    def get_department_index(self):
+        """ Get positions of departments (in get_departments() order)
+
+        :return: dictionary where department labels are keys and int indices are values
+
+        """
+
+        return {dep.label: i for i, dep in enumerate(self.get_departments())}
+
+    def set_distances(self, distances):
+        """ Load distances and times of travel between departments
+
+        A pair listed in one orientation only applies to both of them.
+        If both orientations are listed, each one keeps its own values.
+
+        :param distances - dictionary where department labels are keys and
+               dictionaries of department labels and [<distance>, <time>]
+               lists are values (as "distances" of factory_layout.json)
+
+        """
+
+        pair_info = {}
+        for dep_label_1, row in distances.items():
+            for dep_label_2, info in row.items():
+                pair_info.setdefault((dep_label_2, dep_label_1), list(info))
+        for dep_label_1, row in distances.items():
+            for dep_label_2, info in row.items():
+                pair_info[(dep_label_1, dep_label_2)] = list(info)
+        self.pair_info = pair_info
+        self.__pair_matrices = None
+
+    def get_distance_and_time(self, dep_label_1, dep_label_2):
+        """ Get distance and time of travel between two departments
+
+        :param dep_label_1: string department 1 label
+        :param dep_label_2: string department 2 label
+
+        :return: list [<distance>, <time>] or None if there is no information
+
+        """
+
+        return self.pair_info.get((dep_label_1, dep_label_2))
+
+    def get_distance_matrices(self):
+        """ Get dense distance and time matrices of departments
+
+        Rows and columns follow get_department_index(). Pairs without
+        information are NaN. Matrices are read-only and cached until
+        departments or distances change.
+
+        :return: tuple (<distance_matrix>, <time_matrix>) of n x n NumPy float arrays
+
+        """
+
+        if self.__pair_matrices is None:
+            dep_index = self.get_department_index()
+            n = len(dep_index)
+            distance_mtx = np.full((n, n), np.nan)
+            time_mtx = np.full((n, n), np.nan)
+            for (dep_label_1, dep_label_2), (distance, time) in self.pair_info.items():
+                if dep_label_1 in dep_index and dep_label_2 in dep_index:
+                    i, j = dep_index[dep_label_1], dep_index[dep_label_2]
+                    distance_mtx[i, j] = distance if distance is not None else np.nan
+                    time_mtx[i, j] = time if time is not None else np.nan
+            distance_mtx.setflags(write=False)
+            time_mtx.setflags(write=False)
+            self.__pair_matrices = (distance_mtx, time_mtx)
+        return self.__pair_matrices
+
+    def get_flow_matrix(self):
+        """ Get transported quantities between departments as a dense matrix
+
+        Flows between all the vertices of two departments are summed up.
+
+        :return: n x n NumPy int array (rows are sources, columns are
+                 destinations) following get_department_index()
+
+        """
+
+        snapshot = self.d_graph.freeze()
+        vertex_deps = self.__get_vertex_departments(snapshot)
+        n = len(self.get_departments())
+        flow_mtx = np.zeros((n, n), dtype=np.int64)
+        np.add.at(flow_mtx, (vertex_deps[snapshot.rows], vertex_deps[snapshot.indices]),
+                  np.nan_to_num(snapshot.weights).astype(np.int64))
+        return flow_mtx
+
+    def get_centroid_distance_matrix(self):
+        """ Get distances between department centroids
+
+        Distances are routed along aisles if an aisle network is set (see
+        set_aisle_network()) and Euclidean otherwise or if there is no route.
+
+        :return: n x n NumPy float array following get_department_index()
+
+        """
+
+        centroids = np.array([dep.centroid.get_coords_list() for dep in self.get_departments()], dtype=float)
+        centroids = centroids.reshape((len(centroids), 2))
+        distance_mtx = np.sqrt(((centroids[:, None, :] - centroids[None, :, :]) ** 2).sum(axis=2))
+        if self.d_graph.routed_distances is not None:
+            route_index, route_mtx = self.d_graph.routed_distances
+            idx = np.array([route_index.get(dep.label + ".centroid", -1) for dep in self.get_departments()],
+                           dtype=np.int64)
+            routed = np.where((idx[:, None] >= 0) & (idx[None, :] >= 0), route_mtx[idx[:, None], idx[None, :]], np.inf)
+            distance_mtx = np.where(np.isfinite(routed), routed, distance_mtx)
+        return distance_mtx
+
+    def get_layout_distance_matrix(self):
+        """ Get distances between department locations without gaps
+
+        Distances from factory_layout.json are used where known (see
+        get_distance_matrices()) and centroid distances otherwise (see
+        get_centroid_distance_matrix()). Diagonal is zero.
+
+        :return: n x n NumPy float array following get_department_index()
+
+        """
+
+        distance_mtx = self.get_distance_matrices()[0]
+        distance_mtx = np.where(np.isnan(distance_mtx), self.get_centroid_distance_matrix(), distance_mtx)
+        np.fill_diagonal(distance_mtx, 0)
+        return distance_mtx
+
+    def set_aisle_network(self, aisle_network):
+        """ Route distances between department vertices along aisles
+
+        Vertices of all the departments added so far are snapped to the
+        network and routed distances between all of them are calculated
+        at once, so lookups (get_routed_distance()) take O(1). They take
+        place of Euclidean distances in the facility graph (see
+        Graph.set_routed_distances()).
+
+        :param aisle_network - AisleNetwork instance or None to drop routing
+
+        """
+
+        self.aisle_network = aisle_network
+        if aisle_network is None:
+            self.vertex_snaps = None
+            self.d_graph.set_routed_distances(None, None)
+            return
+        snapshot = self.d_graph.freeze()
+        self.vertex_snaps = aisle_network.snap(snapshot.coords)
+        route_mtx = aisle_network.get_snapped_distance_matrix(*self.vertex_snaps)
+        route_mtx.setflags(write=False)
+        self.d_graph.set_routed_distances(dict(snapshot.label_index), route_mtx)
+
+    def get_routed_distance(self, src_label, dest_label):
+        """ Get a distance along aisles between two department vertices
+
+        :param src_label - string label of a source department vertex
+               (<department_label>.<department_vertex_label>)
+        :param dest_label - string label of a destination department vertex
+
+        :return: float distance or None if it's unknown
+
+        """
+
+        return self.d_graph.get_routed_distance(src_label, dest_label)
+
+    def get_aisle_loads(self):
+        """ Assign transported quantities to aisle segments
+
+        Every aggregated edge of the facility graph is routed along the
+        aisles between it's snapped vertices (see set_aisle_network() and
+        AisleNetwork.assign_flows()).
+
+        :return: dictionary with "segments" (list of [[x1, y1], [x2, y2], <int_quantity>]
+                 for every aisle segment) and "unrouted_quantity" (int quantity of
+                 edges without a route) keys or None if there is no aisle network
+
+        """
+
+        if self.aisle_network is None:
+            return None
+        snapshot = self.d_graph.freeze()
+        route_index = self.d_graph.routed_distances[0]
+        vertex_routes = np.array([route_index.get(label, -1) for label in snapshot.labels], dtype=np.int64)
+        src, dest = vertex_routes[snapshot.rows], vertex_routes[snapshot.indices]
+        known = (src >= 0) & (dest >= 0)
+        quantities = np.nan_to_num(snapshot.weights)
+        segment_idx, positions, _ = self.vertex_snaps
+        loads, unrouted = self.aisle_network.assign_flows(segment_idx[src[known]], positions[src[known]],
+                                                          segment_idx[dest[known]], positions[dest[known]],
+                                                          quantities[known])
+        unrouted += float(quantities[~known].sum())
+        segment_coords = self.aisle_network.coords[self.aisle_network.segments].tolist()
+        return {"segments": [[a, b, load] for (a, b), load in zip(segment_coords,
+                                                                   np.rint(loads).astype(np.int64).tolist())],
+                "unrouted_quantity": int(round(unrouted))}
+
+    def get_transport_cost(self, metric="distance"):
+        """ Get total transport cost with per-department breakdown
+
+        Cost of an edge is it's transported quantity multiplied by a
+        distance (or time) from edge info (see get_edge_transport_costs()).
+
+        :param metric: string "distance" or "time". Defaults to "distance".
+
+        :return: dictionary with "total" (float cost), "unknown_quantity"
+                 (quantity transported over edges without the metric) and
+                 "departments" (dictionary of department labels and
+                 {"outgoing": <float_cost>, "incoming": <float_cost>}) keys
+
+        :raises UnknownCostMetric
+        """
+
+        snapshot = self.d_graph.freeze()
+        costs = self.__get_edge_costs(snapshot, metric)
+        known = ~np.isnan(costs)
+        vertex_deps = self.__get_vertex_departments(snapshot)
+        n = len(self.get_departments())
+        outgoing = np.bincount(vertex_deps[snapshot.rows][known], weights=costs[known], minlength=n)
+        incoming = np.bincount(vertex_deps[snapshot.indices][known], weights=costs[known], minlength=n)
+        return {"total": float(costs[known].sum()),
+                "unknown_quantity": int(np.nan_to_num(snapshot.weights[~known]).sum()),
+                "departments": {dep.label: {"outgoing": float(outgoing[i]), "incoming": float(incoming[i])}
+                                for i, dep in enumerate(self.get_departments())}}
+
+    def get_edge_transport_costs(self, metric="distance"):
+        """ Get transport cost of every edge
+
+        :param metric: string "distance" or "time". Defaults to "distance".
+
+        :return: dictionary where (<src_label>, <dest_label>) pairs are keys and
+                 float costs (None if an edge has no distance/time info) are values
+
+        :raises UnknownCostMetric
+        """
+
+        snapshot = self.d_graph.freeze()
+        costs = self.__get_edge_costs(snapshot, metric).tolist()
+        labels = snapshot.labels
+        return {(labels[src], labels[dest]): (cost if cost == cost else None)  # NaN != NaN
+                for src, dest, cost in zip(snapshot.rows.tolist(), snapshot.indices.tolist(), costs)}
+
+    def score_layouts(self, layouts, metric="distance", batch_size=None):
+        """ Get transport costs of a batch of candidate layouts
+
+        A layout is a permutation where i-th item is an index of the
+        department (see get_department_index()) which place i-th
+        department takes. Cost of a layout is a sum of department flows
+        multiplied by distances (times) between their new places. Missing
+        distances are filled in the same way as for layout optimisation
+        (see get_layout_distance_matrix()), pairs without time information
+        add nothing. Identity layout costs the same as get_transport_cost()
+        total if edge info follows a complete distance table.
+
+        :param layouts: K x n int array (or a single layout of length n)
+        :param metric: string "distance" or "time". Defaults to "distance".
+        :param batch_size: int amount of layouts scored at once (None - as
+               many as fit into ~32 MB of temporary arrays). Defaults to None.
+
+        :return: NumPy float array of K costs
+
+        :raises UnknownCostMetric, BadLayouts
+        """
+
+        if metric not in ("distance", "time"):
+            raise UnknownCostMetric(metric)
+        n = len(self.get_departments())
+        layouts = np.asarray(layouts, dtype=np.int64)
+        if layouts.ndim == 1:
+            layouts = layouts[None, :]
+        if layouts.ndim != 2 or layouts.shape[1] != n or \
+                (layouts.size and not (np.sort(layouts, axis=1) == np.arange(n)).all()):
+            raise BadLayouts("layouts must be a K x %d array of permutations" % n)
+
+        flow = self.get_flow_matrix().astype(float)
+        if metric == "distance":
+            metric_mtx = self.get_layout_distance_matrix()
+        else:
+            metric_mtx = np.nan_to_num(self.get_distance_matrices()[1])
+        batch_size = batch_size or max(1, (1 << 22) // max(n * n, 1))
+        scores = np.empty(len(layouts))
+        for start in range(0, len(layouts), batch_size):
+            batch = layouts[start:start + batch_size]
+            scores[start:start + len(batch)] = np.einsum("ij,kij->k", flow,
+                                                         metric_mtx[batch[:, :, None], batch[:, None, :]])
+        return scores
+
+    def __get_vertex_departments(self, snapshot):
+        """ Get department indices of snapshot vertices
+
+        :param snapshot: GraphSnapshot of the facility graph
+
+        :return: NumPy int array following snapshot vertex order
+
+        """
+
+        dep_index = self.get_department_index()
+        return np.array([dep_index[label.split('.')[0]] for label in snapshot.labels], dtype=np.int64)
+
+    @staticmethod
+    def __get_edge_costs(snapshot, metric):
+        """ Multiply edge weights by distances or times from edge info
+
+        :param snapshot: GraphSnapshot of the facility graph
+        :param metric: string "distance" or "time"
+
+        :return: NumPy float array following snapshot edge order (NaN - no info)
+
+        """
+
+        if metric not in ("distance", "time"):
+            raise UnknownCostMetric(metric)
+        return snapshot.weights * (snapshot.distances if metric == "distance" else snapshot.times)
+
     def __fits_boundary(self, department):
         """ Check whether all points of a department fall into facility boundary (canvas)
 
@@ -230,3 +607,55 @@ class Facility(object):
             raise NotIntQuantity
 
         return self.d_graph.add_transp_record(src_label, dest_label, quant)  # raises errors on failure
+
+    def add_transp_records(self, records):
+        """ Add a batch of transportation records
+
+        Bulk version of add_transp_record(). Records are
+        aggregated by (source, destination) pair first and
+        self-edge quantities are summed up instead of being
+        rejected one by one.
+
+        :param records - iterable of (<src_label>, <dest_label>, <quant>)
+               tuples with the same meaning as add_transp_record()
+               parameters
+
+        :return - tuple of a dictionary where (<src_label>, <dest_label>)
+                  pairs are keys and EdgeNodes added or updated are values
+                  and an int total quantity of self-edge records skipped
+
+        """
+
+        return self.d_graph.add_transp_records(self.__validate_quantities(records))
+
+    def add_aggregated_transp_records(self, flows):
+        """ Add transportation records already aggregated by (source, destination) pair
+
+        :param flows - dictionary where (<src_label>, <dest_label>) pairs are
+               keys and (<total_quant>, <records_count>) pairs are values
+
+        :return - dictionary where (<src_label>, <dest_label>) pairs are keys
+                  and EdgeNodes added or updated are values
+
+        """
+
+        for quant, _ in flows.values():
+            if not isinstance(quant, int):
+                raise NotIntQuantity
+
+        return self.d_graph.add_aggregated_transp_records(flows)
+
+    @staticmethod
+    def __validate_quantities(records):
+        """ Generator: pass transportation records through making sure quantities are integers
+
+        :param records - iterable of (<src_label>, <dest_label>, <quant>) tuples
+
+        yield: (<src_label>, <dest_label>, <quant>) tuple
+
+        """
+
+        for record in records:
+            if not isinstance(record[2], int):
+                raise NotIntQuantity
+            yield record
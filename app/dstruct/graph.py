@@ -2,6 +2,7 @@ from math import sqrt, isinf, isnan
 import numpy as np
 from copy import copy
 from itertools import permutations
+import heapq
 
 """ graph.py
 
@@ -19,6 +20,21 @@ from itertools import permutations
     """
 
 
+# edge cost modes for shortest path algorithms (see Graph.get_edge_cost())
+WEIGHT_UNIT = "unit"
+WEIGHT_EDGE = "weight"
+WEIGHT_EUCLIDEAN = "euclidean"
+WEIGHT_DISTANCE = "distance"
+
+# all pairs shortest paths engines (see Graph.all_pairs_shortest_paths())
+APSP_AUTO = "auto"
+APSP_FLOYD_WARSHALL = "floyd_warshall"
+APSP_DIJKSTRA = "dijkstra"
+
+# edge density (E / V^2) below which APSP_AUTO picks repeated Dijkstra over Floyd-Warshall
+APSP_SPARSE_DENSITY = 0.05
+
+
 class NoCoordinatesPassed(Exception):
     """ Custom exception
 
@@ -121,6 +137,28 @@ class EdgeInfoDictKeyValueExists(Exception):
     """
 
 
+class UnknownShortestPathsStrategy(Exception):
+    """ Custom exception
+
+    Passed in shortest paths strategy is not one
+    of the supported ones
+
+    """
+
+    pass
+
+
+class BadHopsCount(ValueError):
+    """ Custom exception
+
+    Passed in maximum amount of hops is not
+    a positive integer
+
+    """
+
+    pass
+
+
 class VertexNodeData(object):
     """ An optional class to hold a graph vertex data if coordinates are enabled """
 
@@ -140,14 +178,17 @@ class VertexNodeData(object):
 class VertexNode(object):
     """ A class to hold a graph vertex """
 
-    def __init__(self, data):
+    def __init__(self, data, graph=None):
         """ Class instance initialization
 
         :param data - label of a vertex if has_coordinates is
                False. Otherwise VertexNodeData object.
+        :param graph - Graph instance that owns the vertex (to keep
+               it's label index consistent). Defaults to None.
 
         """
         self.__data = data
+        self.graph = graph
 
     def get_label(self):
         """ Return a label of a vertex
@@ -180,11 +221,16 @@ class VertexNode(object):
 
         """
 
+        old_label = self.get_label()
         if isinstance(self.__data, VertexNodeData):
             self.__data.label = label
         else:
             self.__data = label
 
+        # keep owner graph label index up to date
+        if self.graph is not None:
+            self.graph.reindex_vertex_label(self, old_label)
+
     def __str__(self):
         return "Vertex (%f, %f)" % (self.__data.x, self.__data.y)
 
@@ -223,11 +269,187 @@ class EdgeNode(object):
             raise EdgeInfoDictKeyValueExists("'%s' key exists in the info dictionary!")
 
         self.info_dict[key] = value
+        if self.vertex_node.graph is not None:
+            self.vertex_node.graph.invalidate_cache()  # snapshot holds edge info
 
     def __str__(self):
         return "Edge to %s with weight %s" % (self.vertex_node.get_label(), str(self.weight))
 
 
+class GraphSnapshot(object):
+    """ Read-only compressed sparse row (CSR) snapshot of a graph for analytics
+
+    Edges of vertex i (see Graph.get_vertex_indices()) are stored at
+    positions indptr[i]:indptr[i+1] of the edge arrays. The snapshot
+    doesn't follow graph changes - get a new one with Graph.freeze().
+
+    """
+
+    def __init__(self, graph):
+        """ Build a snapshot of a graph
+
+        :param graph - Graph instance to take a snapshot of
+
+        """
+
+        self.is_directed = graph.is_directed
+        self.labels, self.label_index = graph.get_vertex_indices()
+        n = len(self.labels)
+
+        columns = graph.get_deferred_edge_columns()
+        if columns is None:
+            indptr = [0]
+            indices = []
+            increment_counts = []
+            self.info_dicts = []
+            self.edge_weights = []  # original weights (keeping their types) for edge export
+            for label in self.labels:
+                for edge_node in graph.mapper[graph.label_mapper[label]]:
+                    indices.append(self.label_index[edge_node.vertex_node.get_label()])
+                    self.edge_weights.append(edge_node.weight)
+                    increment_counts.append(edge_node.increment_count)
+                    self.info_dicts.append(edge_node.info_dict)
+                indptr.append(len(indices))
+        else:
+            # edges weren't added yet: columns are ordered by source vertex index (keeping adjacency order)
+            remap = np.array([self.label_index[label] for label in columns["labels"]], dtype=np.int64)
+            src = remap[columns["src"]]
+            order = np.argsort(src, kind="stable")
+            indptr = np.concatenate(([0], np.cumsum(np.bincount(src, minlength=n))))
+            indices = remap[columns["dst"]][order]
+            increment_counts = np.asarray(columns["increment_counts"])[order]
+            order = order.tolist()
+            self.info_dicts = [columns["info_dicts"][pos] for pos in order]
+            self.edge_weights = [columns["weights"][pos] for pos in order]
+
+        self.indptr = self.__freeze(np.array(indptr, dtype=np.int64))
+        self.indices = self.__freeze(np.array(indices, dtype=np.int64))
+        self.weights = self.__freeze(np.array([weight if weight is not None else np.nan
+                                               for weight in self.edge_weights], dtype=float))
+        self.increment_counts = self.__freeze(np.array(increment_counts, dtype=np.int64))
+        self.distances = self.__freeze(np.array([self.__get_number(info, "distance") for info in self.info_dicts],
+                                                dtype=float))
+        self.times = self.__freeze(np.array([self.__get_number(info, "time") for info in self.info_dicts],
+                                            dtype=float))
+        self.rows = self.__freeze(np.repeat(np.arange(n, dtype=np.int64), np.diff(self.indptr)))
+        self.routes = np.full(len(indices), np.nan)  # routed distances of edges (NaN - unknown)
+        if graph.routed_distances is not None:
+            route_index, route_mtx = graph.routed_distances
+            vertex_routes = np.array([route_index.get(label, -1) for label in self.labels], dtype=np.int64)
+            src, dest = vertex_routes[self.rows], vertex_routes[self.indices]
+            known = (src >= 0) & (dest >= 0)
+            self.routes[known] = route_mtx[src[known], dest[known]]
+            self.routes[~np.isfinite(self.routes)] = np.nan
+        self.routes = self.__freeze(self.routes)
+        self.coords = None
+        if graph.has_coordinates:
+            coords = np.array([graph.label_mapper[label].get_coordinates() for label in self.labels], dtype=float)
+            self.coords = self.__freeze(coords.reshape((n, 2)))
+
+    @staticmethod
+    def __get_number(info_dict, key):
+        """ Get a numeric edge info value
+
+        :param info_dict - dictionary of edge info
+        :param key - string info key
+
+        :return: value or NaN if it's not set
+        """
+
+        value = info_dict.get(key)
+        return value if value is not None else np.nan
+
+    @staticmethod
+    def __freeze(array):
+        """ Make a NumPy array read-only
+
+        :param array - NumPy array
+
+        :return: the same array with writing disabled
+        """
+
+        array.setflags(write=False)
+        return array
+
+    def get_vertices_count(self):
+        """ Return an amount of vertices in the snapshot
+
+        :return: int amount of vertices
+        """
+
+        return len(self.labels)
+
+    def get_edges_count(self):
+        """ Return an amount of directed edges in the snapshot (both directions of undirected ones)
+
+        :return: int amount of edges
+        """
+
+        return len(self.indices)
+
+    def get_involved_vertices_count(self):
+        """ Return an amount of vertices that have outgoing edges
+
+        :return: int amount of vertices
+        """
+
+        return int(np.count_nonzero(np.diff(self.indptr)))
+
+    def get_costs(self, weight_mode=WEIGHT_UNIT):
+        """ Get costs of all the edges at once (see Graph.get_edge_cost())
+
+        :param weight_mode - how to weight edges. Defaults to WEIGHT_UNIT.
+
+        :return: NumPy array of edge costs aligned with indices array
+        """
+
+        if weight_mode == WEIGHT_UNIT:
+            return np.ones(len(self.indices))
+        elif weight_mode == WEIGHT_EDGE:
+            return self.weights.copy()
+        elif weight_mode in (WEIGHT_EUCLIDEAN, WEIGHT_DISTANCE):
+            if self.coords is None:
+                if weight_mode == WEIGHT_EUCLIDEAN:
+                    raise GraphHasNoCoordinatesForVertices("The graph instance has vertices with no coordinates!")
+                euclidean = np.ones(len(self.indices))
+            else:
+                euclidean = np.sqrt(((self.coords[self.rows] - self.coords[self.indices]) ** 2).sum(axis=1))
+            if weight_mode == WEIGHT_DISTANCE:
+                fallback = np.where(np.isnan(self.routes), euclidean, self.routes)
+                return np.where(np.isnan(self.distances), fallback, self.distances)
+            return euclidean
+        else:
+            raise BadEdgeWeight("Unknown weight mode '%s'!" % weight_mode)
+
+    def get_adjacency_lists(self, weight_mode=WEIGHT_UNIT):
+        """ Get adjacency lists over vertex indices
+
+        :param weight_mode - how to weight edges. Defaults to WEIGHT_UNIT.
+
+        :return list where i-th item is a list of (<j>, <cost>) tuples
+                for every edge from vertex i to vertex j
+        """
+
+        pairs = list(zip(self.indices.tolist(), self.get_costs(weight_mode).tolist()))
+        indptr = self.indptr.tolist()
+        return [pairs[indptr[i]:indptr[i + 1]] for i in range(0, len(self.labels))]
+
+    def get_edges(self):
+        """ Generator: get all edges of the snapshot one by one
+
+        Every undirected edge is yielded once.
+
+        yield: list [<src_node_label>, <dest_node_label>, <edge_weight>, <increment_count>, <info_dict>]
+
+        """
+
+        labels = self.labels
+        for pos, (i, j) in enumerate(zip(self.rows.tolist(), self.indices.tolist())):
+            if self.is_directed or i < j:
+                yield [labels[i], labels[j], self.edge_weights[pos], int(self.increment_counts[pos]),
+                       self.info_dicts[pos]]
+
+
 class Graph(object):
     """ Graph class that keeps track over oll the graph components
 
@@ -265,7 +487,75 @@ class Graph(object):
         self.has_coordinates = coordinates
         self.use_explicit_weight = explicit_weight
         self.aggregate_weight = aggregate_weight
-        self.mapper = {}
+        self.__mapper = {}  # VertexNode -> list of EdgeNodes (see mapper)
+        self.__edge_mapper = {}  # VertexNode -> {target VertexNode -> EdgeNode} adjacency index
+        self.__edge_loader = None  # function adding deferred edges (see defer_edges())
+        self.__edge_columns = None  # deferred edge columns getter or its cached result
+        self.label_mapper = {}  # label -> VertexNode index
+        self.coords_mapper = {}  # (x, y) -> VertexNode index (if coordinates are enabled)
+        self.analytics_cache = {}  # cached analytics results, cleared on every graph change
+        self.routed_distances = None  # (<label_index>, <matrix>) see set_routed_distances()
+
+    @property
+    def mapper(self):
+        """ Adjacency lists: VertexNode -> list of EdgeNodes of it's outgoing edges
+
+        Deferred edges (see defer_edges()) are added on the first access.
+        """
+
+        if self.__edge_loader is not None:
+            self.__add_deferred_edges()
+        return self.__mapper
+
+    @property
+    def edge_mapper(self):
+        """ Adjacency index: VertexNode -> {target VertexNode -> EdgeNode}
+
+        Deferred edges (see defer_edges()) are added on the first access.
+        """
+
+        if self.__edge_loader is not None:
+            self.__add_deferred_edges()
+        return self.__edge_mapper
+
+    def defer_edges(self, loader, get_columns):
+        """ Postpone adding edges until graph edges are accessed
+
+        Snapshots (see freeze()) are built out of edge columns meanwhile,
+        so analytics of a restored graph don't need edge objects at all.
+
+        :param loader - function with no arguments adding the edges to
+               the graph (called once, on the first mapper/edge_mapper access)
+        :param get_columns - function with no arguments returning a dictionary
+               of the same edges with "labels" (list of vertex labels), "src"
+               and "dst" (NumPy int arrays of indices into labels), "weights"
+               (list), "increment_counts" (NumPy int array) and "info_dicts"
+               (list of dictionaries) entries. Edges of every vertex follow
+               their adjacency order.
+        """
+
+        self.__edge_loader = loader
+        self.__edge_columns = get_columns
+        self.invalidate_cache()
+
+    def get_deferred_edge_columns(self):
+        """ Get columns of edges which weren't added yet (see defer_edges())
+
+        :return: dictionary of edge columns or None if there are no deferred edges
+        """
+
+        if self.__edge_loader is None:
+            return None
+        if callable(self.__edge_columns):
+            self.__edge_columns = self.__edge_columns()
+        return self.__edge_columns
+
+    def __add_deferred_edges(self):
+        """ Add deferred edges to the graph (see defer_edges()) """
+
+        loader = self.__edge_loader
+        self.__edge_loader = self.__edge_columns = None
+        loader()
 
     def add_vertex(self, label, x=None, y=None):
         """ Add a vertex to a graph
@@ -300,13 +590,15 @@ class Graph(object):
 
         # creating a vertex in a graph
         if self.has_coordinates:
-            v_node = VertexNode(VertexNodeData(label, x, y))
-            self.mapper[v_node] = []
-            return v_node
+            v_node = VertexNode(VertexNodeData(label, x, y), self)
+            self.coords_mapper[(x, y)] = v_node
         else:
-            v_node = VertexNode(label)
-            self.mapper[v_node] = []
-            return v_node
+            v_node = VertexNode(label, self)
+        self.mapper[v_node] = []
+        self.edge_mapper[v_node] = {}
+        self.label_mapper[label] = v_node
+        self.invalidate_cache()
+        return v_node
 
     def add_edge(self, va_label, vb_label, weight=None):
         """ Add an edge between vertices A and B to a graph
@@ -346,6 +638,89 @@ class Graph(object):
         else:
             return self.__add_edge(node_a, node_b, weight)
 
+    def add_edges_bulk(self, edges):
+        """ Add a batch of edges to a graph aggregating duplicates beforehand
+
+        Edges are grouped by (A, B) vertex pair first so every edge is
+        created or updated only once. Resulting weights and increment
+        counts are the same as if edges were passed to add_edge() one
+        by one. Self-edges are not inserted, their weights are summed up
+        instead.
+
+        :param edges - iterable of (<va_label>, <vb_label>, <weight>)
+               tuples. Weight is ignored unless use_explicit_weight
+               is enabled.
+
+        :return tuple - dictionary where (<va_label>, <vb_label>) pairs
+                are keys and add_edge() results are values as well as
+                a total weight of self-edges skipped.
+
+        :raises NodeNotExists, EdgeInsertionFailed, BadEdgeWeight
+        """
+
+        # stage 1: group edges by vertex pair
+        groups = {}
+        self_edges_weight = 0
+        for va_label, vb_label, weight in edges:
+            if self.use_explicit_weight and not (isinstance(weight, int) or isinstance(weight, float)):
+                raise BadEdgeWeight("Edge weight is not a number!")
+            if va_label == vb_label:
+                if not self.find_vertex_node_by_label(va_label):
+                    raise NodeNotExists("%s node does not exist! Failed to add an edge!" % va_label)
+                if self.debug:
+                    print("Self-edge between %s was NOT added!" % va_label)
+                self_edges_weight += weight if weight else 0
+                continue
+            key = (va_label, vb_label)
+            if not self.is_directed and key not in groups and (vb_label, va_label) in groups:
+                key = (vb_label, va_label)  # undirected edge is the same in both orientations
+            if key in groups:
+                if self.use_explicit_weight:
+                    groups[key][0] += weight  # implicit weights are ignored the same way add_edge() does
+                groups[key][1] += 1
+            else:
+                groups[key] = [weight, 1]
+
+        # stage 2: create or update every edge once
+        return self.add_aggregated_edges(groups), self_edges_weight
+
+    def add_aggregated_edges(self, aggregated):
+        """ Add edges which weights and counts were already aggregated
+
+        Every edge is created or updated once and ends up with the same
+        weight and increment count as if it was added with add_edge()
+        count times.
+
+        :param aggregated - dictionary where (<va_label>, <vb_label>) pairs
+               are keys and (<total_weight>, <count>) pairs are values
+
+        :return dictionary where (<va_label>, <vb_label>) pairs are keys
+                and add_edge() results are values
+
+        :raises NodeNotExists, SelfEdgesNotSupported, EdgeInsertionFailed, BadEdgeWeight
+        """
+
+        result = {}
+        for (va_label, vb_label), (weight, count) in aggregated.items():
+            if va_label == vb_label:
+                raise SelfEdgesNotSupported("Can't add a self edge for %s node! Multigraphs are not supported" %
+                                            va_label)
+            if count > 1 and not self.aggregate_weight:
+                raise EdgeInsertionFailed
+            node_a = self.find_vertex_node_by_label(va_label)
+            node_b = self.find_vertex_node_by_label(vb_label)
+            if not node_a or not node_b:
+                raise NodeNotExists("%s node does not exist! Failed to add an edge!" %
+                                    (va_label if not node_a else vb_label))
+            res = self.__add_edge(node_a, node_b, weight)
+            for edge_node in (res if isinstance(res, tuple) else (res,)):
+                if isinstance(edge_node, EdgeNode):
+                    edge_node.increment_count += count - 1
+            self.invalidate_cache()
+            result[(va_label, vb_label)] = res
+
+        return result
+
     def __add_edge(self, node_a, node_b, weight):
         """ Handle backend job to add an edge between two nodes
 
@@ -370,6 +745,7 @@ class Graph(object):
                 edge_node = self.__get_edge(node_a, node_b)
                 edge_node.weight = edge_node.weight + weight
                 edge_node.increment_count += 1
+                self.invalidate_cache()
                 if self.debug:
                     print("Edge was already present but it's weight was incremented")
                 if not self.is_directed:
@@ -395,23 +771,61 @@ class Graph(object):
                     edge_node.weight = def_weight
 
             if not self.__is_connected(node_a, node_b):
-                self.mapper[node_a].append(edge_node)
+                self.__link(node_a, edge_node)
             elif self.is_directed:
                 return EdgeInsertionFailed
             if not self.is_directed:
                 if not self.__is_connected(node_b, node_a):
                     edge_node_copy = copy(edge_node)
                     edge_node_copy.vertex_node = node_a
-                    self.mapper[node_b].append(edge_node_copy)
+                    self.__link(node_b, edge_node_copy)
                     return edge_node, edge_node_copy
                 return edge_node, None
             return edge_node
 
     def find_vertex_node_by_label(self, label):
-        for node in self.mapper:
-            if node.get_label() == label:
-                return node
-        return None
+        """ Find VertexNode given it's label if it exists
+
+        :param label - string label of a vertex
+
+        :return VertexNode node that has a label passed in. If
+                there is no such node returns None.
+        """
+
+        return self.label_mapper.get(label)
+
+    def reindex_vertex_label(self, v_node, old_label):
+        """ Update label index after a vertex label was changed
+
+        Called by VertexNode.set_label() so the label index
+        stays consistent with vertex labels.
+
+        :param v_node - VertexNode object which label was changed
+        :param old_label - string label the vertex had before
+        """
+
+        if self.label_mapper.get(old_label) is v_node:
+            del self.label_mapper[old_label]
+        self.label_mapper[v_node.get_label()] = v_node
+        self.invalidate_cache()
+
+    def invalidate_cache(self):
+        """ Drop all cached analytics results (called on every graph change) """
+
+        self.analytics_cache.clear()
+
+    def freeze(self):
+        """ Get a read-only CSR snapshot of the graph for analytics
+
+        The snapshot is cached until the graph changes (vertices, edges,
+        aggregated weights or edge info are added).
+
+        :return: GraphSnapshot instance
+        """
+
+        if "snapshot" not in self.analytics_cache:
+            self.analytics_cache["snapshot"] = GraphSnapshot(self)
+        return self.analytics_cache["snapshot"]
 
     def find_vertex_node_by_coordinates(self, x, y):
         """ Find VertexNode given it's coordinates if it exists
@@ -430,11 +844,7 @@ class Graph(object):
         if not self.has_coordinates:
             raise GraphHasNoCoordinatesForVertices("The graph instance has vertices with no coordinates!")
         else:
-            for node in self.mapper:
-                coords = node.get_coordinates()
-                if coords[0] == x and coords[1] == y:
-                    return node
-            return None
+            return self.coords_mapper.get((x, y))
 
     def __is_connected(self, node_a, node_b):
         """ Backend private method for determining whether two vertices are connected
@@ -445,10 +855,7 @@ class Graph(object):
         :return True - nodes are connected; False - otherwise
         """
 
-        for edge_node in self.mapper[node_a]:
-            if edge_node.vertex_node == node_b:
-                return True
-        return False
+        return node_b in self.edge_mapper[node_a]
 
     def __get_edge(self, node_a, node_b):
         """ Return an edge between two node object given that it exists
@@ -459,9 +866,18 @@ class Graph(object):
         :return: EdgeNode that connects node A and node B
         """
 
-        for edge_node in self.mapper[node_a]:
-            if edge_node.vertex_node == node_b:
-                return edge_node
+        return self.edge_mapper[node_a].get(node_b)
+
+    def __link(self, node_a, edge_node):
+        """ Attach an edge to a node adjacency list and adjacency index
+
+        :param node_a - VertexNode object the edge starts from
+        :param edge_node - EdgeNode object to attach
+        """
+
+        self.mapper[node_a].append(edge_node)
+        self.edge_mapper[node_a][edge_node.vertex_node] = edge_node
+        self.invalidate_cache()
 
     def build_adjacency_matrix(self, print_out=False):
         """ Build an adjacency matrix of the graph
@@ -473,19 +889,13 @@ class Graph(object):
                  of the graph
         """
 
-        # init a matrix
-        n = self.get_vertices_count()
+        snapshot = self.freeze()
+        n = snapshot.get_vertices_count()
         matrix = np.zeros(shape=(n, n))
-
-        # prepare a list of label-index mapping
-        key_list = sorted([k.get_label() for k in self.mapper])
-
-        for vertex_node, edge_nodes in self.mapper.items():
-            for edge_node in edge_nodes:
-                matrix[key_list.index(vertex_node.get_label())][key_list.index(edge_node.vertex_node.get_label())] = 1
+        matrix[snapshot.rows, snapshot.indices] = 1
 
         if print_out:
-            print(self.matrix_to_string(key_list, matrix))
+            print(self.matrix_to_string(snapshot.labels, matrix))
         return matrix
 
     def build_2hop_matrix(self, print_out=False):
@@ -502,7 +912,7 @@ class Graph(object):
         hop_mtrx = np.linalg.matrix_power(adj_mtrx, 2)
 
         if print_out:
-            print(self.matrix_to_string(sorted([k.get_label() for k in self.mapper]), hop_mtrx))
+            print(self.matrix_to_string(self.get_vertex_indices()[0], hop_mtrx))
         return hop_mtrx
 
     @staticmethod
@@ -548,52 +958,223 @@ class Graph(object):
 
         """
 
-        edges_to_ignore = {node.get_label(): [] for node in self.mapper.keys()}
+        edges_to_ignore = {node.get_label(): set() for node in self.mapper.keys()}
         for node, edge_list in self.mapper.items():
             for edge in edge_list:
                 node_0_label = node.get_label()
                 node_1_label = edge.vertex_node.get_label()
                 if self.is_directed or node_1_label not in edges_to_ignore[node_0_label]:
                     yield [node_0_label, node_1_label, edge.weight, edge.increment_count, edge.info_dict]
-                    edges_to_ignore[node_1_label].append(node_0_label)
+                    edges_to_ignore[node_1_label].add(node_0_label)
 
-    def floyd_warshall_shortest_paths(self, print_out=False):
+    def get_vertex_indices(self):
+        """ Get sorted vertex labels and their label-index mapping
+
+        Analytic methods (adjacency matrices, shortest paths etc.)
+        index vertices by their position in a sorted list of labels.
+        The result is cached until the graph changes.
+
+        :return tuple - list of sorted vertex labels and a dictionary
+                where labels are keys and their indices are values
+        """
+
+        if "vertex_indices" not in self.analytics_cache:
+            vert_list = sorted(self.label_mapper)
+            self.analytics_cache["vertex_indices"] = (vert_list, {label: i for i, label in enumerate(vert_list)})
+        return self.analytics_cache["vertex_indices"]
+
+    def get_edge_cost(self, vertex_node, edge_node, weight_mode=WEIGHT_UNIT):
+        """ Get a cost of an edge to use in shortest path algorithms
+
+        :param vertex_node - VertexNode object the edge starts from
+        :param edge_node - EdgeNode object of the edge
+        :param weight_mode - one of WEIGHT_UNIT (every edge costs 1),
+               WEIGHT_EDGE (edge weight), WEIGHT_EUCLIDEAN (distance between
+               vertices coordinates) or WEIGHT_DISTANCE ("distance" value
+               in the edge info dictionary falling back to a routed distance
+               (see set_routed_distances()), Euclidean distance or to 1
+               if graph has no coordinates).
+               Defaults to WEIGHT_UNIT.
+
+        :return: float cost of the edge
+        """
+
+        if weight_mode == WEIGHT_UNIT:
+            return 1.
+        elif weight_mode == WEIGHT_EDGE:
+            return float(edge_node.weight)
+        elif weight_mode == WEIGHT_DISTANCE and edge_node.info_dict.get("distance") is not None:
+            return float(edge_node.info_dict["distance"])
+        elif weight_mode in (WEIGHT_EUCLIDEAN, WEIGHT_DISTANCE):
+            if weight_mode == WEIGHT_DISTANCE:
+                routed = self.get_routed_distance(vertex_node.get_label(), edge_node.vertex_node.get_label())
+                if routed is not None:
+                    return routed
+            if not self.has_coordinates:
+                if weight_mode == WEIGHT_DISTANCE:
+                    return 1.
+                raise GraphHasNoCoordinatesForVertices("The graph instance has vertices with no coordinates!")
+            a_coords = vertex_node.get_coordinates()
+            b_coords = edge_node.vertex_node.get_coordinates()
+            return sqrt((a_coords[0] - b_coords[0]) ** 2 + (a_coords[1] - b_coords[1]) ** 2)
+        else:
+            raise BadEdgeWeight("Unknown weight mode '%s'!" % weight_mode)
+
+    def floyd_warshall_shortest_paths(self, print_out=False, weight_mode=WEIGHT_UNIT):
         """ Calculate all the shortest paths between all possible (i,j) vertices pairs
 
-        Uses Floyd-Warshall algorithm with a fixed weight of edges equal to 1. Read more at
+        Uses Floyd-Warshall algorithm relaxing all (i,j) pairs through
+        an intermediate vertex k at once with NumPy broadcasting. Read more at
         https://en.wikipedia.org/wiki/Floyd%E2%80%93Warshall_algorithm
 
+        :param print_out - boolean print matrices to a console.
+               Defaults to False.
+        :param weight_mode - how to weight edges, see get_edge_cost().
+               Defaults to WEIGHT_UNIT (every edge weight is equal to 1).
+
         :return tuple of NumPy matrix of shortest distances between any of two vertices and
-                NumPy nxt matrix to use for a path recovery
+                NumPy nxt matrix of vertex indices (in a sorted labels list) to use for a
+                path recovery. -1 in nxt means there is no path.
 
         """
 
-        n = self.get_vertices_count()  # getting an amount of vertices in the graph
-        vert_list = sorted([k.get_label() for k in self.mapper])  # getting a list of all vertex labels
+        snapshot = self.freeze()
+        n = snapshot.get_vertices_count()  # getting an amount of vertices in the graph
+        vert_list = snapshot.labels
         dist = np.full((n, n), np.inf)
-        nxt = np.full((n, n), np.nan)
-
-        for vertex_node, edge_nodes in self.mapper.items():
-            for edge_node in edge_nodes:
-                dist[vert_list.index(vertex_node.get_label())][vert_list.index(edge_node.vertex_node.get_label())] = 1
-                nxt[vert_list.index(vertex_node.get_label())][vert_list.index(edge_node.vertex_node.get_label())] = \
-                    ord(edge_node.vertex_node.get_label())
+        nxt = np.full((n, n), -1, dtype=np.int64)
+        dist[snapshot.rows, snapshot.indices] = snapshot.get_costs(weight_mode)
+        nxt[snapshot.rows, snapshot.indices] = snapshot.indices
 
         for k in range(0, n):
-            for i in range(0, n):
-                for j in range(0, n):
-                    if dist[i][k] + dist[k][j] < dist[i][j]:
-                        dist[i][j] = dist[i][k] + dist[k][j]
-                        nxt[i][j] = nxt[i][k]
+            candidate = dist[:, k, np.newaxis] + dist[np.newaxis, k, :]
+            improved = candidate < dist
+            dist = np.where(improved, candidate, dist)
+            nxt = np.where(improved, nxt[:, k, np.newaxis], nxt)
 
         if print_out:
             print(self.matrix_to_string(vert_list, dist))
             print(self.matrix_to_string(vert_list, nxt))
         return dist, nxt
 
+    def get_indexed_adjacency(self, weight_mode=WEIGHT_UNIT):
+        """ Build adjacency lists over vertex indices (see get_vertex_indices())
+
+        :param weight_mode - how to weight edges, see get_edge_cost().
+               Defaults to WEIGHT_UNIT.
+
+        :return list where i-th item is a list of (<j>, <cost>) tuples
+                for every edge from vertex i to vertex j
+        """
+
+        return self.freeze().get_adjacency_lists(weight_mode)
+
+    def dijkstra_shortest_paths(self, va_label, weight_mode=WEIGHT_UNIT, adj=None):
+        """ Calculate shortest paths from a single vertex to all the others
+
+        Uses heap-based Dijkstra algorithm. Read more at
+        https://en.wikipedia.org/wiki/Dijkstra%27s_algorithm
+
+        :param va_label - string label of a source vertex
+        :param weight_mode - how to weight edges, see get_edge_cost().
+               Defaults to WEIGHT_UNIT.
+        :param adj - adjacency lists from get_indexed_adjacency() to
+               reuse between calls. Built from scratch if not passed.
+
+        :return tuple of NumPy row of shortest distances from a source and
+                NumPy nxt row of vertex indices, i.e. the same rows as
+                floyd_warshall_shortest_paths() returns for the source.
+
+        :raises NodeNotExists
+        """
+
+        vert_list, vert_index = self.get_vertex_indices()
+        if va_label not in vert_index:
+            raise NodeNotExists("%s node does not exist!" % va_label)
+        if adj is None:
+            adj = self.get_indexed_adjacency(weight_mode)
+        return self.__dijkstra(adj, vert_index[va_label])
+
+    @staticmethod
+    def __dijkstra(adj, source):
+        """ Backend of dijkstra_shortest_paths() working on vertex indices
+
+        :param adj - adjacency lists from get_indexed_adjacency()
+        :param source - int index of a source vertex
+
+        :return tuple of NumPy distances row and NumPy nxt row
+        """
+
+        n = len(adj)
+        dist = [float("Inf")] * n
+        first_hop = [-1] * n
+        settled = [False] * n
+        dist[source] = 0.
+        heap = [(0., source)]
+        cycle = float("Inf")  # the shortest path back to the source
+        cycle_hop = -1
+
+        while heap:
+            d, u = heapq.heappop(heap)
+            if settled[u]:
+                continue
+            settled[u] = True
+            for v, cost in adj[u]:
+                nd = d + cost
+                if v == source:
+                    if nd < cycle:
+                        cycle = nd
+                        cycle_hop = v if u == source else first_hop[u]
+                elif nd < dist[v]:
+                    dist[v] = nd
+                    first_hop[v] = v if u == source else first_hop[u]
+                    heapq.heappush(heap, (nd, v))
+
+        # a path from a vertex to itself exists only through a cycle (like in Floyd-Warshall)
+        dist[source] = cycle
+        first_hop[source] = cycle_hop
+        return np.array(dist), np.array(first_hop, dtype=np.int64)
+
+    def all_pairs_shortest_paths(self, weight_mode=WEIGHT_UNIT, strategy=APSP_AUTO):
+        """ Calculate all the shortest paths between all possible (i,j) vertices pairs
+
+        :param weight_mode - how to weight edges, see get_edge_cost().
+               Defaults to WEIGHT_UNIT.
+        :param strategy - APSP_FLOYD_WARSHALL (dense graphs), APSP_DIJKSTRA
+               (Dijkstra from every vertex for sparse graphs) or APSP_AUTO
+               to pick one by edge density. Defaults to APSP_AUTO.
+
+        :return tuple of NumPy dist and nxt matrices in the same format as
+                floyd_warshall_shortest_paths() returns
+        """
+
+        n = self.get_vertices_count()
+        if strategy == APSP_AUTO:
+            edges_count = sum(len(edge_nodes) for edge_nodes in self.mapper.values())
+            strategy = APSP_DIJKSTRA if n and edges_count < APSP_SPARSE_DENSITY * n * n else APSP_FLOYD_WARSHALL
+
+        if strategy == APSP_FLOYD_WARSHALL:
+            return self.floyd_warshall_shortest_paths(weight_mode=weight_mode)
+        elif strategy == APSP_DIJKSTRA:
+            adj = self.get_indexed_adjacency(weight_mode)
+            dist = np.full((n, n), np.inf)
+            nxt = np.full((n, n), -1, dtype=np.int64)
+            for i in range(0, n):
+                dist[i], nxt[i] = self.__dijkstra(adj, i)
+            return dist, nxt
+        else:
+            raise UnknownShortestPathsStrategy("Unknown shortest paths strategy '%s'!" % strategy)
+
     def get_shortest_path_astar(self, va_label, vb_label, trace_area=False, interactive=False):
         """ Return shortest path between two nodes that was found by A* algorithm
 
+        Open set is kept in a binary heap and Euclidean heuristic for all
+        the vertices is calculated at once from a cached coordinates array.
+        Edges are as long as routed distances between their vertices (see
+        set_routed_distances()) or Euclidean distances if there are none.
+        Routes are never shorter than straight lines, so the heuristic
+        stays admissible.
+
         :param va_label - string label of a node A
         :param vb_label - string label of a node B
         :param trace_area - bool to enable tracing of
@@ -610,77 +1191,96 @@ class Graph(object):
         """
 
         # initialization
-        vert_list = sorted([k.get_label() for k in self.mapper])  # getting a list of all vertex labels
-        closed_set = []
-        open_set = [va_label]
+        vert_list, vert_index, coords = self.get_coordinates_index()
+        source = vert_index[va_label]
+        target = vert_index[vb_label]
+        h_score = np.sqrt(((coords - coords[target]) ** 2).sum(axis=1)).tolist()
+        get_routed_distance = self.get_routed_distance
+        xy = coords.tolist()
+        closed_set = set()
+        open_heap = [(h_score[source], source)]
         came_from = {}
-        g_score = {}
-        f_score = {}
-
-        # to store an amount of visited nodes
-        visited = []
+        g_score = {source: 0.}
 
-        for vert_label in vert_list:
-            g_score[vert_label] = float("Inf")
-            f_score[vert_label] = float("Inf")
-        g_score[va_label] = 0
-        f_score[va_label] = self.calculate_euclidean_distance(va_label, vb_label)
+        # to store visited nodes
+        visited = {source}
 
         if interactive:
             print(" * searching for a shortest path from %s to %s" % (va_label, vb_label))
             print(" * init ended. Entering main loop ...")
 
         # main loop
-        while open_set:
-            current = min({k: v for k, v in f_score.items() if k in open_set}.items(), key=lambda x: x[1])[0]
-            if current not in visited:
-                visited.append(current)
+        while open_heap:
+            current = heapq.heappop(open_heap)[1]
+            if current in closed_set:
+                continue  # stale heap entry
             if interactive:
-                print(" * open_set is " + str(open_set))
-                print(" * current set to %s" % current)
-            if current == vb_label:
+                print(" * open_set is " + str(sorted({vert_list[i] for _, i in open_heap
+                                                      if i not in closed_set} | {vert_list[current]})))
+                print(" * current set to %s" % vert_list[current])
+            if current == target:
                 if interactive:
                     print(" * reached target vertex. Reversing path ...")
-                total_path = [current]
+                total_path = [vert_list[current]]
                 while current in came_from:
                     current = came_from[current]
-                    total_path.append(current)
+                    total_path.append(vert_list[current])
                 if trace_area:
                     return total_path[::-1], len(visited)
                 else:
                     return total_path[::-1]
 
-            open_set.remove(current)
-            closed_set.append(current)
-            for neighbour_label in self.get_all_neughbours_labels(current):
-                if neighbour_label not in visited:
-                    visited.append(neighbour_label)
+            closed_set.add(current)
+            cur_x, cur_y = xy[current]
+            for edge_node in self.mapper[self.label_mapper[vert_list[current]]]:
+                neighbour = vert_index[edge_node.vertex_node.get_label()]
+                visited.add(neighbour)
                 if interactive:
-                    print(" * processing neighbour %s" % neighbour_label)
-                if neighbour_label in closed_set:
+                    print(" * processing neighbour %s" % vert_list[neighbour])
+                if neighbour in closed_set:
                     if interactive:
                         print("    * already visited this node. Skipping ...")
                     continue
-                tentative_g_score = g_score[current] + self.calculate_euclidean_distance(current, neighbour_label)
-                if neighbour_label not in open_set:
-                    open_set.append(neighbour_label)
-                elif tentative_g_score >= g_score[neighbour_label]:
+                nb_x, nb_y = xy[neighbour]
+                length = get_routed_distance(vert_list[current], vert_list[neighbour])
+                if length is None:
+                    length = sqrt((cur_x - nb_x) ** 2 + (cur_y - nb_y) ** 2)
+                tentative_g_score = g_score[current] + length
+                if tentative_g_score >= g_score.get(neighbour, float("Inf")):
                     if interactive:
                         print("    * this path is worse then previously discovered. Continuing ...")
                     continue
 
-                came_from[neighbour_label] = current
-                g_score[neighbour_label] = tentative_g_score
-                f_score[neighbour_label] = g_score[neighbour_label] + self.calculate_euclidean_distance(neighbour_label,
-                                                                                                        vb_label)
+                came_from[neighbour] = current
+                g_score[neighbour] = tentative_g_score
+                heapq.heappush(open_heap, (tentative_g_score + h_score[neighbour], neighbour))
                 if interactive:
-                    print("    * the path to %s has f_score %f" % (neighbour_label, f_score[neighbour_label]))
+                    print("    * the path to %s has f_score %f" % (vert_list[neighbour],
+                                                                   tentative_g_score + h_score[neighbour]))
 
             if interactive:
                 input()
         # no path found
         return None
 
+    def get_coordinates_index(self):
+        """ Get sorted vertex labels, their label-index mapping and coordinates array
+
+        The result is taken from a graph snapshot (see freeze()).
+
+        :return tuple - list of sorted vertex labels, dictionary where labels
+                are keys and their indices are values and NumPy (n, 2) array
+                of vertices coordinates in the same order
+
+        :exception GraphHasNoCoordinatesForVertices - graph vertices don't have
+                   coordinates
+        """
+
+        if not self.has_coordinates:
+            raise GraphHasNoCoordinatesForVertices("The graph instance has vertices with no coordinates!")
+        snapshot = self.freeze()
+        return snapshot.labels, snapshot.label_index, snapshot.coords
+
     def calculate_euclidean_distance(self, va_label, vb_label):
         """ Calculate Euclidean distance between vertices if coordinates was enabled
 
@@ -698,25 +1298,57 @@ class Graph(object):
         b_coords = self.find_vertex_node_by_label(vb_label).get_coordinates()
         return sqrt((a_coords[0] - b_coords[0]) ** 2 + (a_coords[1] - b_coords[1]) ** 2)
 
+    def set_routed_distances(self, label_index, matrix):
+        """ Set precomputed routed distances between vertices (e.g. along aisles)
+
+        Routed distances take place of Euclidean ones for edges without
+        "distance" info (WEIGHT_DISTANCE) and as A* edge lengths.
+
+        :param label_index - dictionary where vertex labels are keys and
+               int indices into the matrix are values (None - no routes)
+        :param matrix - NumPy (k, k) float array of distances (inf - no route)
+        """
+
+        self.routed_distances = (label_index, matrix) if label_index is not None else None
+        self.invalidate_cache()
+
+    def get_routed_distance(self, va_label, vb_label):
+        """ Look up a routed distance between two vertices in O(1)
+
+        :param va_label - string label of a node A
+        :param vb_label - string label of a node B
+        :return: float routed distance or None if it's unknown
+        """
+
+        if self.routed_distances is None:
+            return None
+        label_index, matrix = self.routed_distances
+        i, j = label_index.get(va_label), label_index.get(vb_label)
+        if i is None or j is None or not np.isfinite(matrix[i, j]):
+            return None
+        return float(matrix[i, j])
+
     def get_shortest_path(self, va_label, vb_label, nxt):
         """ Return a shortest path between two nodes using a next matrix from the floyd_warshall_shortest_paths()
 
         :param va_label - string label of a node A
         :param vb_label - string label of a node B
-        :param nxt - NumPy array from floyd_warshall_shortest_paths()
+        :param nxt - NumPy array of vertex indices from floyd_warshall_shortest_paths()
 
         :return list of labels that indicate the shortest path between
                 A and B. Return empty list if there is no path.
 
         """
 
-        vert_list = sorted([k.get_label() for k in self.mapper])  # getting a list of all vertex labels
-        if isnan(nxt[vert_list.index(va_label)][vert_list.index(vb_label)]):
+        vert_list, vert_index = self.get_vertex_indices()
+        i = vert_index[va_label]
+        j = vert_index[vb_label]
+        if nxt[i][j] < 0:
             return []
         path = [va_label]
-        while va_label != vb_label:
-            va_label = chr(int(nxt[vert_list.index(va_label)][vert_list.index(vb_label)]))
-            path.append(va_label)
+        while i != j:
+            i = int(nxt[i][j])
+            path.append(vert_list[i])
         return path
 
     def calculate_betweenness_of_vertices(self, nxt):
@@ -729,7 +1361,7 @@ class Graph(object):
 
         """
 
-        vert_list = sorted([k.get_label() for k in self.mapper])  # getting a list of all vertex labels
+        vert_list = self.get_vertex_indices()[0]  # getting a list of all vertex labels
         shortest_paths = self.get_all_shortest_paths(nxt)
 
         # dictionary to hold a betweenness for avery vertex
@@ -746,6 +1378,110 @@ class Graph(object):
 
         return vert_betweenness
 
+    def calculate_brandes_betweenness(self, weight_mode=WEIGHT_UNIT, pair_weights=None, normalized=False):
+        """ Calculate a betweenness centrality for every graph's vertex with Brandes algorithm
+
+        Unlike calculate_betweenness_of_vertices() it counts all the
+        shortest paths between every pair (splitting a pair contribution
+        between them) and doesn't count path endpoints. Runs in O(VE)
+        for unweighted and O(VE + V^2 logV) for weighted graphs. Read more at
+        https://en.wikipedia.org/wiki/Betweenness_centrality
+
+        :param weight_mode - how to weight edges, see get_edge_cost().
+               WEIGHT_UNIT runs BFS, other modes run Dijkstra.
+               Defaults to WEIGHT_UNIT.
+        :param pair_weights - dictionary where (<va_label>, <vb_label>) pairs
+               are keys and numbers (e.g. transported quantities) are values
+               to weight shortest paths from A to B with. Pairs missing in the
+               dictionary are ignored. If None, every pair has weight 1.
+               Defaults to None.
+        :param normalized - bool divide values by an amount of vertex pairs
+               not including the vertex. Defaults to False.
+
+        :return dictionary of betweenness values for each vertex (where
+                vertex label is a key and it's betweenness is a value)
+
+        """
+
+        vert_list, vert_index = self.get_vertex_indices()
+        adj = self.get_indexed_adjacency(weight_mode)
+        n = len(vert_list)
+        centrality = [0.] * n
+
+        # pair weights over vertex indices
+        targets = None
+        if pair_weights is not None:
+            targets = [{} for _ in range(n)]
+            for (va_label, vb_label), weight in pair_weights.items():
+                if va_label in vert_index and vb_label in vert_index and va_label != vb_label:
+                    targets[vert_index[va_label]][vert_index[vb_label]] = weight
+
+        for s in range(0, n):
+            if targets is not None and not targets[s]:
+                continue  # no weighted paths start here
+
+            # stage 1: single source shortest paths counting
+            stack = []
+            preds = [[] for _ in range(n)]
+            sigma = [0] * n
+            sigma[s] = 1
+            dist = [None] * n
+            dist[s] = 0
+            if weight_mode == WEIGHT_UNIT:
+                queue = [s]
+                for v in queue:
+                    stack.append(v)
+                    for w, _ in adj[v]:
+                        if dist[w] is None:
+                            dist[w] = dist[v] + 1
+                            queue.append(w)
+                        if dist[w] == dist[v] + 1:
+                            sigma[w] += sigma[v]
+                            preds[w].append(v)
+            else:
+                settled = [False] * n
+                heap = [(0., s)]
+                while heap:
+                    d, v = heapq.heappop(heap)
+                    if settled[v]:
+                        continue
+                    settled[v] = True
+                    stack.append(v)
+                    for w, cost in adj[v]:
+                        if settled[w]:
+                            continue
+                        nd = d + cost
+                        if dist[w] is None or nd < dist[w]:
+                            dist[w] = nd
+                            heapq.heappush(heap, (nd, w))
+                            sigma[w] = sigma[v]
+                            preds[w] = [v]
+                        elif nd == dist[w]:
+                            sigma[w] += sigma[v]
+                            preds[w].append(v)
+
+            # stage 2: back-propagation of dependencies
+            delta = [0.] * n
+            pair_weight = targets[s] if targets is not None else None
+            while stack:
+                w = stack.pop()
+                if w == s:
+                    continue
+                coeff = delta[w] + (1. if pair_weight is None else pair_weight.get(w, 0.))
+                for v in preds[w]:
+                    delta[v] += sigma[v] / sigma[w] * coeff
+                centrality[w] += delta[w]
+
+        if not self.is_directed:
+            centrality = [c / 2 for c in centrality]
+        if normalized and n > 2:
+            scale = 1. / ((n - 1) * (n - 2))
+            if not self.is_directed:
+                scale *= 2
+            centrality = [c * scale for c in centrality]
+
+        return {label: centrality[i] for i, label in enumerate(vert_list)}
+
     def get_all_shortest_paths(self, nxt):
         """ Get all shortest paths between all the possible vertex pairs
 
@@ -756,7 +1492,7 @@ class Graph(object):
 
         """
 
-        vert_list = sorted([k.get_label() for k in self.mapper])  # getting a list of all vertex labels
+        vert_list = self.get_vertex_indices()[0]  # getting a list of all vertex labels
         shortest_paths = []
         for vertex_pair in permutations(vert_list, 2):
             shortest_paths.append(self.get_shortest_path(vertex_pair[0], vertex_pair[1], nxt))
@@ -764,19 +1500,172 @@ class Graph(object):
         return shortest_paths
 
     def build_transitive_closure(self, adj_mtx, print_out=False):
-        """ TODO: docs """
+        """ Build a transitive closure of an adjacency matrix
 
-        n = self.get_vertices_count()
-        for i in range(0, n):
-            for s in range(0, n):
-                for t in range(0, n):
-                    if adj_mtx[s][i] and adj_mtx[i][t]:
-                        adj_mtx[s][t] = 1
+        Uses Warshall algorithm where every step is a boolean OR of
+        a matrix row into all the rows that reach it.
+
+        :param adj_mtx - NumPy adjacency matrix from build_adjacency_matrix()
+               (it's modified in place)
+        :param print_out - boolean print a matrix to a console.
+               Defaults to False.
+
+        :return: NumPy matrix where (i,j) is 1 if there is a path
+                 from vertex i to vertex j
+        """
+
+        reach = adj_mtx.astype(bool)
+        for i in range(0, reach.shape[0]):
+            reach[reach[:, i]] |= reach[i]
+        adj_mtx[reach] = 1
 
         if print_out:
-            print(self.matrix_to_string(sorted([k.get_label() for k in self.mapper]), adj_mtx))
+            print(self.matrix_to_string(self.get_vertex_indices()[0], adj_mtx))
         return adj_mtx
 
+    def get_strongly_connected_components(self):
+        """ Find strongly connected components of the graph
+
+        Uses iterative Tarjan's algorithm. Read more at
+        https://en.wikipedia.org/wiki/Tarjan%27s_strongly_connected_components_algorithm
+
+        :return tuple - list of components (lists of vertex indices, see
+                get_vertex_indices()) in reverse topological order, i.e.
+                every component comes after all the components reachable
+                from it, and a list of component indices for every vertex
+        """
+
+        adj = self.get_indexed_adjacency()
+        n = len(adj)
+        index = [-1] * n
+        low = [0] * n
+        on_stack = [False] * n
+        stack = []
+        components = []
+        comp_of = [-1] * n
+        counter = 0
+
+        for root in range(0, n):
+            if index[root] >= 0:
+                continue
+            work = [(root, 0)]
+            while work:
+                v, edge_pos = work.pop()
+                if edge_pos == 0:
+                    index[v] = low[v] = counter
+                    counter += 1
+                    stack.append(v)
+                    on_stack[v] = True
+                recurse = False
+                for pos in range(edge_pos, len(adj[v])):
+                    w = adj[v][pos][0]
+                    if index[w] < 0:
+                        work.append((v, pos + 1))
+                        work.append((w, 0))
+                        recurse = True
+                        break
+                    elif on_stack[w]:
+                        low[v] = min(low[v], index[w])
+                if recurse:
+                    continue
+                if low[v] == index[v]:
+                    component = []
+                    while True:
+                        w = stack.pop()
+                        on_stack[w] = False
+                        comp_of[w] = len(components)
+                        component.append(w)
+                        if w == v:
+                            break
+                    components.append(component)
+                if work:
+                    low[work[-1][0]] = min(low[work[-1][0]], low[v])
+
+        return components, comp_of
+
+    def build_reachability_matrix(self):
+        """ Build (or get a cached) boolean reachability matrix of the graph
+
+        Reachability is calculated on a condensation of the graph (every
+        strongly connected component is a single vertex) with boolean
+        row ORs in reverse topological order, so cycles are handled once.
+
+        :return: NumPy boolean matrix where (i,j) is True if there is a path
+                 from vertex i to vertex j (see get_vertex_indices()). (i,i)
+                 is True only if i lays on a cycle.
+        """
+
+        if "reachability" not in self.analytics_cache:
+            components, comp_of = self.get_strongly_connected_components()
+            adj = self.get_indexed_adjacency()
+            comp_reach = np.zeros((len(components), len(components)), dtype=bool)
+            for c, component in enumerate(components):
+                if len(component) > 1:
+                    comp_reach[c, c] = True  # a cycle inside the component
+                for v in component:
+                    for w, _ in adj[v]:
+                        d = comp_of[w]
+                        if d != c and not comp_reach[c, d]:
+                            comp_reach[c, d] = True
+                            comp_reach[c] |= comp_reach[d]  # d was processed before c
+            comp_of = np.array(comp_of, dtype=np.int64)
+            self.analytics_cache["reachability"] = comp_reach[comp_of][:, comp_of]
+        return self.analytics_cache["reachability"]
+
+    def is_reachable(self, va_label, vb_label):
+        """ Check whether there is a path from vertex A to vertex B
+
+        :param va_label - string label of a node A
+        :param vb_label - string label of a node B
+
+        :return True - B is reachable from A. False - otherwise.
+        """
+
+        vert_index = self.get_vertex_indices()[1]
+        return bool(self.build_reachability_matrix()[vert_index[va_label], vert_index[vb_label]])
+
+    def get_reachable_labels(self, vert_label, max_hops=None):
+        """ Get labels of all the vertices reachable from a vertex
+
+        :param vert_label - string label of a vertex
+        :param max_hops - int maximum amount of edges in a path (>= 1). If None,
+               path length is not limited. Defaults to None.
+
+        :return: sorted list of reachable vertices labels
+
+        :raises BadHopsCount
+        """
+
+        vert_list, vert_index = self.get_vertex_indices()
+        reach = self.build_reachability_matrix() if max_hops is None else self.build_k_hop_reachability_matrix(max_hops)
+        return [vert_list[j] for j in np.flatnonzero(reach[vert_index[vert_label]])]
+
+    def build_k_hop_reachability_matrix(self, k):
+        """ Build (or get a cached) boolean matrix of vertices reachable in at most k hops
+
+        :param k - int maximum amount of edges in a path (k >= 1)
+
+        :return: NumPy boolean matrix where (i,j) is True if there is a path
+                 from vertex i to vertex j of at most k edges
+
+        :raises BadHopsCount
+        """
+
+        if not isinstance(k, (int, np.integer)) or isinstance(k, bool) or k < 1:
+            raise BadHopsCount("Maximum amount of hops must be a positive integer, got %r!" % (k,))
+        if ("k_hop", k) not in self.analytics_cache:
+            adj_mtx = self.build_adjacency_matrix().astype(np.float32)
+            cached = [key[1] for key in self.analytics_cache if isinstance(key, tuple) and key[0] == "k_hop" and
+                      key[1] < k]
+            hops = max(cached) if cached else 1
+            reach = self.analytics_cache[("k_hop", hops)] if cached else adj_mtx > 0
+            self.analytics_cache[("k_hop", hops)] = reach
+            while hops < k:
+                reach = reach | (reach.astype(np.float32) @ adj_mtx > 0)
+                hops += 1
+                self.analytics_cache[("k_hop", hops)] = reach
+        return self.analytics_cache[("k_hop", k)]
+
     def get_all_neughbours_labels(self, vert_label):
         """ Return a list of all neighbours of the input vertex
 
@@ -802,7 +1691,8 @@ class Graph(object):
         """
 
         a_node = self.find_vertex_node_by_label(va_label)
-        edge_node = [v for v in self.mapper[a_node] if v.vertex_node.get_label() == vb_label][0]
+        b_node = self.find_vertex_node_by_label(vb_label)
+        edge_node = self.__get_edge(a_node, b_node)
 
         return edge_node.weight
 
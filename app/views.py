@@ -1,6 +1,7 @@
 from app import app
 from flask import render_template, request
 from app.core.json_assembler import *
+from app.core.viz_cache import viz_cache, viz_rebuilds
 
 
 @app.route('/')
@@ -11,10 +12,7 @@ def index():
 
 @app.route('/get_data')
 def get_data():
-    ja = JSONAssembler(app.root_path+'/core/config.json', force_rebuild=True)
-    if ja.init_failed:
-        return '{"status": "Error: DB Connection Failed"}'
-    return ja.get_viz_json()
+    return get_viz_json_cached()
 
 
 @app.route('/get_data_filtered')
@@ -25,7 +23,73 @@ def get_data_filtered():
     date_to = request.args.get('end', None, type=str) + dummy_time_2
     main_item = request.args.get('main_item', None, type=str)
     department = request.args.get('department', None, type=str)
-    ja = JSONAssembler(app.root_path+'/core/config.json', force_rebuild=True, date_boundaries=[date_from, date_to], mi_filter=main_item, dep_filter=department)
-    if ja.init_failed:
+    return get_viz_json_cached(date_from, date_to, main_item, department)
+
+
+def get_viz_json_cached(date_from=None, date_to=None, main_item=None, department=None):
+    """ Serve visualization JSON from a cache (stale-while-revalidate) or assemble and cache it
+
+    A fresh cached payload is served as is. An expired one (or one
+    stored on a disk by a previous process, until a rebuild checks it
+    against current source fingerprints) is served stale right away
+    while a background rebuild refreshes it. Without any payload a
+    request waits for a rebuild. Concurrent requests of the same
+    filter set share a single rebuild (its failures are logged).
+
+    Response headers: "X-Cache-Status" (fresh, stale or miss) and
+    "Age" (seconds since the payload was built).
+
+    :param date_from: string lower date boundary (None - no date filtering)
+    :param date_to: string upper date boundary
+    :param main_item: string main item to filter on
+    :param department: string department label to filter on
+
+    :return: tuple (<string_JSON>, <int_status>, <dict_headers>)
+
+    """
+
+    key = viz_cache.make_key(date_from, date_to, main_item, department)
+    entry = viz_cache.get_entry(key)
+    if entry is None:
+        date_boundaries = [date_from, date_to] if date_from else None
+        stored = JSONAssembler.get_stored_viz_json(app.root_path+'/core/config.json', date_boundaries,
+                                                   main_item, department)
+        if stored is not None:
+            # it may be built from outdated sources, so it's stale until a rebuild checks them
+            viz_cache.put(key, stored[0], age=stored[1], unverified=True)
+            entry = viz_cache.get_entry(key)
+
+    if entry is not None:
+        viz_json, age, stale = entry
+        if stale:
+            viz_rebuilds.submit(key, build_viz_json, key, date_from, date_to, main_item, department)
+        return viz_json, 200, {"X-Cache-Status": "stale" if stale else "fresh", "Age": str(int(age))}
+
+    viz_json = viz_rebuilds.submit(key, build_viz_json, key, date_from, date_to, main_item, department).result()
+    if viz_json is None:
         return '{"status": "Error: DB Connection Failed"}'
-    return ja.get_viz_json()
+    return viz_json, 200, {"X-Cache-Status": "miss", "Age": "0"}
+
+
+def build_viz_json(key, date_from=None, date_to=None, main_item=None, department=None):
+    """ Assemble visualization JSON and put it into the in-process cache
+
+    :param key: tuple cache key from viz_cache.make_key()
+    :param date_from: string lower date boundary (None - no date filtering)
+    :param date_to: string upper date boundary
+    :param main_item: string main item to filter on
+    :param department: string department label to filter on
+
+    :return: string JSON or None if assembling failed (nothing is cached then)
+
+    """
+
+    date_boundaries = [date_from, date_to] if date_from else None
+    unfiltered = not (date_from or main_item or department)
+    ja = JSONAssembler(app.root_path+'/core/config.json', date_boundaries=date_boundaries, mi_filter=main_item,
+                       dep_filter=department, incremental=unfiltered, revalidate=not unfiltered)
+    if ja.init_failed:
+        return None
+    viz_json = ja.get_viz_json()
+    viz_cache.put(key, viz_json)
+    return viz_json
@@ -0,0 +1,67 @@
+import unittest
+from app.dstruct.aisle_network import *
+
+
+class TestAisleNetwork(unittest.TestCase):
+    def test_init(self):
+        """ Test building a network out of polylines """
+
+        self.assertRaises(BadAisleNetwork, AisleNetwork, [[[0, 0]]])
+        self.assertRaises(BadAisleNetwork, AisleNetwork, [[[0, 0], [0, 0]]])
+
+        net = AisleNetwork([[[0, 0], [0, 10], [10, 10]], [[10, 10], [10, 0]]])  # joined at (10, 10)
+        self.assertEqual(len(net.coords), 4)
+        self.assertEqual(net.lengths.tolist(), [10, 10, 10])
+
+    def test_distances(self):
+        """ Test snapping and routed distances """
+
+        net = AisleNetwork([[[0, 0], [0, 10], [10, 10], [10, 0]], [[20, 0], [20, 10]]])
+        segment_idx, positions, access = net.snap([[1, 1], [9, 1], [0, 5], [21, 5]])
+        self.assertEqual(segment_idx.tolist(), [0, 2, 0, 3])
+        self.assertEqual(positions.tolist(), [0.1, 0.9, 0.5, 0.5])
+        self.assertEqual(access.tolist(), [1, 1, 0, 1])
+
+        dist = net.get_distance_matrix([[1, 1], [9, 1], [0, 5], [21, 5]])
+        self.assertAlmostEqual(dist[0, 1], 1 + 9 + 10 + 9 + 1)  # around the U, not straight across
+        self.assertAlmostEqual(dist[1, 0], dist[0, 1])
+        self.assertAlmostEqual(dist[0, 2], 1 + 4)  # along the same segment
+        self.assertTrue(np.isinf(dist[0, 3]))  # separate aisle
+        self.assertEqual(np.diag(dist).tolist(), [0, 0, 0, 0])
+
+        route, length = net.get_route(0, 0.1, 2, 0.9)
+        self.assertEqual(route, [(0, 0.9), (1, 1.), (2, 0.9)])
+        self.assertAlmostEqual(length, 28)
+        self.assertEqual(net.get_route(0, 0.1, 0, 0.5)[0], [(0, 0.4)])
+        self.assertIsNone(net.get_route(0, 0.1, 3, 0.5))
+        self.assertIs(net.get_shortest_path_tree(0), net.get_shortest_path_tree(0))
+
+    def test_assign_flows(self):
+        """ Test traffic assignment against routes walked one by one """
+
+        net = AisleNetwork([[[0, 0], [0, 10], [10, 10], [10, 0], [0, 0]], [[10, 10], [20, 10], [20, 0]],
+                            [[30, 0], [30, 10]]])
+        rnd = np.random.RandomState(0)
+        points = np.vstack([rnd.uniform(0, 20, (20, 2)), [[31, 5]]])
+        segment_idx, positions, _ = net.snap(points)
+        src, dest = rnd.randint(0, len(points), 500), rnd.randint(0, len(points), 500)
+        quantities = rnd.randint(1, 10, 500)
+
+        expected, expected_unrouted = np.zeros(len(net.segments)), 0
+        for a, b, quant in zip(src, dest, quantities):
+            route = net.get_route(segment_idx[a], positions[a], segment_idx[b], positions[b])
+            if route is None:
+                expected_unrouted += quant
+                continue
+            for segment, _ in route[0]:
+                expected[segment] += quant
+
+        loads, unrouted = net.assign_flows(segment_idx[src], positions[src], segment_idx[dest], positions[dest],
+                                           quantities)
+        self.assertEqual(loads.tolist(), expected.tolist())
+        self.assertEqual(unrouted, expected_unrouted)
+        self.assertGreater(unrouted, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+import sqlite3
+import threading
+from app.core.db_pool import *
+
+
+class TestConnectionPool(unittest.TestCase):
+    """ Unit tests for app/core/db_pool.py module """
+
+    def setUp(self):
+        self.connects = 0
+
+    def connect(self):
+        self.connects += 1
+        return sqlite3.connect(":memory:", check_same_thread=False)
+
+    def test_reuse(self):
+        """ Test that released connections are reused instead of reopened """
+
+        pool = ConnectionPool(self.connect, size=2)
+        with pool.connection() as conn:
+            conn.execute("CREATE TABLE mp (qty INTEGER)")
+            conn.execute("INSERT INTO mp VALUES (5)")
+        with pool.connection() as conn:
+            self.assertEqual(conn.execute("SELECT SUM(qty) FROM mp").fetchone()[0], 5)
+        self.assertEqual(self.connects, 1)
+        self.assertEqual(pool.idle_count, 1)
+        self.assertEqual(pool.opened_count, 1)
+
+    def test_reconnect(self):
+        """ Test that a dead connection is replaced on checkout """
+
+        pool = ConnectionPool(self.connect, size=1)
+        conn = pool.acquire()
+        pool.release(conn)
+        conn.close()  # e.g. a DB server dropped the session
+
+        conn = pool.acquire()
+        self.assertEqual(conn.execute("SELECT 1").fetchone()[0], 1)
+        self.assertEqual(self.connects, 2)
+        self.assertEqual(pool.opened_count, 1)
+        pool.release(conn)
+
+    def test_size_and_timeout(self):
+        """ Test that a pool never opens more connections than its size """
+
+        pool = ConnectionPool(self.connect, size=2, timeout=0.05)
+        conn_1 = pool.acquire()
+        conn_2 = pool.acquire()
+        self.assertRaises(PoolTimeout, pool.acquire)
+
+        # a waiting thread gets a released connection
+        result = []
+        waiter = threading.Thread(target=lambda: result.append(pool.acquire()))
+        pool.timeout = 5
+        waiter.start()
+        pool.release(conn_1)
+        waiter.join()
+        self.assertIs(result[0], conn_1)
+        self.assertEqual(self.connects, 2)
+
+        pool.release(conn_2, broken=True)
+        self.assertEqual(pool.opened_count, 1)
+        pool.close()
+        self.assertRaises(PoolClosed, pool.acquire)
@@ -50,4 +50,129 @@ class TestFacility(unittest.TestCase):
         self.assertRaises(NotIntQuantity, fac.add_transp_record, "Dep 1.centroid", "Dep 2.centroid", "batman!",
                           "2016-07-13 18:00:01")
         self.assertRaises(BadTimeFormat, fac.add_transp_record, "Dep 1.centroid", "Dep 2.centroid", 3,
-                          "just now")
\ No newline at end of file
+                          "just now")
+
+    def test_add_transp_records(self):
+        """ Test bulk insertion of transportation records against one by one insertion """
+
+        records = [("Dep 1.centroid", "Dep 2.centroid", 13), ("Dep 2.centroid", "Dep 1.centroid", 2),
+                   ("Dep 1.centroid", "Dep 2.centroid", 7), ("Dep 1.centroid", "Dep 1.centroid", 5),
+                   ("Dep 2.centroid", "Dep 2.centroid", 1)]
+        facilities = []
+        for _ in range(2):
+            fac = Facility(100, 100)
+            fac.add_department(Department("Dep 1", Point2D(0, 0), Point2D(2, 0), Point2D(2, 2), Point2D(0, 2)))
+            fac.add_department(Department("Dep 2", Point2D(2, 2), Point2D(4, 2), Point2D(4, 4), Point2D(2, 4)))
+            facilities.append(fac)
+
+        self_edges_weight = 0
+        for record in records:
+            try:
+                facilities[0].add_transp_record(*record)
+            except SelfEdgesNotSupported:
+                self_edges_weight += record[2]
+        created_nodes, bulk_self_edges_weight = facilities[1].add_transp_records(records)
+
+        self.assertEqual(bulk_self_edges_weight, self_edges_weight)
+        self.assertEqual(list(facilities[1].d_graph.get_edges()), list(facilities[0].d_graph.get_edges()))
+        self.assertEqual(created_nodes[("Dep 1.centroid", "Dep 2.centroid")].increment_count, 2)
+        self.assertEqual(created_nodes[("Dep 1.centroid", "Dep 2.centroid")].weight, 20)
+        self.assertEqual(facilities[1].d_graph.get_flows(), {("Dep 1.centroid", "Dep 2.centroid"): 20,
+                                                             ("Dep 2.centroid", "Dep 1.centroid"): 2})
+        self.assertRaises(NotIntQuantity, facilities[1].add_transp_records, [("Dep 1.centroid", "Dep 2.centroid", "1")])
+        self.assertRaises(NodeNotExists, facilities[1].add_transp_records, [("Dep 1.centroid", "Dep 3.centroid", 1)])
+
+    def test_distances(self):
+        """ Test symmetric department pair distance/time lookup """
+
+        fac = Facility(100, 100)
+        fac.add_department(Department("Dep 1", Point2D(0, 0), Point2D(2, 0), Point2D(2, 2)))
+        fac.add_department(Department("Dep 2", Point2D(2, 2), Point2D(4, 2), Point2D(4, 4)))
+        fac.add_department(Department("Dep 3", Point2D(5, 5), Point2D(6, 5), Point2D(6, 6)))
+        fac.set_distances({"Dep 1": {"Dep 2": [10, 20], "Dep 3": [30, None]},
+                           "Dep 3": {"Dep 1": [31, 41]},
+                           "Dep X": {"Dep 2": [1, 1]}})
+
+        self.assertEqual(fac.get_distance_and_time("Dep 1", "Dep 2"), [10, 20])
+        self.assertEqual(fac.get_distance_and_time("Dep 2", "Dep 1"), [10, 20])
+        self.assertEqual(fac.get_distance_and_time("Dep 1", "Dep 3"), [30, None])
+        self.assertEqual(fac.get_distance_and_time("Dep 3", "Dep 1"), [31, 41])
+        self.assertEqual(fac.get_distance_and_time("Dep 2", "Dep 3"), None)
+
+        distance_mtx, time_mtx = fac.get_distance_matrices()
+        self.assertEqual(fac.get_department_index(), {"Dep 1": 0, "Dep 2": 1, "Dep 3": 2})
+        self.assertEqual(distance_mtx[0].tolist()[1:], [10, 30])
+        self.assertEqual(distance_mtx[2, 0], 31)
+        self.assertTrue(np.isnan(time_mtx[0, 2]) and np.isnan(distance_mtx[1, 2]))
+        self.assertIs(fac.get_distance_matrices()[0], distance_mtx)
+
+    def test_transport_cost(self):
+        """ Test transport cost totals, breakdowns and layout scoring """
+
+        fac = Facility(100, 100)
+        fac.add_department(Department("Dep 1", Point2D(0, 0), Point2D(2, 0), Point2D(2, 2)))
+        fac.add_department(Department("Dep 2", Point2D(2, 2), Point2D(4, 2), Point2D(4, 4)))
+        fac.add_department(Department("Dep 3", Point2D(5, 5), Point2D(6, 5), Point2D(6, 6)))
+        fac.set_distances({"Dep 1": {"Dep 2": [10, 2], "Dep 3": [30, 6]}, "Dep 2": {"Dep 3": [20, 4]}})
+        created, _ = fac.add_transp_records([("Dep 1.centroid", "Dep 2.centroid", 3),
+                                             ("Dep 3.centroid", "Dep 1.centroid", 2),
+                                             ("Dep 2.centroid", "Dep 3.centroid", 5)])
+        for (src_label, dest_label), edge_node in created.items():
+            if src_label != "Dep 2.centroid":  # Dep 2 -> Dep 3 stays without info
+                distance, time = fac.get_distance_and_time(src_label.split('.')[0], dest_label.split('.')[0])
+                edge_node.add_info("distance", distance)
+                edge_node.add_info("time", time)
+
+        cost = fac.get_transport_cost()
+        self.assertEqual(cost["total"], 3 * 10 + 2 * 30)
+        self.assertEqual(cost["unknown_quantity"], 5)
+        self.assertEqual(cost["departments"]["Dep 1"], {"outgoing": 30, "incoming": 60})
+        self.assertEqual(cost["departments"]["Dep 2"], {"outgoing": 0, "incoming": 30})
+        self.assertEqual(fac.get_transport_cost("time")["total"], 3 * 2 + 2 * 6)
+        self.assertEqual(fac.get_edge_transport_costs()[("Dep 2.centroid", "Dep 3.centroid")], None)
+        self.assertEqual(fac.get_edge_transport_costs("time")[("Dep 3.centroid", "Dep 1.centroid")], 12)
+        self.assertRaises(UnknownCostMetric, fac.get_transport_cost, "money")
+
+        # Dep 2 -> Dep 3 counts in layout scores as the distance table knows it
+        layouts = [[0, 1, 2], [1, 0, 2], [2, 1, 0]]
+        expected = [30 + 60 + 100, 3 * 10 + 2 * 20 + 5 * 30, 3 * 20 + 2 * 30 + 5 * 10]
+        self.assertEqual(fac.score_layouts(layouts).tolist(), expected)
+        self.assertEqual(fac.score_layouts(layouts, batch_size=2).tolist(), expected)
+        self.assertEqual(fac.score_layouts([0, 1, 2], "time").tolist(), [6 + 12 + 20])
+        self.assertRaises(BadLayouts, fac.score_layouts, [[0, 0, 2]])
+        self.assertRaises(BadLayouts, fac.score_layouts, [[0, 1]])
+
+        # pairs missing from the distance table cost a centroid distance (as in layout optimisation)
+        fac.set_distances({"Dep 1": {"Dep 2": [10, 2]}})
+        centroid_mtx = fac.get_centroid_distance_matrix()
+        self.assertEqual(fac.get_layout_distance_matrix()[2, 0], centroid_mtx[2, 0])
+        self.assertEqual(fac.get_layout_distance_matrix()[1, 1], 0)
+        self.assertAlmostEqual(fac.score_layouts([0, 1, 2])[0],
+                               3 * 10 + 2 * centroid_mtx[2, 0] + 5 * centroid_mtx[1, 2])
+        self.assertEqual(fac.score_layouts([0, 1, 2], "time").tolist(), [3 * 2])
+
+    def test_aisle_network(self):
+        """ Test routing distances between departments along aisles """
+
+        fac = Facility(100, 100)
+        fac.add_department(Department("Dep 1", Point2D(0.5, 0.5), Point2D(1.5, 0.5), Point2D(1.5, 1.5),
+                                      Point2D(0.5, 1.5)))
+        fac.add_department(Department("Dep 2", Point2D(8.5, 0.5), Point2D(9.5, 0.5), Point2D(9.5, 1.5),
+                                      Point2D(8.5, 1.5)))
+        fac.add_transp_records([("Dep 1.centroid", "Dep 2.centroid", 5)])
+        self.assertAlmostEqual(fac.get_centroid_distance_matrix()[0, 1], 8)
+
+        fac.set_aisle_network(AisleNetwork([[[0, 0], [0, 10], [10, 10], [10, 0]]]))
+        self.assertAlmostEqual(fac.get_routed_distance("Dep 1.centroid", "Dep 2.centroid"), 30)
+        self.assertAlmostEqual(fac.get_centroid_distance_matrix()[1, 0], 30)
+        self.assertEqual(fac.d_graph.freeze().get_costs(WEIGHT_DISTANCE).tolist(), [30])
+        self.assertEqual(fac.d_graph.get_shortest_path_astar("Dep 1.centroid", "Dep 2.centroid"),
+                         ["Dep 1.centroid", "Dep 2.centroid"])
+
+        self.assertEqual(fac.get_aisle_loads(), {"segments": [[[0, 0], [0, 10], 5], [[0, 10], [10, 10], 5],
+                                                              [[10, 10], [10, 0], 5]], "unrouted_quantity": 0})
+
+        fac.set_aisle_network(None)
+        self.assertIsNone(fac.get_aisle_loads())
+        self.assertIsNone(fac.get_routed_distance("Dep 1.centroid", "Dep 2.centroid"))
+        self.assertEqual(fac.d_graph.freeze().get_costs(WEIGHT_DISTANCE).tolist(), [8])
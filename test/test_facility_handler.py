@@ -1,5 +1,14 @@
+import json
 import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
 import unittest
+from datetime import datetime
+from contextlib import closing
+from unittest import mock
 
 from app.core.facility_handler import FacilityHandler
 
@@ -15,3 +24,333 @@ class TestFacilityHandler(unittest.TestCase):
         fh = FacilityHandler("app/parse/config.json")
 
         # this test is rather naive as it's hard to evaluate results before we'll see an actual visualization
+
+
+class FakeParser(object):
+    """ MPParser replacement serving records of a test case instead of a DB """
+
+    records = {}  # record key -> [<src_dep>, <dest_dep>, <datetime>, <quant>]
+    queries = []  # queries parsers were created with
+    delay = 0  # seconds to wait before every chunk
+    loading = threading.Event()  # set once a chunk is served
+
+    def __init__(self, server, db, uid, pwd, query, peg_query, debug=False):
+        FakeParser.queries.append(query)
+
+    def iter_parse(self, chunk_size):
+        records = sorted(FakeParser.records.items())
+        for i in range(0, len(records), chunk_size):
+            time.sleep(FakeParser.delay)
+            FakeParser.loading.set()
+            yield dict(records[i:i + chunk_size])
+
+
+class ConnectionParser(FakeParser):
+    """ FakeParser taking an open DB connection """
+
+    connections = []  # connections parsers were created with
+
+    def __init__(self, server, db, uid, pwd, query, peg_query, debug=False, connection=None):
+        super().__init__(server, db, uid, pwd, query, peg_query, debug)
+        ConnectionParser.connections.append(connection)
+
+
+class SQLiteParser(FakeParser):
+    """ FakeParser running queries on a SQLite copy of its records """
+
+    db_path = None
+
+    def __init__(self, server, db, uid, pwd, query, peg_query, debug=False):
+        super().__init__(server, db, uid, pwd, query, peg_query, debug)
+        self.query = query
+
+    def iter_parse(self, chunk_size):
+        with closing(sqlite3.connect(SQLiteParser.db_path)) as conn:
+            cursor = conn.execute(self.query)
+            for rows in iter(lambda: cursor.fetchmany(chunk_size), []):
+                yield {row[0]: [row[1], row[2], datetime.strptime(row[3], FacilityHandler.DATE_FORMAT), row[4]]
+                       for row in rows}
+
+
+class TestFacilityHandlerCube(unittest.TestCase):
+    """ Unit tests for transport cube backed builds of app/core/facility_handler.py module """
+
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+        layout_path = os.path.join(self.base_dir, "factory_layout.json")
+        with open(layout_path, 'w') as f:
+            json.dump({"departments": [{"label": "A", "points": [[0, 0], [0, 2], [2, 2], [2, 0]]},
+                                       {"label": "B", "points": [[4, 0], [4, 2], [6, 2], [6, 0]]},
+                                       {"label": "C", "points": [[8, 0], [8, 2], [10, 2], [10, 0]]}],
+                       "distances": {"A": {"B": [5, 7]}, "B": {"A": [5, 7], "C": [3, 4]}}}, f)
+        self.conf = {"facility_dump_path": os.path.join(self.base_dir, "facility.snapshot"),
+                     "facility_source_path": layout_path, "facility_boundaries": [12, 12],
+                     "server": "", "db": "", "uid": "", "pass": "", "peg_query": "",
+                     "mp_query": "SELECT * FROM mp", "mi_mp_query": "SELECT * FROM mp WHERE mi = %s",
+                     "mp_batch_size": 2}
+        self.conf_path = os.path.join(self.base_dir, "config.json")
+        self.write_conf()
+
+        FakeParser.records = {i: ["A" if i % 2 else "B", "B" if i % 2 else "C", datetime(2016, 7, 1 + i % 10), 1]
+                              for i in range(1, 21)}
+        FakeParser.queries = []
+        FakeParser.delay = 0
+        FakeParser.loading.clear()
+        patcher = mock.patch("app.core.facility_handler.MPParser", FakeParser)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        FacilityHandler.reset_transport_cube()
+
+    def tearDown(self):
+        FacilityHandler.reset_transport_cube()
+        if FacilityHandler.db_pool is not None:
+            FacilityHandler.db_pool.close()
+            FacilityHandler.db_pool = None
+        shutil.rmtree(self.base_dir)
+
+    def write_conf(self, **changes):
+        self.conf.update(changes)
+        with open(self.conf_path, 'w') as f:
+            json.dump(self.conf, f)
+
+    def use_db(self):
+        """ Keep a SQLite copy of parser records to take DB fingerprints and connections from """
+
+        self.db_path = os.path.join(self.base_dir, "mp.db")
+        patcher = mock.patch.object(FacilityHandler, "connect_db",
+                                    staticmethod(lambda conf: sqlite3.connect(self.db_path, check_same_thread=False)))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.write_conf(mp_fingerprint_query="SELECT MAX(created), COUNT(*) FROM mp")
+        self.set_records(FakeParser.records)
+
+    def set_records(self, records):
+        FakeParser.records = dict(records)
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            conn.execute("DROP TABLE IF EXISTS mp")
+            conn.execute("CREATE TABLE mp (id INTEGER, src TEXT, dst TEXT, created TEXT, qty INTEGER, mi TEXT)")
+            rows = [(key, rec[0], rec[1], rec[2].strftime(FacilityHandler.DATE_FORMAT), rec[3],
+                     rec[4] if rec[4:] else "MI1") for key, rec in records.items()]
+            conn.executemany("INSERT INTO mp VALUES (?, ?, ?, ?, ?, ?)", rows)
+            conn.commit()
+
+    def test_concurrent_builds(self):
+        """ Test that a build never answers from an extract another build is still loading """
+
+        FakeParser.delay = 0.01
+        handlers = {}
+        reader_conf_path = os.path.join(self.base_dir, "reader_config.json")
+        with open(reader_conf_path, 'w') as f:
+            json.dump(dict(self.conf, facility_dump_path=os.path.join(self.base_dir, "reader.snapshot")), f)
+
+        def build(name, conf_path, **filters):
+            handlers[name] = FacilityHandler(conf_path, **filters)
+
+        loader = threading.Thread(target=build, args=("all", self.conf_path))
+        loader.start()
+        self.assertTrue(FakeParser.loading.wait(5))
+        reader = threading.Thread(target=build, args=("dep", reader_conf_path), kwargs={"dep_filter": "C"})
+        reader.start()
+        loader.join()
+        reader.join()
+
+        self.assertEqual(handlers["all"].facility.d_graph.get_flows(), {("A.centroid", "B.centroid"): 10,
+                                                                        ("B.centroid", "C.centroid"): 10})
+        self.assertEqual(handlers["dep"].facility.d_graph.get_flows(), {("B.centroid", "C.centroid"): 10})
+        self.assertEqual(len(FakeParser.queries), 1)  # the extract is loaded once
+        self.assertEqual(FacilityHandler.high_water_marks[None], ["2016-07-10 00:00:00", ["19", "9"]])
+
+    def test_concurrent_dumps(self):
+        """ Test that builds sharing dump files run one at a time """
+
+        errors = []
+        running = []
+        overlaps = []
+        insert_all_transp_records = FacilityHandler.insert_all_transp_records
+
+        def insert_slowly(handler, *args):
+            running.append(handler)
+            overlaps.append(len(running))
+            time.sleep(0.01)
+            try:
+                return insert_all_transp_records(handler, *args)
+            finally:
+                running.remove(handler)
+
+        def build(**filters):
+            try:
+                FacilityHandler(self.conf_path, force_rebuild=True, **filters)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=build, kwargs=filters)
+                   for filters in [{}, {"dep_filter": "A"}, {"mi_filter": "MI1"}, {}]]
+        with mock.patch.object(FacilityHandler, "insert_all_transp_records", insert_slowly):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(errors, [])
+        self.assertEqual(overlaps, [1] * len(threads))
+        self.assertEqual(FacilityHandler(self.conf_path).facility.d_graph.get_flows(),
+                         {("A.centroid", "B.centroid"): 10, ("B.centroid", "C.centroid"): 10})
+
+    def test_filtered_builds_keep_dump(self):
+        """ Test that filtered builds don't replace the unfiltered facility dump and state """
+
+        FacilityHandler(self.conf_path, incremental=True)
+        with open(self.conf["facility_dump_path"] + ".state.json") as f:
+            state = json.load(f)
+
+        fh = FacilityHandler(self.conf_path, dep_filter="C")
+        self.assertEqual(fh.facility.d_graph.get_flows(), {("B.centroid", "C.centroid"): 10})
+        FacilityHandler(self.conf_path, date_boundaries=["2016-07-02 00:00:00", "2016-07-03 23:59:59"])
+        with open(self.conf["facility_dump_path"] + ".state.json") as f:
+            self.assertEqual(json.load(f), state)
+        self.assertEqual([name for name in os.listdir(self.base_dir) if name.startswith(".tmp_")], [])
+
+        fh = FacilityHandler(self.conf_path, incremental=True)
+        self.assertFalse(fh.updated)  # restored as is
+        self.assertEqual(fh.high_water_mark, state["high_water_mark"])
+
+    def test_fingerprint_invalidation(self):
+        """ Test that appended records are folded in and other DB changes cause a full rebuild """
+
+        self.use_db()
+        fh = FacilityHandler(self.conf_path, incremental=True)
+        self.assertEqual(fh.facility.d_graph.get_flows(), {("A.centroid", "B.centroid"): 10,
+                                                           ("B.centroid", "C.centroid"): 10})
+
+        # appended records are fetched since the high-water mark
+        records = dict(FakeParser.records)
+        records[21] = ["A", "C", datetime(2016, 7, 11), 4]
+        self.set_records(records)
+        fh = FacilityHandler(self.conf_path, incremental=True)
+        self.assertTrue(fh.updated)
+        self.assertEqual(fh.high_water_mark, ["2016-07-11 00:00:00", ["21"]])
+        self.assertEqual(fh.facility.d_graph.get_flows()[("A.centroid", "C.centroid")], 4)
+        self.assertEqual(FacilityHandler.high_water_marks[None], fh.high_water_mark)  # cube extended
+        fh = FacilityHandler(self.conf_path, dep_filter="C")
+        self.assertEqual(fh.facility.d_graph.get_flows(), {("A.centroid", "C.centroid"): 4,
+                                                           ("B.centroid", "C.centroid"): 10})
+        self.assertEqual(len(FakeParser.queries), 2)
+
+        # a record replaced by a newer one keeps the row count, so it's not an append
+        records = dict(FakeParser.records)
+        del records[1]
+        records[22] = ["B", "A", datetime(2016, 7, 12), 2]
+        self.set_records(records)
+        fh = FacilityHandler(self.conf_path, incremental=True)
+        self.assertEqual(fh.facility.d_graph.get_flows(), {("A.centroid", "B.centroid"): 9,
+                                                           ("A.centroid", "C.centroid"): 4,
+                                                           ("B.centroid", "A.centroid"): 2,
+                                                           ("B.centroid", "C.centroid"): 10})
+        self.assertEqual(FakeParser.queries[2:], ["SELECT * FROM mp"])  # full reload
+
+    def test_pooled_extracts(self):
+        """ Test that extracts reuse pooled connections only if a parser accepts one """
+
+        self.use_db()
+        self.write_conf(db_pool_size=1)
+        self.assertFalse(FacilityHandler.parser_accepts_connection())
+        FacilityHandler(self.conf_path)
+        pool = FacilityHandler.db_pool
+        self.assertEqual(pool.opened_count, 1)  # fingerprint queries only
+
+        ConnectionParser.connections = []
+        with mock.patch("app.core.facility_handler.MPParser", ConnectionParser):
+            self.assertTrue(FacilityHandler.parser_accepts_connection())
+            FacilityHandler(self.conf_path, force_rebuild=True)
+            FacilityHandler(self.conf_path, mi_filter="MI1")
+        self.assertEqual(len(ConnectionParser.connections), 2)
+        self.assertIsNotNone(ConnectionParser.connections[0])
+        self.assertIs(ConnectionParser.connections[0], ConnectionParser.connections[1])
+        self.assertIs(FacilityHandler.db_pool, pool)
+        self.assertEqual((pool.opened_count, pool.idle_count), (1, 1))
+
+    def test_concurrent_pool_creation(self):
+        """ Test that concurrent first requests share one pool """
+
+        pools = []
+        barrier = threading.Barrier(4)
+
+        def get_pool():
+            barrier.wait()
+            pools.append(FacilityHandler.get_db_pool(dict(self.conf, db_pool_size=2)))
+
+        with mock.patch("app.core.facility_handler.ConnectionPool",
+                        side_effect=lambda *args, **kwargs: time.sleep(0.01) or mock.Mock(size=2)):
+            threads = [threading.Thread(target=get_pool) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(pools), 4)
+        self.assertTrue(all(pool is pools[0] for pool in pools))
+        FacilityHandler.db_pool = None
+
+    def test_predicate_pushdown(self):
+        """ Test that filters become predicates of queries a DB actually runs """
+
+        main_items = ["O'Hara", "50%_x\\", "x'; DROP TABLE mp; --", "Ünïcode €"]
+        self.use_db()
+        self.set_records({key: rec + [main_items[key % 4]] for key, rec in FakeParser.records.items()})
+        SQLiteParser.db_path = self.db_path
+        self.write_conf(mp_query="SELECT id, src, dst, created, qty, mi FROM mp",
+                        mp_filter_columns={"date": "created", "main_item": "mi", "src_dep": "src", "dst_dep": "dst"})
+
+        with mock.patch("app.core.facility_handler.MPParser", SQLiteParser):
+            for i, main_item in enumerate(main_items):
+                fh = FacilityHandler(self.conf_path, mi_filter=main_item)
+                self.assertEqual(sum(fh.facility.d_graph.get_flows().values()), 5)
+                self.assertIn("mi = '%s'" % main_item.replace("'", "''"), FakeParser.queries[-1])
+
+            # date and department filters are pushed down unless an extract is loaded already
+            fh = FacilityHandler(self.conf_path, date_boundaries=["2016-07-02 00:00:00", "2016-07-03 23:59:59"],
+                                 dep_filter="C")
+            self.assertEqual(fh.facility.d_graph.get_flows(), {("B.centroid", "C.centroid"): 2})
+            self.assertIn("created >= '2016-07-02 00:00:00' AND created <= '2016-07-03 23:59:59' AND "
+                          "(src = 'C' OR dst = 'C')", FakeParser.queries[-1])
+            self.assertEqual(fh.date_from, "2016-07-02 00:00:00")
+
+            FacilityHandler(self.conf_path)
+            queries = len(FakeParser.queries)
+            fh = FacilityHandler(self.conf_path, dep_filter="C")
+            self.assertEqual(fh.facility.d_graph.get_flows(), {("B.centroid", "C.centroid"): 10})
+            self.assertEqual(len(FakeParser.queries), queries)  # answered from the cube
+
+            # legacy main item template
+            self.write_conf(mi_mp_query="SELECT id, src, dst, created, qty, mi FROM mp WHERE mi = '%s'",
+                            mp_filter_columns={"date": "created"})
+            FacilityHandler.reset_transport_cube()
+            for main_item in main_items:
+                fh = FacilityHandler(self.conf_path, mi_filter=main_item)
+                self.assertEqual(sum(fh.facility.d_graph.get_flows().values()), 5)
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM mp").fetchone(), (20,))
+
+    def test_restore_and_fold(self):
+        """ Test that a restored facility folds in records newer than its high-water mark only """
+
+        FacilityHandler(self.conf_path, incremental=True)
+        FacilityHandler.reset_transport_cube()  # as if a process was restarted
+
+        records = dict(FakeParser.records)
+        records[21] = ["A", "C", datetime(2016, 7, 10), 4]  # same date as the high-water mark
+        records[22] = ["C", "A", datetime(2016, 7, 12), 1]
+        records[23] = ["C", "X", datetime(2016, 7, 13), 1]  # unknown department
+        FakeParser.records = records
+        fh = FacilityHandler(self.conf_path, incremental=True)
+        self.assertTrue(fh.updated)
+        self.assertEqual(fh.facility.d_graph.get_flows(), {("A.centroid", "B.centroid"): 10,
+                                                           ("A.centroid", "C.centroid"): 4,
+                                                           ("B.centroid", "C.centroid"): 10,
+                                                           ("C.centroid", "A.centroid"): 1})
+        self.assertEqual(fh.high_water_mark, ["2016-07-13 00:00:00", ["23"]])
+        self.assertEqual((fh.date_from, fh.date_to), ("2016-07-01 00:00:00", "2016-07-13 00:00:00"))
+        self.assertIsNone(FacilityHandler.transport_cube)  # nothing to extend
+
+        fh = FacilityHandler(self.conf_path, incremental=True)
+        self.assertFalse(fh.updated)
+        self.assertEqual(len(fh.facility.d_graph.get_flows()), 4)
+        self.assertEqual(fh.high_water_mark, ["2016-07-13 00:00:00", ["23"]])
@@ -0,0 +1,84 @@
+import os
+import tempfile
+import unittest
+from app.core.facility_snapshot import *
+
+
+class TestFacilitySnapshot(unittest.TestCase):
+    """ Unit tests for app/core/facility_snapshot.py module """
+
+    def setUp(self):
+        self.facility = Facility(100, 100)
+        dep_a = Department("A", Point2D(0, 0), Point2D(10, 0), Point2D(10, 10), Point2D(0, 10))
+        dep_a.add_vertices({"gate": Point2D(9, 1)})
+        self.facility.add_department(dep_a)
+        self.facility.add_department(Department("B", Point2D(20, 20), Point2D(30, 20), Point2D(30, 30)))
+        self.facility.add_department(Department("C", Point2D(50, 50), Point2D(60, 50), Point2D(60, 60)))
+        records = [("A.centroid", "B.centroid", 10), ("B.centroid", "C.centroid", 7), ("A.centroid", "B.centroid", 5),
+                   ("A.gate", "C.centroid", 1)]
+        created, _ = self.facility.add_transp_records(records)
+        created[("A.centroid", "B.centroid")].add_info("distance", 12.5)
+        created[("A.centroid", "B.centroid")].add_info("time", 3)
+        created[("B.centroid", "C.centroid")].add_info("time", 4)
+        created[("A.gate", "C.centroid")].add_info("route", ["A", "C"])
+        created[("A.gate", "C.centroid")].add_info("time", None)
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        os.remove(self.path)
+
+    def test_round_trip(self):
+        """ Test that a facility restored from a snapshot file equals to the original one """
+
+        FacilitySnapshot.from_facility(self.facility).dump(self.path)
+        snapshot = FacilitySnapshot.load(self.path)
+        self.assertIsInstance(snapshot.arrays["edge_src"], np.memmap)
+        facility = snapshot.to_facility()
+
+        self.assertEqual((facility.max_x, facility.max_y), (100.0, 100.0))
+        self.assertEqual([dep.label for dep in facility.get_departments()], ["A", "B", "C"])
+        self.assertEqual([p.get_coords_list() for p in facility.get_department_by_label("B").point2d_vector],
+                         [[20.0, 20.0], [30.0, 20.0], [30.0, 30.0]])
+        self.assertEqual(sorted(facility.get_department_by_label("A").vertices), ["centroid", "gate"])
+        self.assertEqual(list(facility.d_graph.get_edges()), list(self.facility.d_graph.get_edges()))
+
+        graph = facility.d_graph
+        edge = graph.edge_mapper[graph.label_mapper["A.centroid"]][graph.label_mapper["B.centroid"]]
+        self.assertEqual((edge.weight, edge.increment_count, edge.info_dict), (15, 2, {"distance": 12.5, "time": 3}))
+        self.assertIsInstance(edge.weight, int)
+        edge = graph.edge_mapper[graph.label_mapper["B.centroid"]][graph.label_mapper["C.centroid"]]
+        self.assertEqual(edge.info_dict, {"time": 4})
+        edge = graph.edge_mapper[graph.label_mapper["A.gate"]][graph.label_mapper["C.centroid"]]
+        self.assertEqual(edge.info_dict, {"route": ["A", "C"], "time": None})
+
+    def test_deferred_edges(self):
+        """ Test that analytics of a restored facility are served without building edge objects """
+
+        FacilitySnapshot.from_facility(self.facility).dump(self.path)
+        facility = FacilitySnapshot.load(self.path).to_facility()
+        self.assertIsNotNone(facility.d_graph.get_deferred_edge_columns())
+
+        self.assertEqual(facility.get_flow_matrix().tolist(), self.facility.get_flow_matrix().tolist())
+        self.assertEqual(list(facility.d_graph.freeze().get_edges()), list(self.facility.d_graph.freeze().get_edges()))
+        self.assertEqual(facility.get_transport_cost(), self.facility.get_transport_cost())
+        self.assertIsNotNone(facility.d_graph.get_deferred_edge_columns())
+
+        # edge objects are created once records are added
+        facility.add_aggregated_transp_records({("B.centroid", "A.centroid"): (2, 1)})
+        self.assertIsNone(facility.d_graph.get_deferred_edge_columns())
+        self.facility.add_aggregated_transp_records({("B.centroid", "A.centroid"): (2, 1)})
+        self.assertEqual(list(facility.d_graph.get_edges()), list(self.facility.d_graph.get_edges()))
+
+    def test_incompatible(self):
+        """ Test that foreign files and other schema versions are detected """
+
+        with open(self.path, 'wb') as f:
+            f.write(b"\x80\x04pickle")
+        self.assertRaises(IncompatibleSnapshot, FacilitySnapshot.load, self.path)
+
+        FacilitySnapshot.from_facility(self.facility).dump(self.path)
+        with open(self.path, 'r+b') as f:
+            f.seek(8)
+            f.write(struct.pack("<I", FacilitySnapshot.SCHEMA_VERSION + 1))
+        self.assertRaises(IncompatibleSnapshot, FacilitySnapshot.load, self.path)
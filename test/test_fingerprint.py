@@ -0,0 +1,72 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+from contextlib import closing
+from app.core.fingerprint import SourceFingerprinter
+
+
+class TestSourceFingerprinter(unittest.TestCase):
+    """ Unit tests for app/core/fingerprint.py module """
+
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+        self.layout_path = os.path.join(self.base_dir, "factory_layout.json")
+        self.db_path = os.path.join(self.base_dir, "mp.db")
+        with open(self.layout_path, 'w') as f:
+            f.write('{"departments": [], "distances": {}}')
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            conn.execute("CREATE TABLE mp (created TEXT, qty INTEGER)")
+            conn.execute("INSERT INTO mp VALUES ('2016-07-13 18:00:00', 10)")
+            conn.commit()
+        self.conf = {"facility_source_path": self.layout_path,
+                     "mp_fingerprint_query": "SELECT MAX(created), COUNT(*) FROM mp"}
+
+    def tearDown(self):
+        shutil.rmtree(self.base_dir)
+
+    def get_fingerprint(self, conf=None):
+        return SourceFingerprinter(conf or self.conf, lambda: closing(sqlite3.connect(self.db_path))).get_fingerprint()
+
+    def test_fingerprint(self):
+        """ Test that fingerprint changes only when sources change """
+
+        fingerprint = self.get_fingerprint()
+        self.assertEqual(fingerprint["db"], ["2016-07-13 18:00:00", 1])
+        self.assertEqual(self.get_fingerprint(), fingerprint)
+
+        # layout file
+        with open(self.layout_path, 'w') as f:
+            f.write('{"departments": [], "distances": {"A": {}}}')
+        changed = self.get_fingerprint()
+        self.assertNotEqual(changed["layout"], fingerprint["layout"])
+        self.assertEqual(changed["config"], fingerprint["config"])
+
+        # configuration
+        self.assertNotEqual(self.get_fingerprint(dict(self.conf, mp_query="SELECT 1"))["config"], changed["config"])
+
+        # DB
+        with closing(sqlite3.connect(self.db_path)) as conn:
+            conn.execute("INSERT INTO mp VALUES ('2016-07-14 08:00:00', 5)")
+            conn.commit()
+        self.assertEqual(self.get_fingerprint()["db"], ["2016-07-14 08:00:00", 2])
+
+        # DB state is unknown without a query or with an inaccessible DB
+        conf = dict(self.conf)
+        del conf["mp_fingerprint_query"]
+        self.assertEqual(self.get_fingerprint(conf)["db"], None)
+        self.assertEqual(self.get_fingerprint(dict(self.conf, mp_fingerprint_query="SELECT x FROM y"))["db"], None)
+
+    def test_is_db_appended(self):
+        """ Test detection of append-only DB changes """
+
+        old = ["2016-07-13 18:00:00", 10]
+        self.assertTrue(SourceFingerprinter.is_db_appended(old, old))
+        self.assertTrue(SourceFingerprinter.is_db_appended(old, ["2016-07-14 08:00:00", 12]))
+        self.assertFalse(SourceFingerprinter.is_db_appended(old, ["2016-07-14 08:00:00", 9]))
+        self.assertFalse(SourceFingerprinter.is_db_appended(old, ["2016-07-12 08:00:00", 10]))
+        self.assertFalse(SourceFingerprinter.is_db_appended(old, ["2016-07-14 08:00:00", 10]))  # deleted + inserted
+        # known limitation: a backdated insert looks like an append
+        self.assertTrue(SourceFingerprinter.is_db_appended(old, ["2016-07-13 18:00:00", 11]))
+        self.assertFalse(SourceFingerprinter.is_db_appended(old, None))
@@ -141,3 +141,220 @@ class TestGraph(unittest.TestCase):
         graph.add_vertex("dums!")
         graph.add_vertex("shmyak!")
         self.assertEqual(graph.get_vertices_count(), 3)
+
+    def test_find_vertex_node_by_label(self):
+        """ Test label index consistency on vertex insertion and relabeling """
+
+        graph = Graph(coordinates=True)
+        node_a = graph.add_vertex("A", 0, 10)
+        node_b = graph.add_vertex("B", 0, 5)
+        self.assertTrue(graph.find_vertex_node_by_label("A") is node_a)
+        self.assertTrue(graph.find_vertex_node_by_label("B") is node_b)
+        self.assertEqual(graph.find_vertex_node_by_label("C"), None)
+        self.assertTrue(graph.find_vertex_node_by_coordinates(0, 5) is node_b)
+
+        node_a.set_label("C")
+        self.assertEqual(graph.find_vertex_node_by_label("A"), None)
+        self.assertTrue(graph.find_vertex_node_by_label("C") is node_a)
+        graph.add_edge("C", "B")
+        self.assertEqual(graph.get_edge_weight("C", "B"), 5)
+
+    def test_edge_aggregation(self):
+        """ Test weight aggregation of a directed graph through the adjacency index """
+
+        graph = Graph(directed=True, coordinates=True, explicit_weight=True, aggregate_weight=True)
+        graph.add_vertex("A", 0, 0)
+        graph.add_vertex("B", 0, 5)
+        graph.add_vertex("C", 5, 5)
+        for _ in range(10):
+            graph.add_edge("A", "B", 3)
+        graph.add_edge("A", "C", 1)
+        e_node = graph.add_edge("B", "A", 2)
+        self.assertEqual(e_node.weight, 2)
+        self.assertEqual(graph.get_edge_weight("A", "B"), 30)
+        self.assertEqual(list(graph.get_edges()), [["A", "B", 30, 10, {}], ["A", "C", 1, 1, {}],
+                                                   ["B", "A", 2, 1, {}]])
+        self.assertEqual(len(graph.mapper[graph.find_vertex_node_by_label("A")]), 2)
+
+    def test_add_edges_bulk(self):
+        """ Test bulk edge insertion of a graph without explicit weights """
+
+        graph = Graph(coordinates=True, aggregate_weight=True)
+        graph.add_vertex("A", 0, 0)
+        graph.add_vertex("B", 3, 4)
+        created, self_edges_weight = graph.add_edges_bulk([("A", "B", None), ("B", "A", None), ("A", "A", None)])
+        self.assertEqual(self_edges_weight, 0)
+        self.assertEqual([edge_node.weight for edge_node in created[("A", "B")]], [5, 5])
+        self.assertEqual(graph.get_edge_weight("A", "B"), 5)
+        self.assertEqual(created[("A", "B")][0].increment_count, 2)
+
+    def test_floyd_warshall_shortest_paths(self):
+        """ Test all pairs shortest paths and path recovery with multi-character labels """
+
+        graph = Graph(directed=True, coordinates=True)
+        graph.add_vertex("DEP1.centroid", 0, 0)
+        graph.add_vertex("DEP2.centroid", 0, 10)
+        graph.add_vertex("DEP3.centroid", 10, 10)
+        graph.add_vertex("DEP4.centroid", 10, 0)
+        graph.add_edge("DEP1.centroid", "DEP2.centroid")
+        graph.add_edge("DEP2.centroid", "DEP3.centroid")
+        graph.add_edge("DEP1.centroid", "DEP4.centroid")
+        graph.add_edge("DEP4.centroid", "DEP3.centroid")
+        e_node = graph.add_edge("DEP1.centroid", "DEP3.centroid")
+
+        dist, nxt = graph.floyd_warshall_shortest_paths()
+        self.assertEqual(dist[0][2], 1)
+        self.assertEqual(graph.get_shortest_path("DEP1.centroid", "DEP3.centroid", nxt),
+                         ["DEP1.centroid", "DEP3.centroid"])
+        self.assertEqual(graph.get_shortest_path("DEP3.centroid", "DEP1.centroid", nxt), [])
+
+        dist, nxt = graph.floyd_warshall_shortest_paths(weight_mode=WEIGHT_EUCLIDEAN)
+        self.assertAlmostEqual(dist[0][2], sqrt(200))
+        self.assertEqual(dist[0][1], 10)
+
+        # make a direct edge long so the path goes around
+        e_node.add_info("distance", 100)
+        dist, nxt = graph.floyd_warshall_shortest_paths(weight_mode=WEIGHT_DISTANCE)
+        self.assertEqual(dist[0][2], 20)
+        self.assertEqual(len(graph.get_shortest_path("DEP1.centroid", "DEP3.centroid", nxt)), 3)
+
+    def test_all_pairs_shortest_paths(self):
+        """ Test that Dijkstra and Floyd-Warshall engines agree on shortest paths """
+
+        graph = Graph(coordinates=True)
+        coords = {"A.c": (0, 0), "B.c": (0, 10), "C.c": (10, 10), "D.c": (10, 0), "E.c": (20, 5), "F.c": (30, 30)}
+        for label, (x, y) in coords.items():
+            graph.add_vertex(label, x, y)
+        for va_label, vb_label in [("A.c", "B.c"), ("B.c", "C.c"), ("C.c", "D.c"), ("D.c", "A.c"), ("C.c", "E.c"),
+                                   ("D.c", "E.c")]:
+            graph.add_edge(va_label, vb_label)
+
+        fw_dist, fw_nxt = graph.all_pairs_shortest_paths(WEIGHT_EUCLIDEAN, APSP_FLOYD_WARSHALL)
+        dj_dist, dj_nxt = graph.all_pairs_shortest_paths(WEIGHT_EUCLIDEAN, APSP_DIJKSTRA)
+        self.assertTrue(np.allclose(fw_dist, dj_dist))
+        self.assertEqual(graph.get_shortest_path("A.c", "E.c", dj_nxt), ["A.c", "D.c", "E.c"])
+        self.assertEqual(graph.get_shortest_path("A.c", "F.c", dj_nxt), [])
+        self.assertEqual(sorted(graph.calculate_betweenness_of_vertices(dj_nxt)), sorted(coords))
+
+        dist, nxt = graph.dijkstra_shortest_paths("B.c", WEIGHT_EUCLIDEAN)
+        self.assertTrue(np.allclose(dist, fw_dist[1]))
+        self.assertRaises(UnknownShortestPathsStrategy, graph.all_pairs_shortest_paths, strategy="magic")
+
+    def test_get_shortest_path_astar(self):
+        """ Test A* shortest path search """
+
+        graph = Graph(coordinates=True)
+        coords = {"A.c": (0, 0), "B.c": (0, 10), "C.c": (10, 10), "D.c": (10, 0), "E.c": (20, 5), "F.c": (30, 30)}
+        for label, (x, y) in coords.items():
+            graph.add_vertex(label, x, y)
+        for va_label, vb_label in [("A.c", "B.c"), ("B.c", "C.c"), ("C.c", "D.c"), ("D.c", "A.c"), ("C.c", "E.c"),
+                                   ("D.c", "E.c")]:
+            graph.add_edge(va_label, vb_label)
+
+        self.assertEqual(graph.get_shortest_path_astar("A.c", "E.c"), ["A.c", "D.c", "E.c"])
+        self.assertEqual(graph.get_shortest_path_astar("B.c", "E.c"), ["B.c", "C.c", "E.c"])
+        self.assertEqual(graph.get_shortest_path_astar("A.c", "A.c", trace_area=True), (["A.c"], 1))
+        self.assertEqual(graph.get_shortest_path_astar("A.c", "F.c"), None)
+        path, visited = graph.get_shortest_path_astar("A.c", "E.c", trace_area=True)
+        self.assertTrue(3 <= visited <= 5)
+
+        # coordinates cache must be refreshed on new vertices
+        graph.add_vertex("G.c", 20, 0)
+        graph.add_edge("A.c", "G.c")
+        graph.add_edge("G.c", "E.c")
+        self.assertEqual(graph.get_shortest_path_astar("G.c", "A.c"), ["G.c", "A.c"])
+
+    def test_calculate_brandes_betweenness(self):
+        """ Test Brandes betweenness centrality with and without pair weights """
+
+        graph = Graph(directed=True, coordinates=True)
+        graph.add_vertex("A", 0, 0)
+        graph.add_vertex("B", 5, 5)
+        graph.add_vertex("C", 5, -5)
+        graph.add_vertex("D", 10, 0)
+        graph.add_vertex("E", 20, 0)
+        for va_label, vb_label in [("A", "B"), ("A", "C"), ("B", "D"), ("C", "D"), ("D", "E")]:
+            graph.add_edge(va_label, vb_label)
+
+        # shortest paths from A to D and E are split between B and C
+        betweenness = graph.calculate_brandes_betweenness()
+        self.assertEqual(betweenness, {"A": 0, "B": 1, "C": 1, "D": 3, "E": 0})
+        self.assertEqual(graph.calculate_brandes_betweenness(WEIGHT_EUCLIDEAN), betweenness)
+
+        betweenness = graph.calculate_brandes_betweenness(pair_weights={("A", "D"): 10, ("B", "E"): 4})
+        self.assertEqual(betweenness, {"A": 0, "B": 5, "C": 5, "D": 4, "E": 0})
+
+        # undirected path graph
+        graph = Graph()
+        for label in ["A", "B", "C"]:
+            graph.add_vertex(label)
+        graph.add_edge("A", "B")
+        graph.add_edge("B", "C")
+        self.assertEqual(graph.calculate_brandes_betweenness(), {"A": 0, "B": 1, "C": 0})
+        self.assertEqual(graph.calculate_brandes_betweenness(normalized=True), {"A": 0, "B": 1, "C": 0})
+
+    def test_reachability(self):
+        """ Test transitive closure, strongly connected components and k-hop reachability """
+
+        graph = Graph(directed=True)
+        for label in ["A", "B", "C", "D", "E"]:
+            graph.add_vertex(label)
+        for va_label, vb_label in [("A", "B"), ("B", "C"), ("C", "A"), ("C", "D"), ("D", "E")]:
+            graph.add_edge(va_label, vb_label)
+
+        components, comp_of = graph.get_strongly_connected_components()
+        self.assertEqual(sorted(sorted(c) for c in components), [[0, 1, 2], [3], [4]])
+        self.assertEqual(components[0], [4])  # sink component comes first
+        self.assertEqual(comp_of[0], comp_of[2])
+
+        reach = graph.build_reachability_matrix()
+        closure = graph.build_transitive_closure(graph.build_adjacency_matrix())
+        self.assertTrue((reach == (closure > 0)).all())
+        self.assertTrue(graph.is_reachable("A", "E"))
+        self.assertTrue(graph.is_reachable("A", "A"))
+        self.assertFalse(graph.is_reachable("E", "A"))
+        self.assertFalse(graph.is_reachable("D", "D"))
+        self.assertEqual(graph.get_reachable_labels("D"), ["E"])
+
+        self.assertEqual(graph.get_reachable_labels("A", max_hops=1), ["B"])
+        self.assertEqual(graph.get_reachable_labels("A", max_hops=3), ["A", "B", "C", "D"])
+        self.assertEqual(graph.get_reachable_labels("A", max_hops=2), ["B", "C"])
+        self.assertRaises(BadHopsCount, graph.build_k_hop_reachability_matrix, 0)
+        self.assertRaises(BadHopsCount, graph.get_reachable_labels, "A", max_hops=-1)
+        self.assertRaises(ValueError, graph.build_k_hop_reachability_matrix, 1.5)
+
+        # cached results must be dropped on graph changes
+        graph.add_edge("E", "A")
+        self.assertTrue(graph.is_reachable("E", "D"))
+        self.assertEqual(graph.get_reachable_labels("E", max_hops=2), ["A", "B"])
+
+    def test_freeze(self):
+        """ Test CSR snapshot contents and its invalidation on graph changes """
+
+        graph = Graph(directed=True, coordinates=True, explicit_weight=True, aggregate_weight=True)
+        graph.add_vertex("B", 0, 10)
+        graph.add_vertex("A", 0, 0)
+        graph.add_vertex("C", 10, 0)
+        graph.add_edge("A", "B", 3)
+        graph.add_edge("A", "C", 4)
+        graph.add_edge("C", "B", 5)
+
+        snapshot = graph.freeze()
+        self.assertTrue(graph.freeze() is snapshot)
+        self.assertEqual(snapshot.labels, ["A", "B", "C"])
+        self.assertEqual(snapshot.indptr.tolist(), [0, 2, 2, 3])
+        self.assertEqual(snapshot.indices.tolist(), [1, 2, 1])
+        self.assertEqual(snapshot.weights.tolist(), [3, 4, 5])
+        self.assertEqual(snapshot.get_costs(WEIGHT_EUCLIDEAN).tolist(), [10, 10, sqrt(200)])
+        self.assertEqual(snapshot.get_involved_vertices_count(), 2)
+        self.assertEqual(sorted(snapshot.get_edges()), sorted(graph.get_edges()))
+        self.assertTrue(all(isinstance(edge[2], int) for edge in snapshot.get_edges()))
+        self.assertRaises(ValueError, snapshot.weights.__setitem__, 0, 1)
+
+        # aggregation and edge info changes must drop the snapshot
+        graph.add_edge("A", "B", 3)
+        snapshot = graph.freeze()
+        self.assertEqual(snapshot.weights.tolist(), [6, 4, 5])
+        self.assertEqual(snapshot.increment_counts.tolist(), [2, 1, 1])
+        graph.add_edge("C", "B", 1).add_info("distance", 42)
+        self.assertEqual(graph.freeze().get_costs(WEIGHT_DISTANCE).tolist(), [10, 10, 42])
@@ -0,0 +1,98 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from app.core.json_file_cache import JSONFileCache
+
+
+class TestJSONFileCache(unittest.TestCase):
+    """ Unit tests for app/core/json_file_cache.py module """
+
+    def setUp(self):
+        self.base_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.base_dir)
+
+    def test_put_get(self):
+        """ Test that every filter set has its own cache entry """
+
+        cache = JSONFileCache(os.path.join(self.base_dir, "viz"))
+        key_all = [None, None, None]
+        key_mi = [None, "MI1", None]
+        self.assertEqual(cache.get(key_all), None)
+        cache.put(key_all, '{"edges": []}')
+        cache.put(key_mi, '{"edges": [1]}')
+        self.assertEqual(cache.get(key_all), b'{"edges": []}')
+        self.assertEqual(cache.get(key_mi), b'{"edges": [1]}')
+        self.assertEqual(cache.read_manifest()[cache.get_file_name(key_mi)]["size"], 14)
+
+        cache.invalidate(key_mi)
+        self.assertEqual(cache.get(key_mi), None)
+        cache.invalidate()
+        self.assertEqual(cache.get(key_all), None)
+        self.assertEqual(cache.read_manifest(), {})
+
+    def test_fingerprint(self):
+        """ Test that entries built out of other sources are not picked up """
+
+        cache = JSONFileCache(os.path.join(self.base_dir, "viz"))
+        key = [None, None, None]
+        fingerprint = {"layout": "a", "config": "b", "db": ["2016-07-13 18:00:00", 10]}
+        cache.put(key, '{"edges": []}', fingerprint)
+        self.assertEqual(cache.get(key, fingerprint), b'{"edges": []}')
+        self.assertEqual(cache.get(key, dict(fingerprint, db=["2016-07-13 18:00:00", 11])), None)
+        self.assertEqual(cache.get(key), b'{"edges": []}')
+
+    def test_eviction(self):
+        """ Test that the oldest entries are evicted when cache exceeds its size """
+
+        cache = JSONFileCache(self.base_dir, max_bytes=25)
+        for i in range(3):
+            cache.put([i], "x" * 10)
+        self.assertEqual(cache.get([0]), None)
+        self.assertEqual(cache.get([1]), b"x" * 10)
+        self.assertEqual(cache.get([2]), b"x" * 10)
+        self.assertEqual(sorted(entry["key"] for entry in cache.read_manifest().values()), [[1], [2]])
+
+    def test_concurrent_writes(self):
+        """ Test that concurrent writers leave complete entries and a consistent manifest """
+
+        # every writer has its own instance (as every request does)
+        threads = [threading.Thread(target=JSONFileCache(self.base_dir).put,
+                                    args=([i % 4], chr(ord("a") + i) * 1000, chr(ord("a") + i))) for i in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        cache = JSONFileCache(self.base_dir)
+        for i in range(4):
+            data = cache.get([i])
+            self.assertEqual(len(set(data)), 1)
+            self.assertEqual(cache.get([i], fingerprint=chr(data[0])), data)  # manifest describes the file on disk
+        self.assertEqual(len(cache.read_manifest()), 4)
+        self.assertFalse([f for f in os.listdir(self.base_dir) if f.startswith(".tmp_")])
+
+    def test_concurrent_reads(self):
+        """ Test that readers never get a file that doesn't match its manifest entry """
+
+        letters = "abcdefgh"
+        mismatches = []
+
+        def write():
+            for i in range(40):
+                JSONFileCache(self.base_dir).put([0], letters[i % len(letters)] * 1000, letters[i % len(letters)])
+
+        def read():
+            for i in range(200):
+                data = JSONFileCache(self.base_dir).get([0], fingerprint=letters[i % len(letters)])
+                if data is not None and chr(data[0]) != letters[i % len(letters)]:
+                    mismatches.append(data[:1])
+
+        threads = [threading.Thread(target=write)] + [threading.Thread(target=read) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(mismatches, [])
@@ -0,0 +1,88 @@
+import unittest
+from itertools import permutations
+from app.core.layout_optimizer import *
+from app.dstruct.facility import *
+from app.dstruct.department import *
+
+
+class TestLayoutOptimizer(unittest.TestCase):
+    @staticmethod
+    def get_problem(n, seed):
+        """ Random asymmetric flow and distance matrices """
+
+        rnd = np.random.RandomState(seed)
+        flow = rnd.randint(0, 10, (n, n))
+        distance = rnd.randint(1, 10, (n, n))
+        np.fill_diagonal(distance, 0)
+        return flow, distance
+
+    def test_delta_matrix(self):
+        """ Test incremental swap deltas against full cost recalculations """
+
+        opt = LayoutOptimizer(*self.get_problem(7, 1), seed=1)
+        for r, s in [(0, 1), (2, 5), (6, 3), (1, 4)]:
+            delta_mtx = opt.get_delta_matrix()
+            for a in range(opt.size):
+                for b in range(opt.size):
+                    swapped = opt.assignment.copy()
+                    swapped[[a, b]] = swapped[[b, a]]
+                    expected = opt.get_cost(swapped) - opt.cost
+                    self.assertAlmostEqual(delta_mtx[a, b], expected)
+                    self.assertAlmostEqual(opt.get_swap_delta(a, b), expected)
+                    self.assertAlmostEqual(opt.get_cached_swap_delta(a, b), expected)
+            opt.swap(r, s)
+            self.assertAlmostEqual(opt.cost, opt.get_cost(opt.assignment))
+
+    def test_search(self):
+        """ Test that both searches reach an optimum of a small instance """
+
+        flow, distance = self.get_problem(7, 2)
+        opt = LayoutOptimizer(flow, distance, seed=3)
+        optimum = min(opt.get_cost(p) for p in permutations(range(7)))
+
+        assignment, cost = opt.simulated_annealing(20000)
+        self.assertAlmostEqual(cost, optimum)
+        self.assertAlmostEqual(opt.get_cost(assignment), cost)
+
+        opt.set_assignment(np.arange(7))
+        assignment, cost = opt.tabu_search(200)
+        self.assertAlmostEqual(cost, optimum)
+        self.assertEqual(sorted(assignment.tolist()), list(range(7)))
+
+        checks = []
+        opt.set_assignment(np.arange(7))
+        swaps_evaluated = opt.swaps_evaluated
+        opt.tabu_search(200, stop=lambda: checks.append(1) or len(checks) > 3, check_interval=5)
+        self.assertEqual(len(checks), 4)
+        self.assertEqual(opt.swaps_evaluated - swaps_evaluated, 15 * 21)  # stopped before the 16th iteration
+
+    def test_bad_problem(self):
+        """ Test rejection of malformed matrices """
+
+        self.assertRaises(BadLayoutProblem, LayoutOptimizer, np.zeros((3, 2)), np.zeros((3, 3)))
+        self.assertRaises(BadLayoutProblem, LayoutOptimizer, np.zeros((3, 3)), np.zeros((2, 2)))
+
+        opt = LayoutOptimizer(np.ones((2, 2)), np.ones((4, 4)))  # dummy departments fill up extra slots
+        self.assertEqual(opt.size, 4)
+        self.assertEqual(opt.flow[2:].sum(), 0)
+
+    def test_optimize_layout(self):
+        """ Test layout optimisation of a facility """
+
+        fac = Facility(100, 100)
+        fac.add_department(Department("Dep 1", Point2D(0, 0), Point2D(2, 0), Point2D(2, 2), Point2D(0, 2)))
+        fac.add_department(Department("Dep 2", Point2D(2, 2), Point2D(4, 2), Point2D(4, 4), Point2D(2, 4)))
+        fac.add_department(Department("Dep 3", Point2D(90, 90), Point2D(92, 90), Point2D(92, 92), Point2D(90, 92)))
+        fac.add_transp_records([("Dep 1.centroid", "Dep 3.centroid", 10), ("Dep 2.centroid", "Dep 1.centroid", 1)])
+
+        self.assertEqual(fac.get_flow_matrix().tolist(), [[0, 0, 10], [1, 0, 0], [0, 0, 0]])
+
+        layout, cost, current_cost = optimize_layout(fac, annealing_iterations=1000, tabu_iterations=10, seed=0)
+        self.assertEqual(sorted(layout.values()), ["Dep 1", "Dep 2", "Dep 3"])
+        self.assertIn(layout["Dep 1"], ["Dep 1", "Dep 2"])
+        self.assertEqual(layout["Dep 3"], "Dep 2" if layout["Dep 1"] == "Dep 1" else "Dep 1")
+        self.assertLess(cost, current_cost)
+
+
+if __name__ == '__main__':
+    unittest.main()
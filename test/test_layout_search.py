@@ -0,0 +1,43 @@
+import unittest
+from itertools import permutations
+from app.core.layout_search import *
+from test import test_layout_optimizer
+
+
+class TestLayoutSearch(unittest.TestCase):
+    get_problem = staticmethod(test_layout_optimizer.TestLayoutOptimizer.get_problem)
+
+    def test_search_layout(self):
+        """ Test that parallel restarts reach an optimum reproducibly """
+
+        flow, distance = self.get_problem(7, 4)
+        optimum = min(LayoutOptimizer(flow, distance).get_cost(p) for p in permutations(range(7)))
+
+        assignment, cost, results = search_layout(flow, distance, restarts=4, annealing_iterations=5000,
+                                                  tabu_iterations=50, seed=7, max_workers=2, check_interval=1000)
+        self.assertAlmostEqual(cost, optimum)
+        self.assertAlmostEqual(LayoutOptimizer(flow, distance).get_cost(assignment), cost)
+        self.assertEqual(len(results), 4)
+        self.assertEqual(len(set(result["seed"] for result in results)), 4)
+        self.assertTrue(all(result["swaps_evaluated"] > 0 for result in results))
+
+        # the same seed gives the same restarts regardless of the amount of workers
+        _, _, same_results = search_layout(flow, distance, restarts=4, annealing_iterations=5000,
+                                           tabu_iterations=50, seed=7, max_workers=1, check_interval=1000)
+        self.assertEqual(results, same_results)
+
+    def test_early_stop(self):
+        """ Test stopping at a target cost """
+
+        flow, distance = self.get_problem(7, 5)
+        assignment, cost, results = search_layout(flow, distance, restarts=6, annealing_iterations=10 ** 6,
+                                                  seed=1, max_workers=1, target_cost=np.inf, check_interval=100)
+        self.assertIsNotNone(assignment)
+        self.assertTrue(all(result["swaps_evaluated"] <= 100 for result in results))
+        self.assertTrue(any(result["cost"] is None for result in results))  # restarts skipped after a stop
+
+        self.assertRaises(BadLayoutProblem, search_layout, np.zeros((3, 3)), np.zeros((2, 2)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import sqlite3
+import unittest
+from contextlib import closing
+from datetime import datetime
+from app.core.mp_query import *
+
+
+class TestMPQueryBuilder(unittest.TestCase):
+    """ Unit tests for app/core/mp_query.py module """
+
+    columns = {"date": "created", "src_dep": "src", "dst_dep": "dst", "main_item": "item"}
+
+    def test_build_literal(self):
+        """ Test query composition with escaped literals """
+
+        builder = MPQueryBuilder("SELECT * FROM mp WHERE qty > 0", self.columns)
+        query = builder.build_literal(date_from=datetime(2016, 7, 13, 18, 0, 1), dep_filter="O'Hara?")
+        self.assertEqual(query, "SELECT * FROM (SELECT * FROM mp WHERE qty > 0) AS mp WHERE "
+                                "created >= '2016-07-13 18:00:01' AND (src = 'O''Hara?' OR dst = 'O''Hara?')")
+
+        self.assertEqual(builder.build_literal(), "SELECT * FROM mp WHERE qty > 0")
+        query = builder.build_literal(datetime(2016, 7, 13), datetime(2016, 7, 14, 23, 59, 59), "MI1", "A")
+        self.assertEqual(query, "SELECT * FROM (SELECT * FROM mp WHERE qty > 0) AS mp WHERE "
+                                "created >= '2016-07-13 00:00:00' AND created <= '2016-07-14 23:59:59' "
+                                "AND item = 'MI1' AND (src = 'A' OR dst = 'A')")
+
+        self.assertRaises(FilterColumnNotConfigured, MPQueryBuilder("SELECT * FROM mp", {}).build_literal, None, None,
+                          "MI1")
+
+    def test_to_literal(self):
+        """ Test rendering of unusual values as SQL literals """
+
+        self.assertEqual(MPQueryBuilder.to_literal("O'Hara's"), "'O''Hara''s'")
+        self.assertEqual(MPQueryBuilder.to_literal("''"), "''''''")
+        self.assertEqual(MPQueryBuilder.to_literal("50%_x\\"), "'50%_x\\'")
+        self.assertEqual(MPQueryBuilder.to_literal("x'; DROP TABLE mp; --"), "'x''; DROP TABLE mp; --'")
+        self.assertEqual(MPQueryBuilder.to_literal("Ünïcode €"), "'Ünïcode €'")
+        self.assertEqual(MPQueryBuilder.to_literal(datetime(2016, 7, 13)), "'2016-07-13 00:00:00'")
+        self.assertEqual(MPQueryBuilder.to_literal(42), "42")
+        self.assertEqual(MPQueryBuilder.to_literal(True), "1")
+
+    def test_fill_template(self):
+        """ Test substitution into legacy query templates """
+
+        self.assertEqual(MPQueryBuilder.fill_template("SELECT * FROM mp WHERE item = '%s'", "O'Hara"),
+                         "SELECT * FROM mp WHERE item = 'O''Hara'")
+        self.assertEqual(MPQueryBuilder.fill_template("SELECT * FROM mp WHERE item = %s", "O'Hara"),
+                         "SELECT * FROM mp WHERE item = 'O''Hara'")
+        self.assertEqual(MPQueryBuilder.fill_template("SELECT * FROM mp WHERE item LIKE 'M%%' AND created > '%s'",
+                                                      datetime(2016, 7, 13)),
+                         "SELECT * FROM mp WHERE item LIKE 'M%' AND created > '2016-07-13 00:00:00'")
+
+    def test_escaping(self):
+        """ Test that unusual values match themselves only when queries are run """
+
+        items = ["O'Hara", "''", "50%_x\\", "x'; DROP TABLE mp; --", "x' OR '1'='1", "Ünïcode €", "a\nb"]
+        with closing(sqlite3.connect(":memory:")) as conn:
+            conn.execute("CREATE TABLE mp (item TEXT, src TEXT, dst TEXT, created TEXT, qty INTEGER)")
+            conn.executemany("INSERT INTO mp VALUES (?, 'A', ?, '2016-07-13 18:00:00', 1)",
+                             [(item, item) for item in items])
+            builder = MPQueryBuilder("SELECT * FROM mp", self.columns)
+            for item in items:
+                self.assertEqual(conn.execute(builder.build_literal(main_item=item)).fetchall(),
+                                 [(item, "A", item, "2016-07-13 18:00:00", 1)])
+                self.assertEqual(len(conn.execute(builder.build_literal(dep_filter=item)).fetchall()), 1)
+                self.assertEqual(conn.execute(MPQueryBuilder.fill_template(
+                    "SELECT item FROM mp WHERE item = '%s'", item)).fetchall(), [(item,)])
+            self.assertEqual(conn.execute("SELECT COUNT(*) FROM mp").fetchone(), (len(items),))
+
+    def test_has_columns(self):
+        """ Test filter column configuration checks """
+
+        builder = MPQueryBuilder("SELECT * FROM mp", {"date": "created", "src_dep": "src"})
+        self.assertTrue(builder.has_columns("date"))
+        self.assertFalse(builder.has_columns("src_dep", "dst_dep"))
@@ -0,0 +1,110 @@
+import unittest
+from datetime import datetime
+from app.core.transport_cube import TransportCube
+
+
+class TestTransportCube(unittest.TestCase):
+    """ Unit tests for app/core/transport_cube.py module """
+
+    records = [("A", "B", datetime(2016, 7, 13, 18, 0, 1), 10),
+               ("A", "B", datetime(2016, 7, 13, 19, 0, 0), 5),
+               ("A", "B", datetime(2016, 7, 14, 8, 0, 0), 1),
+               ("B", "C", datetime(2016, 7, 15, 8, 0, 0), 7),
+               ("C", "C", datetime(2016, 7, 15, 9, 0, 0), 3),
+               ("C", "X", datetime(2016, 7, 20, 9, 0, 0), 100),  # unknown department
+               ("X", "A", datetime(2016, 7, 1, 9, 0, 0), 100)]
+
+    def test_query(self):
+        """ Test filtered aggregation of transportation records """
+
+        cube = TransportCube(["A", "B", "C"])
+        cube.add_records(self.records)
+        self.assertTrue(cube.has_main_item(None))
+        self.assertFalse(cube.has_main_item("MI1"))
+
+        flows, self_edges_weight, lower, upper = cube.query()
+        self.assertEqual(flows, {("A", "B"): (16, 3), ("B", "C"): (7, 1)})
+        self.assertEqual(self_edges_weight, 3)
+        self.assertEqual(lower, datetime(2016, 7, 1, 9, 0, 0))
+        self.assertEqual(upper, datetime(2016, 7, 20, 9, 0, 0))
+
+        flows, self_edges_weight = cube.query(datetime(2016, 7, 14), datetime(2016, 7, 15, 23, 59, 59))[:2]
+        self.assertEqual(flows, {("A", "B"): (1, 1), ("B", "C"): (7, 1)})
+        self.assertEqual(self_edges_weight, 3)
+
+        flows, self_edges_weight = cube.query(dep_filter="A")[:2]
+        self.assertEqual(flows, {("A", "B"): (16, 3)})
+        self.assertEqual(self_edges_weight, 0)
+
+    def test_main_items(self):
+        """ Test that main item extracts are kept and replaced separately """
+
+        cube = TransportCube(["A", "B", "C"])
+        cube.add_records(self.records)
+        cube.add_records(self.records[:2], "MI1")
+        self.assertEqual(cube.query(main_item="MI1")[0], {("A", "B"): (15, 2)})
+        cube.add_records(self.records[3:4], "MI1")
+        self.assertEqual(cube.query(main_item="MI1")[0], {("B", "C"): (7, 1)})
+        self.assertEqual(cube.query()[0], {("A", "B"): (16, 3), ("B", "C"): (7, 1)})
+        self.assertEqual(cube.query(main_item="MI2"), [{}, 0, None, None])
+
+    def test_drop_main_items(self):
+        """ Test forgetting main item extracts """
+
+        cube = TransportCube(["A", "B", "C"])
+        cube.add_records(self.records[:2], "MI1")
+        cube.add_records(self.records)
+        cube.add_records(self.records[3:4], "MI2")
+        cube.drop_main_items(["MI1", "MI3"])
+        self.assertEqual(cube.main_items, [None, "MI2"])
+        self.assertFalse(cube.has_main_item("MI1"))
+        self.assertEqual(cube.query(main_item="MI2")[0], {("B", "C"): (7, 1)})
+        self.assertEqual(cube.query()[0], {("A", "B"): (16, 3), ("B", "C"): (7, 1)})
+
+    def test_append(self):
+        """ Test appending newer records to a loaded extract """
+
+        cube = TransportCube(["A", "B", "C"])
+        cube.add_records(self.records[:3])
+        cube.add_records([("A", "B", datetime(2016, 7, 14, 9, 0, 0), 4),
+                          ("B", "A", datetime(2016, 7, 21, 9, 0, 0), 2)], append=True)
+
+        flows, self_edges_weight, lower, upper = cube.query()
+        self.assertEqual(flows, {("A", "B"): (20, 4), ("B", "A"): (2, 1)})
+        self.assertEqual(upper, datetime(2016, 7, 21, 9, 0, 0))
+
+    def test_compact(self):
+        """ Test merging buckets of an extract loaded batch by batch """
+
+        cube = TransportCube(["A", "B", "C"])
+        cube.add_records([], None)
+        for rec in self.records:
+            cube.add_records([rec], append=True)
+        self.assertEqual(len(cube.days), len(self.records))
+        expected = cube.query()
+
+        cube.compact()
+        self.assertEqual(len(cube.days), 6)
+        self.assertEqual(cube.query(), expected)
+
+    def test_merge(self):
+        """ Test publishing extracts loaded into another cube """
+
+        cube = TransportCube(["A", "B", "C"])
+        cube.add_records(self.records)
+        cube.add_records(self.records[3:4], "MI2")
+
+        extract = TransportCube(["A", "B", "C"])
+        extract.add_records(self.records[:1], "MI1")
+        extract.add_records(self.records[4:5], "MI2")
+        cube.merge(extract)
+        self.assertEqual(cube.main_items, [None, "MI2", "MI1"])
+        self.assertEqual(cube.query(main_item="MI1")[0], {("A", "B"): (10, 1)})
+        self.assertEqual(cube.query(main_item="MI2")[:2], [{}, 3])  # replaced
+        self.assertEqual(cube.query()[0], {("A", "B"): (16, 3), ("B", "C"): (7, 1)})
+
+        newer = TransportCube(["A", "B", "C"])
+        newer.add_records([("B", "A", datetime(2016, 7, 21, 9, 0, 0), 2)])
+        cube.merge(newer, append=True)
+        self.assertEqual(cube.query()[0], {("A", "B"): (16, 3), ("B", "C"): (7, 1), ("B", "A"): (2, 1)})
+        self.assertEqual(cube.query(main_item="MI1")[0], {("A", "B"): (10, 1)})
@@ -0,0 +1,95 @@
+import unittest
+import threading
+import time
+from app.core.viz_cache import VizCache, SingleFlight
+
+
+class TestVizCache(unittest.TestCase):
+    """ Unit tests for app/core/viz_cache.py module """
+
+    def test_lru_eviction(self):
+        """ Test that the least recently used entry is evicted first """
+
+        cache = VizCache(max_size=2)
+        key_a = cache.make_key("2016-01-01 00:00:00", "2016-02-01 23:59:59")
+        key_b = cache.make_key(main_item="MI1")
+        key_c = cache.make_key(department="Dep 1")
+        cache.put(key_a, "a")
+        cache.put(key_b, "b")
+        self.assertEqual(cache.get(key_a), "a")  # key_b becomes the least recently used
+        cache.put(key_c, "c")
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.get(key_b), None)
+        self.assertEqual(cache.get(key_a), "a")
+        self.assertEqual(cache.get(key_c), "c")
+
+    def test_ttl_and_invalidation(self):
+        """ Test entries expiration and explicit invalidation """
+
+        now = [0]
+        cache = VizCache(ttl=10, timer=lambda: now[0])
+        cache.put(cache.make_key(), "all")
+        cache.put(cache.make_key(main_item="MI1"), "mi1")
+        now[0] = 5
+        self.assertEqual(cache.get(cache.make_key()), "all")
+        now[0] = 11
+        self.assertEqual(cache.get(cache.make_key()), None)
+
+        cache.put(cache.make_key(), "all")
+        cache.invalidate(cache.make_key())
+        self.assertEqual(cache.get(cache.make_key()), None)
+        cache.invalidate()
+        self.assertEqual(len(cache), 0)
+
+    def test_stale_entries(self):
+        """ Test serving expired entries with their age """
+
+        now = [0]
+        cache = VizCache(ttl=10, timer=lambda: now[0], stale_ttl=20)
+        cache.put(cache.make_key(), "all")
+        cache.put(cache.make_key(main_item="MI1"), "mi1", age=25)
+        now[0] = 15
+        self.assertEqual(cache.get(cache.make_key()), None)
+        self.assertEqual(cache.get_entry(cache.make_key()), ("all", 15, True))
+        self.assertEqual(cache.get_entry(cache.make_key(main_item="MI1")), None)
+        now[0] = 31
+        self.assertEqual(cache.get_entry(cache.make_key()), None)
+
+        # unverified entries (e.g. restored from a disk) are stale until they are put again
+        cache.put(cache.make_key(), "restored", age=5, unverified=True)
+        self.assertEqual(cache.get(cache.make_key()), None)
+        self.assertEqual(cache.get_entry(cache.make_key()), ("restored", 5, True))
+        cache.put(cache.make_key(), "rebuilt")
+        self.assertEqual(cache.get(cache.make_key()), "rebuilt")
+        self.assertEqual(cache.get_entry(cache.make_key()), ("rebuilt", 0, False))
+
+    def test_single_flight(self):
+        """ Test that concurrent jobs of the same key are coalesced """
+
+        release = threading.Event()
+        calls = []
+
+        def build(value):
+            calls.append(value)
+            release.wait(5)
+            return value
+
+        single_flight = SingleFlight()
+        future_1 = single_flight.submit("key", build, "a")
+        future_2 = single_flight.submit("key", build, "b")
+        self.assertIs(future_1, future_2)
+        self.assertTrue(single_flight.is_in_flight("key"))
+        release.set()
+        self.assertEqual(future_2.result(5), "a")
+        self.assertEqual(calls, ["a"])
+
+        self.assertEqual(single_flight.submit("key", build, "c").result(5), "c")
+
+        def fail():
+            raise ValueError("DB is gone")
+
+        with self.assertLogs("app.core.viz_cache", "ERROR") as logs:
+            self.assertRaises(ValueError, single_flight.submit("failing", fail).result, 5)
+            while single_flight.is_in_flight("failing"):  # a job is forgotten after it's logged
+                time.sleep(0.01)
+        self.assertIn("DB is gone", logs.output[0])